@@ -0,0 +1,65 @@
+"""Per-invoice render cost with and without the asset cache.
+
+Run from the repository root:
+    python -m benchmarks.bench_assets [--invoices N]
+"""
+import argparse
+import time
+import warnings
+
+from racunovodja.assets import registry
+from racunovodja.models import CSVModel
+from racunovodja.pdf import PDFModel
+
+
+SAMPLE = {
+    'Št. računa': '1',
+    'Naziv': 'Bedanec Podgorski',
+    'Naslov': 'Gozdna pot 12, 1234 Hosta',
+    'Davčna številka': 'SI12344123',
+    'Matična številka': '12121212',
+    'Opis storitve': 'Pašnja ovac',
+    'Datum izdaje': '05.04.2023',
+    'Datum opravljene storitve': '05.04.2023',
+    'Datum zapadlosti': '19.04.2023',
+    'Znesek': '123,45',
+    'Opomba': 'bedanec',
+    }
+
+assert set(SAMPLE) == set(CSVModel.fields)
+
+
+def render_many(count):
+    """Average seconds to render one invoice to memory"""
+    started = time.perf_counter()
+
+    for _ in range(count):
+        pdf = PDFModel(SAMPLE['Št. računa'])
+        pdf.render(SAMPLE)
+        pdf.output()
+
+    return (time.perf_counter() - started) / count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_assets')
+    parser.add_argument('--invoices', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    # Without the cache fpdf warns about the font being added on every page
+    warnings.simplefilter('ignore')
+
+    registry.enabled = False
+    before = render_many(args.invoices)
+
+    registry.enabled = True
+    registry.clear()
+    after = render_many(args.invoices)
+
+    print(f"brez predpomnilnika: {before * 1000:.2f} ms/račun")
+    print(f"s predpomnilnikom:   {after * 1000:.2f} ms/račun")
+    print(f"pohitritev:          {before / after:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
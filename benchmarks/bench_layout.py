@@ -0,0 +1,144 @@
+"""Compiled invoice layout against the original string building.
+
+Run from the repository root:
+    python -m benchmarks.bench_layout [--calls N]
+
+The original PDFModel.get_racun_string is kept below as the reference,
+and the benchmark checks that both produce identical text.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from racunovodja import settings as s
+from racunovodja.layout import get_layout
+from racunovodja.pdf import PDFModel
+
+from .bench_assets import SAMPLE
+
+
+def legacy_racun_string(self, data):
+    """get_racun_string as it was before the compiled layout"""
+    # Podatki o izdajatelju računa:
+    naziv_i = s.user['name'] + (' ' * (68 - len(s.user['name'])))
+    kraj_i = s.user['post_nr'] + ' ' + s.user['city']\
+        + (' ' * (75 - len(s.user['post_nr']) - len(s.user['city'])))
+    ulica_i = s.user['street'] + (' ' * (67 - len(s.user['street'])))
+    ds_i = s.user['tax_nr'] + (' ' * (54 - len(s.user['tax_nr'])))
+    iban_i = s.user['iban']
+    banka_i = s.user['bank']
+    bic_i = s.user['bic']
+
+    # Podatki o prejemniku računa:
+    naziv_p = data['Naziv']
+    naslov_p = data['Naslov'].split(', ')
+    ds_p = data['Davčna številka']
+    ms_p = data['Matična številka']
+
+    # Podatki o računu
+    datum_storitve = data['Datum opravljene storitve']
+    datum_izdaje = datetime.today().strftime("%d.%m.%Y")
+    datum_zapadlosti = (datetime.today()\
+        + timedelta(days=14)).strftime("%d.%m.%Y")
+    opis_input = data['Opis storitve']
+    znesek_input = data['Znesek']
+    sklic = self.get_sifra_racuna()[2:]
+    opis = opis_input + (' ' * (41 - len(opis_input)))
+    znesek = znesek_input + '€' + (' ' * (9 - len(znesek_input)))
+    znesek2 = znesek_input + '€' + (' ' * (14 - len(znesek_input)))
+    znesek3 = znesek_input + '€' + (' ' * (17 - len(znesek_input)))
+
+    # Konstrukcija računa
+    racun_string = f"""Izdajatelj:{' ' * 53}Prejemnik: 
+{naziv_i}Naziv:  {naziv_p}
+{ulica_i}Naslov:  {naslov_p[0]}
+{kraj_i}{naslov_p[1]}
+{' ' * 71}DŠ:  {ds_p}
+DAVČNA ŠTEVILKA: {ds_i}MŠ:  {ms_p}
+
+IBAN:   {iban_i}
+Banka:  {banka_i}
+BIC:    {bic_i} 
+
+
+Račun št. {self.get_sifra_racuna()}
+
+{' ' * 61}Datum izdaje:  {datum_izdaje}
+{' ' * 60}Način plačila:  Nakazilo na TRR
+{' ' * 67}Valuta:  EUR
+{' ' * 62}Kraj izdaje:  Ljutomer
+{' ' * 48}Datum opravljene storitve:  {datum_storitve}
+{' ' * 57}Datum zapadlosti:  {datum_zapadlosti}
+{' ' * 68}Sklic:  {sklic}
+{' ' * 62}Koda namena:  OTHR
+
+{'_' * 107}
+Na osnovi pogodbe/naročila vam zaračunavam avtorsko delo iz neodvisnega samostojnega opravljanja 
+dejavnosti po 46. členu Zdoh-2L.
+{'_' * 107}
+
++{'-' * 42}+{'-' * 10}+{'-' * 5}+{'-' * 11}+{'-' * 10}+{'-' * 5}+{'-' * 16}+
+| Opis storitve{' ' * 28}| Količina | EM  | Cena/EM   | Popust   | DDV | Vrednost z DDV |
++{'=' * 42}+{'=' * 10}+{'=' * 5}+{'=' * 11}+{'=' * 10}+{'=' * 5}+{'=' * 16}+
+| {opis}|    1     | PCE | {znesek}| 0% 0.00€ | 0%  | {znesek2}|
++{'-' * 42}+{'-' * 10}+{'-' * 5}+{'-' * 11}+{'-' * 10}+{'-' * 5}+{'-' * 16}+
+
+DDV po 1. odstavku 94. člena ZDDV-1 ni obračunan.
+
+{' ' * 64}+{'-' * 21}+{'-' * 19}+
+{' ' * 64}| Vrednost postavk:   | {znesek3}|
+{' ' * 64}+{'-' * 21}+{'-' * 19}+
+{' ' * 64}| Vsota popustov:     | 0,00€{' ' * 13}|
+{' ' * 64}+{'-' * 21}+{'-' * 19}+
+{' ' * 64}| Osnova za DDV:      | 0.00€{' ' * 13}|
+{' ' * 64}+{'-' * 21}+{'-' * 19}+
+{' ' * 64}| Neobdavčeno:        | {znesek3}|
+{' ' * 64}+{'-' * 21}+{'-' * 19}+
+{' ' * 64}| Vsota zneskov:      | DDV: 0,00€{' ' * 8}|
+{' ' * 64}+{'-' * 21}+{'-' * 19}+
+{' ' * 64}| ZA PLAČILO:         | {znesek3}|
+{' ' * 64}+{'-' * 21}+{'-' * 19}+
+
+
+{' ' * 4}Podpis:
+
+{'_' * 107}
+"""
+    return racun_string
+
+
+def per_call(function, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - started) / count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_layout')
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    # Without booked dates both versions date the invoice today
+    data = dict(SAMPLE, **{'Datum izdaje': '', 'Datum zapadlosti': ''})
+    pdf = PDFModel(data['Št. računa'])
+    assert pdf.get_racun_string(data) == legacy_racun_string(pdf, data)
+
+    before = per_call(lambda: legacy_racun_string(pdf, data), args.calls)
+    after = per_call(lambda: pdf.get_racun_string(data), args.calls)
+
+    # The layout alone, without formatting today's dates and the code
+    layout = get_layout(s.user)
+    sifra = pdf.get_sifra_racuna()
+    only_layout = per_call(
+        lambda: layout.render(SAMPLE, sifra, '01.01.2024', '15.01.2024'),
+        args.calls)
+
+    print(f"prej:            {before * 1e6:.1f} µs/klic")
+    print(f"zdaj:            {after * 1e6:.1f} µs/klic")
+    print(f"samo postavitev: {only_layout * 1e6:.1f} µs/klic")
+    print(f"pohitritev:      {before / after:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+"""Benchmarks of every stage of the invoice pipeline, without the GUI.
+
+Run from the repository root:
+    python -m benchmarks.run [--sizes 1000 100000 1000000] [--out FILE]
+        [--baseline benchmarks/baseline.json] [--save-baseline] [--check]
+
+Synthetic ledgers of the given sizes are generated once and kept in
+--data. Every result is the best time of one operation over a few
+repeats, in seconds. The results are written as JSON and compared to the
+stored baseline; with --check, a stage that got slower than --tolerance
+allows makes the run fail.
+
+Startup (import and, with a display, first paint) is measured in fresh
+interpreters and must stay under TARGETS, otherwise the run fails.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, datetime, timedelta
+from itertools import count
+from pathlib import Path
+
+from racunovodja.models import CSVModel
+from racunovodja.pdf import PDFModel
+from racunovodja.reports import iter_rows
+
+from .bench_assets import SAMPLE
+
+
+BASELINE = Path(__file__).with_name('baseline.json')
+DATA = Path(tempfile.gettempdir()) / 'racunovodja_bench'
+SIZES = (1000, 100000, 1000000)
+ROOT = Path(__file__).resolve().parent.parent
+
+# Seconds, enforced on every run
+TARGETS = {
+    'startup_import': 0.15,
+    'startup_paint': 0.5,
+    }
+
+NAMES = (
+    'Bedanec Podgorski', 'Rožle Podhostnik', 'Kekec Kekčevič',
+    'Mojca Pokrajculja', 'Pehta Zeliščarka', 'Brincelj Velikan',
+    )
+OPISI = (
+    'Pašnja ovac', 'Delo na črno', 'Nabiranje zelišč',
+    'Svetovanje pri gradnji mostu čez potok', 'Prevod', 'Oblikovanje',
+    )
+
+
+def generate_ledger(path, rows, seed=0):
+    """Write a ledger of rows random but reproducible records"""
+    rng = random.Random(seed)
+    start = date(2023, 1, 1)
+
+    with open(path, 'w', newline='', encoding='utf-8') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(CSVModel.fields.keys())
+        for number in range(1, rows + 1):
+            client = rng.randrange(len(NAMES) * 50)
+            izdan = start + timedelta(days=rng.randrange(365))
+            writer.writerow((
+                number,
+                NAMES[client % len(NAMES)],
+                f"Gozdna pot {client}, 1234 Hosta",
+                f"SI{10000000 + client}",
+                20000000 + client,
+                rng.choice(OPISI),
+                izdan.strftime('%d.%m.%Y'),
+                izdan.strftime('%d.%m.%Y'),
+                (izdan + timedelta(days=14)).strftime('%d.%m.%Y'),
+                f"{rng.randrange(1, 5000)},{rng.randrange(100):02d}",
+                '',
+                ))
+
+
+def ledger(rows, directory=DATA):
+    """Path of a generated ledger, reused between runs"""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"knjiga_racunov_{rows}.csv"
+    if not path.exists():
+        tmp = path.with_name(path.name + '.tmp')
+        generate_ledger(tmp, rows)
+        os.replace(tmp, path)
+    return path
+
+
+def measure(func, number=1, repeat=3):
+    """Best seconds per call of func, timeit style"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - started) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_invoice():
+    """Stages that do not depend on the ledger size"""
+    pdf = PDFModel(SAMPLE['Št. računa'])
+
+    def render():
+        PDFModel(SAMPLE['Št. računa']).render(SAMPLE)
+
+    def render_output():
+        pdf = PDFModel(SAMPLE['Št. računa'])
+        pdf.render(SAMPLE)
+        pdf.output()
+
+    def stamp_output():
+        PDFModel.stamp(SAMPLE['Št. računa'], SAMPLE).output()
+
+    # Warm up the asset cache and the compiled layout first
+    render_output()
+    stamp_output()
+
+    return {
+        'get_sifra_racuna': measure(pdf.get_sifra_racuna, 10000),
+        'get_racun_string': measure(lambda: pdf.get_racun_string(SAMPLE), 1000),
+        'render': measure(render, 20),
+        'render_output': measure(render_output, 20),
+        'stamp_output': measure(stamp_output, 20),
+        }
+
+
+def bench_startup(directory=DATA, repeat=3):
+    """Import and first paint times of the application, best of repeat"""
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    results = {}
+
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-m', 'racunovodja.startup'],
+            cwd=directory, env=env, capture_output=True, text=True,
+            check=True,
+            ).stdout
+        times = json.loads(output)
+
+        for name in ('import', 'paint'):
+            if times[name] is not None:
+                key = f"startup_{name}"
+                results[key] = min(results.get(key, times[name]), times[name])
+
+    return results
+
+
+def bench_ledger(path, saves=50):
+    """Reads and appends on one generated ledger"""
+    rows = sum(1 for record, _, _ in iter_rows(path) if record)
+    repeat = 1 if rows >= 1000000 else 3
+    model = CSVModel(path)
+    last = str(rows)
+    results = {}
+
+    results['read_all'] = measure(model.get_all_records, repeat=repeat)
+    results['get_record'] = measure(lambda: model.get_record(last), repeat=repeat)
+    results['iter_rows'] = measure(
+        lambda: sum(1 for _ in iter_rows(path)), repeat=repeat)
+
+    # Appends go to a copy, so the generated ledger is left as it was
+    work = path.with_name('save_' + path.name)
+    shutil.copyfile(path, work)
+    try:
+        model = CSVModel(work)
+        # Every save books a new invoice, after the generated ones
+        numbers = count(rows + 1)
+
+        def save():
+            record = dict(SAMPLE)
+            record['Št. računa'] = str(next(numbers))
+            model.save_record(record)
+
+        results['save_record'] = measure(save, saves, repeat=1)
+    finally:
+        work.unlink()
+        Path(str(work) + '.lock').unlink(missing_ok=True)
+
+    return results
+
+
+def run(sizes, data=DATA):
+    # fpdf warnings would be printed on every repeat
+    warnings.simplefilter('ignore')
+    data.mkdir(parents=True, exist_ok=True)
+    results = bench_startup(data)
+
+    for name, seconds in bench_invoice().items():
+        results[name] = seconds
+
+    for rows in sizes:
+        for name, seconds in bench_ledger(ledger(rows, data)).items():
+            results[f"{name}[{rows}]"] = seconds
+
+    return {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sizes': list(sizes),
+            },
+        'results': results,
+        }
+
+
+def compare(results, baseline, tolerance):
+    """Print every stage against the baseline, returns the regressions"""
+    regressions = []
+    print(f"{'stage':<28}{'now':>12}{'baseline':>12}{'ratio':>8}")
+
+    for name, seconds in results['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"{name:<28}{_format(seconds):>12}{'-':>12}")
+            continue
+
+        ratio = seconds / before
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  POČASNEJE'
+            regressions.append(name)
+        print(
+            f"{name:<28}{_format(seconds):>12}{_format(before):>12}"
+            f"{ratio:>7.2f}x{flag}"
+            )
+
+    return regressions
+
+
+def _format(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--data', type=Path, default=DATA,
+        help="where the generated ledgers are kept")
+    parser.add_argument('--out', type=Path, default=DATA / 'results.json')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+        help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+        help="allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument('--check', action='store_true',
+        help="exit with an error on a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.data)
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(args.out, 'w', encoding='utf-8') as fh:
+        json.dump(results, fh, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh, indent=2)
+            fh.write('\n')
+
+    baseline = {'results': {}}
+    if args.baseline.exists():
+        with open(args.baseline, 'r', encoding='utf-8') as fh:
+            baseline = json.load(fh)
+
+    regressions = compare(results, baseline, args.tolerance)
+
+    missed = [
+        name for name, target in TARGETS.items()
+        if results['results'].get(name, 0) > target
+        ]
+    for name in missed:
+        print(
+            f"{name}: {_format(results['results'][name])} "
+            f"presega cilj {_format(TARGETS[name])}"
+            )
+
+    if regressions and args.check:
+        print(f"Počasneje kot osnova: {', '.join(regressions)}")
+        return 1
+    return 1 if missed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
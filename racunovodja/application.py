@@ -3,8 +3,17 @@ from tkinter import messagebox
 from tkinter import ttk
 from datetime import datetime
 from . import views as v
-from . import models as m
 from . import settings as s
+from . import tracing
+from .renderer import RenderQueue
+from .clients import ClientIndex
+from .models import DuplicateInvoiceError, InvoiceYearError
+from .profiles import ProfileCache
+from .search import SearchIndex
+
+
+# How often idle issuer profiles are evicted, in milliseconds
+EVICT_MS = 60 * 1000
 
 
 class Application(tk.Tk):
@@ -13,29 +22,108 @@ class Application(tk.Tk):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.model = m.CSVModel()
+        if s.trace:
+            tracing.enable(s.trace_file)
+
+        # Saved records are added to the client directory and the search
+        # index of their issuer right away; both read the CSV ledgers
+        self.indexed = s.storage == 'csv'
+        self.clients = {}
+        self.indexes = {}
+
+        # Every issuer profile used keeps its ledger and allocator open
+        self.profiles = ProfileCache(on_open=self._open_session)
+        session = self.profiles.activate(s.profile)
+        self.model = session.model
+        self.allocator = session.allocator
+
         self.title("Moj Računovodja")
         self.columnconfigure(0, weight=1)
-        
-        ttk.Label(self, text="Moj Računovodja",
+
+        header = ttk.Frame(self)
+        header.grid(row=0, padx=10, sticky=(tk.W + tk.E))
+        header.columnconfigure(0, weight=1)
+        ttk.Label(header, text="Moj Računovodja",
             font=("TkDefaultFont", 16)
-            ).grid(row=0)
+            ).grid(row=0, column=0)
 
-        self.recordform = v.DataRecordForm(self, self.model)
+        names = self.profiles.names()
+        self.profile = tk.StringVar(value=s.profile)
+        if len(names) > 1:
+            ttk.Label(header, text="Izdajatelj:").grid(row=0, column=1)
+            chooser = ttk.Combobox(header, textvariable=self.profile,
+                values=names, state='readonly', width=12)
+            chooser.grid(row=0, column=2)
+            chooser.bind('<<ComboboxSelected>>', self._on_profile)
+
+        self.recordform = v.DataRecordForm(
+            self, self.model, allocator=self.allocator,
+            clients=self.clients.get(s.profile))
         self.recordform.grid(row=1, padx=10, sticky=(tk.W + tk.E))
         self.recordform.bind('<<SaveRecord>>', self._on_save)
 
         self.status = tk.StringVar()
+        if self.indexed:
+            self.search = v.SearchFrame(self, self._search)
+            self.search.grid(row=2, padx=10, sticky=(tk.W + tk.E))
+        else:
+            self.status.set(
+                "Iskanje in predlogi strank delujejo samo s knjigami .csv.")
         ttk.Label(self, textvariable=self.status
-            ).grid(sticky=(tk.W + tk.E), row=2, padx=10)
+            ).grid(sticky=(tk.W + tk.E), row=3, padx=10)
 
         self._records_saved = 0
 
+        self.renderer = RenderQueue(
+            self, on_change=self._update_status, on_error=self._on_render_error)
+        self.protocol('WM_DELETE_WINDOW', self._on_close)
+
+        # fpdf2, the invoice assets and the clients of past ledgers are
+        # loaded once the window is shown
+        self.after_idle(self.renderer.warm_up, session.warm_up)
+        self.after(EVICT_MS, self._evict_profiles)
+
+    def _open_session(self, session):
+        if not self.indexed:
+            return
+        directory = session.profile.get('directory', '.')
+        clients = self.clients[session.name] = ClientIndex(directory)
+        session.model.subscribe(clients.add)
+        index = self.indexes[session.name] = SearchIndex(
+            directory, profile=session.name)
+        session.model.subscribe(index.update)
+        # Past ledgers are read once the window is shown
+        self.after_idle(clients.update)
+        self.after_idle(index.update)
+
+    def _search(self, query, limit):
+        """Invoices of the active issuer matching query"""
+        return self.indexes[self.profiles.active].search(query, limit)
+
+    def _on_profile(self, *_):
+        """Switch the issuer, the ledger and the invoice numbering"""
+        session = self.profiles.activate(self.profile.get())
+        self.model = session.model
+        self.allocator = session.allocator
+        self.recordform.set_allocator(self.allocator)
+        self.recordform.set_clients(self.clients.get(session.name))
+        # Does nothing if the profile is already loaded
+        self.renderer.warm_up(session.warm_up)
+
+    def _evict_profiles(self):
+        for name in self.profiles.evict():
+            self.clients.pop(name, None)
+            self.indexes.pop(name, None)
+        self.after(EVICT_MS, self._evict_profiles)
+
     def _on_save(self, *_):
         """Handles save button clicks"""
-        
-        """
-        errors = self.recordform.get_errors()
+        with tracing.span('save'):
+            return self._save()
+
+    def _save(self):
+        with tracing.span('save.validate'):
+            errors = self.recordform.get_errors()
         if errors:
             message = "Računa ni možno shraniti."
             detail = (
@@ -46,25 +134,87 @@ class Application(tk.Tk):
                 title='Error', message=message, detail=detail)
 
             return False
-        """
-        data = self.recordform.get()
 
-        self.model.save_record(data)
+        with tracing.span('save.form'):
+            data = self.recordform.get()
+
+        # The window may stay open past New Year
+        session = self.profiles.get(self.profiles.active)
+        if session.renew():
+            self.model = session.model
+            self.allocator = session.allocator
+            self.recordform.set_allocator(self.allocator)
+        # Checked before a number is taken, so none is lost
+        if self.model.outside_year([data]):
+            messagebox.showerror(
+                title='Error',
+                message="Računa ni možno shraniti.",
+                detail=f"{InvoiceYearError([data], self.model.year)}.",
+                )
+            return False
+
+        # The suggested number is only reserved now, in case another
+        # process has issued an invoice since the form was reset
+        with tracing.span('save.number'):
+            stevilka = data['Št. računa']
+            if not stevilka or stevilka == self.recordform.suggested_number:
+                data['Št. računa'] = self.allocator.next()
+            elif self.model.duplicates([data]):
+                # Numbers repeat every year, only this year's are taken
+                messagebox.showerror(
+                    title='Error',
+                    message=f"Račun št. {stevilka} že obstaja.",
+                    )
+                return False
+            elif stevilka.isdigit():
+                self.allocator.observe(stevilka)
+
+        with tracing.span('save.ledger'):
+            try:
+                self.model.save_record(data)
+            except DuplicateInvoiceError as e:
+                # Booked by another process since the check above
+                messagebox.showerror(title='Error', message=f"{e}.")
+                return False
+            except PermissionError as e:
+                messagebox.showerror(
+                    title='Error',
+                    message="Računa ni možno zapisati v knjigo.",
+                    detail=str(e),
+                    )
+                return False
         self._records_saved += 1
-        self.status.set(f"Shranjenih je bilo {self._records_saved} računov.")
-        
-        stevilka_racuna = self.recordform.get_stevilka_racuna()
-        opomba = self.recordform.get_naslov_racuna()
-        
-        pdf = m.PDFModel(stevilka_racuna)
-        
-        racun_string = pdf.get_racun_string(data)
-        pdf.add_page()
-        pdf.set_font_size(9.5)
-        pdf.ln(5)
-        pdf.multi_cell(0, 4, racun_string, border = 0, align = 'L')
-        pdf.image(s.user['signature'], 30, 230, 45)
-        pdf.output(f"racun_st_{pdf.get_sifra_racuna()}_{opomba}.pdf")
-        
-        self.recordform.reset()
-        
\ No newline at end of file
+
+        # The row is in the ledger, the PDF is rendered in the background
+        with tracing.span('save.reset'):
+            self.recordform.reset()
+        self.renderer.submit(
+            data, self.profiles.active, eslog=self.recordform.eslog.get())
+
+    def _update_status(self, renderer):
+        status = (
+            f"Shranjenih je bilo {self._records_saved} računov. "
+            f"{renderer.status()}"
+            )
+        timings = tracing.status()
+        if timings:
+            status += f" ({timings})"
+        self.status.set(status)
+
+    def _on_render_error(self, job):
+        """Offer to retry a failed render, the job is kept either way"""
+        retry = messagebox.askretrycancel(
+            title='Error',
+            message=f"Računa št. {job.label} ni bilo možno izrisati.",
+            detail=str(job.error),
+            )
+        if retry:
+            self.renderer.retry(job)
+
+    def _on_close(self):
+        """Let the queued invoices finish rendering before closing"""
+        if self.renderer.pending():
+            self.status.set("Izrisujem preostale račune ...")
+            self.update_idletasks()
+        self.renderer.stop()
+        self.destroy()
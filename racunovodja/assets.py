@@ -0,0 +1,181 @@
+"""Process-wide cache of the font and images used on every invoice.
+
+The TrueType font is parsed and the PNG files are decoded only once per
+process. Every PDFModel then gets its own lightweight copy of the parsed
+form, so no document ever shares its font subset with another one.
+"""
+import copy
+import hashlib
+import io
+import os
+import threading
+
+from fontTools import ttLib
+from fpdf import FPDF
+from fpdf.fonts import SubsetMap
+from fpdf.image_datastructures import ImageCache
+from fpdf.image_parsing import preload_image
+
+from .tracing import traced
+
+
+FONT_FILE = "files/UbuntuMono-Regular.ttf"
+
+
+class Asset:
+    """A parsed file together with the stamp it was parsed from"""
+
+    def __init__(self, stamp, digest, value):
+        self.stamp = stamp
+        self.digest = digest
+        self.value = value
+
+
+class AssetRegistry:
+    """Loads the invoice assets once and hands out per-document copies"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.loads = 0
+        self._assets = {}
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _digest(path):
+        with open(path, 'rb') as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
+
+    def get(self, path, loader):
+        """Return the parsed form of a file, reloading it if it changed.
+
+        A changed mtime or size only triggers a reload when the content
+        hash is different as well.
+        """
+        path = str(path)
+
+        with self._lock:
+            stamp = self._stamp(path)
+            asset = self._assets.get(path)
+
+            if asset and asset.stamp == stamp:
+                return asset.value
+
+            digest = self._digest(path)
+            if asset and asset.digest == digest:
+                asset.stamp = stamp
+                return asset.value
+
+            self._assets[path] = Asset(stamp, digest, loader(path))
+            self.loads += 1
+            return self._assets[path].value
+
+    def digest(self, path):
+        """Content hash of an asset file"""
+        path = str(path)
+        stamp = self._stamp(path)
+
+        with self._lock:
+            asset = self._assets.get(path)
+            if asset and asset.stamp == stamp:
+                return asset.digest
+            known = self._digests.get(path)
+            if known and known[0] == stamp:
+                return known[1]
+
+        digest = self._digest(path)
+        with self._lock:
+            self._digests[path] = (stamp, digest)
+        return digest
+
+    def discard(self, path):
+        """Forget one file, e.g. the logo of a profile no longer used"""
+        path = str(path)
+        with self._lock:
+            self._assets.pop(path, None)
+            self._digests.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._assets.clear()
+            self._digests.clear()
+
+    @staticmethod
+    def _load_font(path):
+        pdf = FPDF()
+        pdf.add_font(fname=path)
+
+        with open(path, 'rb') as fh:
+            data = fh.read()
+
+        return next(iter(pdf.fonts.values())), data
+
+    @staticmethod
+    def _load_image(path):
+        _, _, info = preload_image(ImageCache(), path)
+        return info
+
+    @traced('pdf.font')
+    def add_font(self, pdf, fname=FONT_FILE):
+        """Make the font available in pdf, returns its family name"""
+        family = os.path.splitext(os.path.basename(fname))[0]
+
+        if family.lower() in pdf.fonts:
+            return family
+
+        if not self.enabled:
+            pdf.add_font(fname=fname)
+            return family
+
+        template, data = self.get(fname, self._load_font)
+
+        font = copy.deepcopy(template)
+        font.ttfont = self._open_tables(data)
+        font.i = len(pdf.fonts) + 1
+        font.subset = SubsetMap(font)
+        pdf.fonts[font.fontkey] = font
+
+        return family
+
+    # Metrics are shared between documents, but fpdf subsets the font
+    # tables in place on output, so every document opens its own (lazy)
+    # copy of them.
+    @staticmethod
+    def _open_tables(data):
+        return ttLib.TTFont(io.BytesIO(data), recalcTimestamp=False, lazy=True)
+
+    def detach_fonts(self, pdf, fname=FONT_FILE):
+        """Give a deep-copied document its own font tables"""
+        _, data = self.get(fname, self._load_font)
+
+        for font in pdf.fonts.values():
+            if getattr(font, 'ttfont', None) is not None:
+                font.ttfont = self._open_tables(data)
+                font.subset.font = font
+
+    @traced('pdf.image')
+    def image(self, pdf, path, *args, **kwargs):
+        """Place an image in pdf without decoding the file again"""
+        name = str(path)
+        images = pdf.image_cache.images
+
+        if self.enabled and name not in images:
+            info = self.get(name, self._load_image)
+            info = type(info)(info, i=len(images) + 1, usages=0)
+
+            iccp = info.get('iccp')
+            if iccp is not None:
+                profiles = pdf.image_cache.icc_profiles
+                info['iccp_i'] = profiles.setdefault(iccp, len(profiles))
+
+            images[name] = info
+
+        return pdf.image(name, *args, **kwargs)
+
+
+registry = AssetRegistry()
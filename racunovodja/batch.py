@@ -0,0 +1,326 @@
+"""Headless batch invoicing, usable without the Tk window.
+
+Usage:
+    python -m racunovodja.batch racuni.csv [--workers N] [--profile NAME]
+        [--eslog]
+
+Records are read from a .csv or .json file with the same keys as
+CSVModel.fields; in a .json file, a record may also list its line items
+under 'Postavke' (see racunovodja.items). They are validated and
+rendered in parallel on a process pool; the records whose PDF was
+rendered are then booked in the ledger in file order, with a single
+commit. The numbers of the records that failed go to the ones after
+them, so the numbering has no gaps. With --eslog, the e-invoice of every
+record is written by the main process while the PDFs render.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
+from .models import CSVModel, DuplicateInvoiceError, InvoiceYearError
+from .cache import get_cache
+from .eslog import export_record
+from .items import ITEMS, summarize
+from .numbering import InvoiceNumberAllocator
+from .profiles import get_profile, open_ledger
+from .tracing import span
+from .validation import get_validator
+from . import settings as s
+
+
+def load_records(path):
+    """Read a list of records from a .csv or .json file"""
+    path = Path(path)
+
+    with open(path, 'r', newline='', encoding='utf-8') as fh:
+        if path.suffix.lower() == '.json':
+            records = json.load(fh)
+            # A single record needs no list around it
+            if isinstance(records, dict):
+                records = [records]
+        else:
+            records = list(csv.DictReader(fh))
+
+    # Every record carries every ledger column, as strings
+    loaded = []
+    for record in records:
+        row = {key: str(record.get(key) or '').strip() for key in CSVModel.fields}
+        if record.get(ITEMS):
+            row[ITEMS] = record[ITEMS]
+        loaded.append(summarize(row))
+    return loaded
+
+
+def validate_record(record):
+    """Return a dict of field errors for a single record"""
+    return get_validator().validate(record)
+
+
+def assign_numbers(records, allocator):
+    """Fill in missing invoice numbers in file order, from an allocator
+    or a Reservation of one.
+
+    All numbers are reserved with a single allocation before anything is
+    rendered, so the numbering only depends on the input file, never on
+    the workers.
+    """
+    blank = [record for record in records if not record['Št. računa']]
+    given = [
+        int(record['Št. računa']) for record in records
+        if record['Št. računa'].isdigit()
+        ]
+
+    if given:
+        allocator.observe(max(given))
+
+    if blank:
+        for record, stevilka in zip(blank, allocator.allocate(len(blank))):
+            record['Št. računa'] = stevilka
+
+    return records
+
+
+def render_record(record, profile=None):
+    """Render one record to its PDF file, returns (filename, seconds).
+
+    profile is the name of the issuer profile, the active one by
+    default. Names rather than profiles are passed to worker processes,
+    so every worker compiles the layout of a profile only once.
+    """
+    # fpdf2 is slow to import, so it is only loaded once something is rendered
+    from .pdf import PDFModel
+
+    started = time.perf_counter()
+    cache = get_cache()
+    profile = get_profile(profile)
+
+    with span('render'):
+        pdf = PDFModel.for_data(record, profile)
+        filename = pdf.get_filename(record['Opomba'])
+        if cache is not None:
+            key = PDFModel.cache_key(record, profile)
+            if cache.fetch(key, filename):
+                return filename, time.perf_counter() - started
+
+        pdf = PDFModel.for_record(record, profile)
+        with span('pdf.output'):
+            # Written next to the target and moved over it, so the file
+            # is never seen half written
+            tmp = f".{filename}.{os.getpid()}.tmp"
+            pdf.output(tmp)
+            os.replace(tmp, filename)
+
+        if cache is not None:
+            cache.store(key, filename)
+
+    return filename, time.perf_counter() - started
+
+
+def warm_up(profile=None):
+    """Import fpdf2 and load the invoice assets ahead of the first render"""
+    from .pdf import PDFModel
+
+    PDFModel.skeleton(get_profile(profile))
+
+
+def try_render_record(record, profile=None):
+    """Like render_record, but returns the error instead of raising it"""
+    try:
+        return render_record(record, profile) + (None,)
+    except Exception as e:
+        return None, 0.0, e
+
+
+def try_export_record(record, profile=None):
+    """(path, None) of the e-invoice of a record, or (None, error)"""
+    try:
+        return export_record(record, profile), None
+    except (OSError, ValueError) as e:
+        return None, e
+
+
+def _render_all(pool, records, profile, eslog, chunksize):
+    """Yield (record, filename, seconds, error, e-invoice path) for
+    records rendered on pool, with eslog also written meanwhile. A
+    record fails if either of them fails, and neither file is kept.
+    """
+    results = pool.map(
+        try_render_record, records, repeat(profile), chunksize=chunksize)
+    # The workers are rendering meanwhile
+    exported = repeat((None, None))
+    if eslog:
+        exported = [try_export_record(record, profile) for record in records]
+
+    for record, (filename, seconds, error), (path, eslog_error) in zip(
+        records, results, exported
+        ):
+        error = error or eslog_error
+        if error is not None:
+            # Not issued, so there is no invoice at all
+            for name in (filename, path):
+                if name is not None:
+                    os.unlink(name)
+            filename = path = None
+        yield record, filename, seconds, error, path
+
+
+def _renumber(blank, done, numbers):
+    """Give the numbers of the numbered records that failed to the ones
+    after them, returns the records whose number changed.
+
+    Their files are removed from done, they have to be rendered again.
+    """
+    kept = [record for record in blank if id(record) in done]
+    changed = []
+    for record, stevilka in zip(kept, numbers.keep(len(kept))):
+        if record['Št. računa'] != stevilka:
+            filename, _, path = done.pop(id(record))
+            os.unlink(filename)
+            if path is not None:
+                path.unlink()
+            record['Št. računa'] = stevilka
+            changed.append(record)
+    return changed
+
+
+class BatchResult:
+    """Timings of a finished batch run"""
+
+    def __init__(self, invoices, elapsed, failed=None):
+        self.invoices = invoices
+        self.elapsed = elapsed
+        self.failed = failed or []
+
+    @property
+    def throughput(self):
+        """Invoices rendered per second"""
+        if not self.elapsed:
+            return 0.0
+        return len(self.invoices) / self.elapsed
+
+
+def run_batch(
+    records, model=None, workers=None, allocator=None, profile=None,
+    eslog=None
+    ):
+    """Validate, render and book a list of records.
+
+    The invoices are issued by the named profile, by default the active
+    one, and booked in its ledger unless model is given. With eslog
+    (default: settings.eslog) their e-invoices are written as well.
+
+    Nothing is written if any of the records is invalid, was issued in
+    another year than the ledger's, or has a number that was issued
+    already or is given twice. Records whose
+    PDF fails to render are rolled back and reported in
+    BatchResult.failed as (record, error); the rest are in
+    BatchResult.invoices as (record, filename, seconds).
+    """
+    # Missing numbers are allocated once the batch is valid
+    report = get_validator().validate_many(records, skip={'Št. računa'})
+    if report.errors:
+        raise ValueError(report.format())
+
+    # Workers get the name, also when they do not inherit the settings
+    profile = profile or s.profile
+    issuer = get_profile(profile)
+    model = model or open_ledger(issuer)
+    allocator = allocator or InvoiceNumberAllocator(
+        issuer['name'], model=model, directory=issuer.get('directory', '.'))
+    # Checked before rendering, so no PDF of a booked invoice is replaced;
+    # the commit checks again, in case another process booked them since
+    outside = model.outside_year(records)
+    if outside:
+        raise InvoiceYearError(outside, model.year)
+    duplicates = model.duplicates(records)
+    if duplicates:
+        raise DuplicateInvoiceError(duplicates)
+    blank = [record for record in records if not record['Št. računa']]
+    started = time.perf_counter()
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(records) // (workers * 4))
+    eslog = s.eslog if eslog is None else eslog
+    # (filename, seconds, e-invoice path) of the rendered records
+    done = {}
+    failed = []
+
+    # Other processes wait for their numbers until the batch is booked,
+    # so the numbers of the invoices that fail go to the ones after them
+    # and the numbering has no gaps
+    with allocator.reserve() as numbers:
+        assign_numbers(records, numbers)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = records
+            while pending:
+                for record, filename, seconds, error, path in _render_all(
+                    pool, pending, profile, eslog, chunksize
+                    ):
+                    if error is None:
+                        done[id(record)] = (filename, seconds, path)
+                    else:
+                        failed.append((record, error))
+                # A render failing again moves the numbers once more
+                pending = _renumber(blank, done, numbers)
+
+        for record, _ in failed:
+            if any(record is other for other in blank):
+                # Its number went to another invoice
+                record['Št. računa'] = ''
+        invoices = [
+            (record, *done[id(record)][:2])
+            for record in records if id(record) in done
+            ]
+
+        # One journal write and one fsync for the whole batch
+        with model.transaction() as transaction:
+            for record, _, _ in invoices:
+                transaction.add(record)
+
+    return BatchResult(invoices, time.perf_counter() - started, failed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.batch',
+        description="Izdaja računov iz .csv ali .json datoteke.")
+    parser.add_argument('records', help=".csv or .json file with records")
+    parser.add_argument('--workers', type=int, default=None,
+        help="number of render processes (default: all cores)")
+    parser.add_argument('--profile', default=None,
+        help="issuer profile (default: settings.profile)")
+    parser.add_argument('--eslog', action='store_true', default=None,
+        help="also write e-invoices (e-SLOG 2.0 XML)")
+    args = parser.parse_args(argv)
+
+    records = load_records(args.records)
+    try:
+        result = run_batch(
+            records, workers=args.workers, profile=args.profile,
+            eslog=args.eslog)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    for record, filename, seconds in result.invoices:
+        print(f"{filename}: {seconds * 1000:.1f} ms")
+
+    for record, error in result.failed:
+        label = record['Št. računa'] or record['Naziv']
+        print(f"Račun {label} ni bil izdan: {error}", file=sys.stderr)
+
+    print(
+        f"{len(result.invoices)} računov v {result.elapsed:.2f} s "
+        f"({result.throughput:.1f} računov/s)"
+        )
+    return 1 if result.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""On-disk cache of rendered invoices, keyed by content.
+
+The key of an invoice is a hash of everything its PDF depends on (see
+PDFModel.cache_key): the record, the issuer profile, the dates and
+number on the invoice, the layout and the files of the logo, signature,
+font and rendering code. Any change to one of them gives a new key, so
+stale entries are never served; they are evicted like any other.
+
+An identical request is served by copying the cached file to its
+destination; the copy is the user's to edit or delete, the cache entry
+is never shared with it. The cache is bounded in size; the least
+recently used entries are evicted first.
+"""
+import os
+import shutil
+from pathlib import Path
+
+from . import settings as s
+
+
+class RenderCache:
+    """Rendered PDF files by key, at most max_bytes in total"""
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.pdf"
+
+    @staticmethod
+    def _place(source, dest):
+        """Atomically put a copy of source at dest"""
+        dest = Path(dest)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+        try:
+            shutil.copyfile(source, tmp)
+            os.replace(tmp, dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def fetch(self, key, dest):
+        """Put the cached file of key at dest, returns False on a miss"""
+        path = self._path(key)
+        try:
+            # The modification time orders the entries for eviction;
+            # an entry evicted by another process meanwhile is a miss
+            os.utime(path)
+            self._place(path, dest)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        return True
+
+    def store(self, key, source):
+        """Copy a freshly rendered file into the cache"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, path)
+
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += path.stat().st_size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        for path in self.directory.glob('*/*.pdf'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # Evicted by another process
+                continue
+            yield stat.st_mtime_ns, stat.st_size, path
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Drop the least recently used entries until the cache fits"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+        self._size = total
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._size = 0
+
+
+_caches = {}
+
+
+def get_cache():
+    """The cache configured in settings, or None when it is turned off"""
+    if not s.render_cache:
+        return None
+
+    key = (s.render_cache, s.render_cache_size)
+    if key not in _caches:
+        _caches[key] = RenderCache(s.render_cache, s.render_cache_size)
+    return _caches[key]
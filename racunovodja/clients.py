@@ -0,0 +1,143 @@
+"""Directory of past clients, for filling in the recipient fields.
+
+Clients are collected from all yearly ledgers, keyed by tax number; the
+latest record of a client wins. For prefix lookups, names and tax
+numbers are kept in two sorted lists of (folded key, tax number), so a
+lookup is a bisect followed by a short scan. Keys are case- and
+diacritic-folded, so 'roz' finds 'Rožle'.
+
+Like the reports, the ledgers are read incrementally: the clients and
+the byte offset reached in every ledger are kept in a checkpoint file.
+Records saved while the application runs are added in place.
+"""
+import json
+import os
+import unicodedata
+from bisect import bisect_left, insort
+from pathlib import Path
+
+from .reports import find_ledgers, iter_rows
+
+
+CHECKPOINT = ".stranke.json"
+
+# The recipient fields that are filled in from a client
+FIELDS = ('Naziv', 'Naslov', 'Davčna številka', 'Matična številka')
+
+
+def fold(text):
+    """'Rožle' -> 'rozle'"""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+class ClientIndex:
+    """Clients from all ledgers, with prefix lookups by name and tax number"""
+
+    def __init__(self, directory='.', checkpoint=CHECKPOINT):
+        self.directory = Path(directory)
+        self.checkpoint = self.directory / checkpoint
+        self.files = {}
+        self.clients = {}
+
+        if self.checkpoint.exists():
+            with open(self.checkpoint, 'r', encoding='utf-8') as fh:
+                state = json.load(fh)
+            self.files = state['files']
+            self.clients = state['clients']
+
+        self._names = sorted(
+            (fold(client['Naziv']), davcna)
+            for davcna, client in self.clients.items()
+            )
+        self._numbers = sorted(
+            (fold(davcna), davcna) for davcna in self.clients
+            )
+
+    def __len__(self):
+        return len(self.clients)
+
+    def add(self, record):
+        """Add or refresh the client of a record"""
+        davcna = record['Davčna številka'].strip()
+        if not davcna:
+            return
+
+        client = {key: str(record.get(key, '')) for key in FIELDS}
+        old = self.clients.get(davcna)
+        if old == client:
+            return
+
+        if old is None:
+            insort(self._numbers, (fold(davcna), davcna))
+        elif old['Naziv'] != client['Naziv']:
+            entry = (fold(old['Naziv']), davcna)
+            del self._names[bisect_left(self._names, entry)]
+        if old is None or old['Naziv'] != client['Naziv']:
+            insort(self._names, (fold(client['Naziv']), davcna))
+
+        self.clients[davcna] = client
+
+    def update(self):
+        """Read the rows appended to the ledgers since the last run"""
+        new_rows = 0
+
+        for path in find_ledgers(self.directory):
+            stat = path.stat()
+            state = self.files.get(path.name)
+
+            if (
+                state is None or
+                state['inode'] != stat.st_ino or
+                stat.st_size < state['offset']
+                ):
+                state = self.files[path.name] = {
+                    'inode': stat.st_ino, 'offset': 0, 'fieldnames': None,
+                    }
+
+            if stat.st_size == state['offset']:
+                continue
+
+            rows = iter_rows(path, state['offset'], state['fieldnames'])
+            for record, offset, fieldnames in rows:
+                state['offset'] = offset
+                state['fieldnames'] = fieldnames
+                if record is not None:
+                    self.add(record)
+                    new_rows += 1
+
+        if new_rows:
+            self._save()
+        return new_rows
+
+    def _save(self):
+        tmp = self.checkpoint.with_name(self.checkpoint.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(
+                {'files': self.files, 'clients': self.clients},
+                fh, ensure_ascii=False
+                )
+        os.replace(tmp, self.checkpoint)
+
+    @staticmethod
+    def _scan(keys, prefix):
+        index = bisect_left(keys, (prefix,))
+        while index < len(keys) and keys[index][0].startswith(prefix):
+            yield keys[index][1]
+            index += 1
+
+    def lookup(self, prefix, limit=10):
+        """Clients whose name or tax number starts with prefix"""
+        prefix = fold(prefix.strip())
+        if not prefix:
+            return []
+
+        # A dict keeps the order and drops clients found twice
+        found = {}
+        for keys in (self._names, self._numbers):
+            for davcna in self._scan(keys, prefix):
+                if len(found) == limit:
+                    break
+                found[davcna] = None
+
+        return [self.clients[davcna] for davcna in found]
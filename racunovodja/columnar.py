@@ -0,0 +1,335 @@
+"""Columnar, memory-mapped sidecar of a yearly ledger.
+
+Next to knjiga_racunov_<year>.csv a binary knjiga_racunov_<year>.csv.cols
+is kept, with one array per field of CSVModel.fields:
+
+    decimal      int64 cents
+    date_string  int32 ordinal day (date.toordinal())
+    integer      int64, -1 when empty
+    other        int32 id into a per-column dictionary of strings
+
+The due dates are also stored sorted, with running sums of Znesek in
+the same order, so the sum past 'Datum zapadlosti' is a binary search.
+
+The file is memory-mapped and the columns are read in place. If numpy
+is installed (it is optional) the columns are numpy arrays and filters
+and sums are vectorized; otherwise they are plain memoryviews.
+
+The sidecar remembers the size and mtime of the CSV it was built from
+and is rebuilt as soon as they change. Columns handed out stay valid
+after a refresh or close, as a snapshot of the ledger when they were
+taken; the old mapping is released once they are dropped.
+"""
+import json
+import mmap
+import operator
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from itertools import compress, repeat
+from datetime import date, datetime
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .constants import FieldTypes as FT
+from .models import LedgerModel
+from .reports import format_cents, iter_rows, to_cents
+
+
+MAGIC = b'RACCOL02'
+PREAMBLE = struct.Struct('<8sQ')
+
+codes = {
+    FT.decimal: 'q',
+    FT.date_string: 'i',
+    FT.integer: 'q',
+    }
+STRING_CODE = 'i'
+
+# Due dates in ascending order, and the running sum of Znesek over them
+DUE_DATES = '#zapadlost'
+DUE_TOTALS = '#zapadlost_vsota'
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+    }
+
+
+def _ordinal(value):
+    return datetime.strptime(value, '%d.%m.%Y').toordinal()
+
+
+def _integer(value):
+    return int(value) if value.isdigit() else -1
+
+
+class ColumnarLedger:
+    """Read-only columnar view of one yearly CSV ledger"""
+
+    fields = LedgerModel.fields
+
+    def __init__(self, source):
+        self.source = Path(source)
+        self.sidecar = self.source.with_name(self.source.name + '.cols')
+        self.rows = 0
+        self._mmap = None
+        self._columns = {}
+        self._dictionaries = {}
+        self.refresh()
+
+    def _stamp(self):
+        stat = self.source.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _read_header(self):
+        with open(self.sidecar, 'rb') as fh:
+            magic, length = PREAMBLE.unpack(fh.read(PREAMBLE.size))
+            if magic != MAGIC:
+                return None
+            return json.loads(fh.read(length))
+
+    def refresh(self):
+        """Rebuild the sidecar if the CSV changed, then map it"""
+        header = self._read_header() if self.sidecar.exists() else None
+
+        if header is None or header['source'] != self._stamp():
+            self.close()
+            self.build()
+            header = self._read_header()
+        elif self._mmap is not None:
+            return
+
+        self.close()
+        with open(self.sidecar, 'rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.rows = header['rows']
+        self._dictionaries = header['dictionaries']
+        self._columns = {}
+        for name, (code, offset) in header['columns'].items():
+            self._columns[name] = self._view(code, offset)
+
+    def _view(self, code, offset):
+        size = array(code).itemsize
+        if np is not None:
+            return np.frombuffer(
+                self._mmap, dtype=np.dtype(code), count=self.rows,
+                offset=offset)
+        view = memoryview(self._mmap)[offset:offset + size * self.rows]
+        return view.cast(code)
+
+    def close(self):
+        self._columns = {}
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A caller still holds a column, the mapping is closed
+                # when the last of them is released
+                pass
+            self._mmap = None
+
+    def build(self):
+        """Stream the CSV once and write all the columns"""
+        stamp = self._stamp()
+        columns = {}
+        dictionaries = {}
+        ids = {}
+
+        for key, spec in self.fields.items():
+            if spec['type'] in codes:
+                columns[key] = array(codes[spec['type']])
+            else:
+                columns[key] = array(STRING_CODE)
+                dictionaries[key] = []
+                ids[key] = {}
+
+        rows = 0
+        for record, _, _ in iter_rows(self.source):
+            if record is None:
+                continue
+            rows += 1
+
+            for key, spec in self.fields.items():
+                value = record.get(key, '')
+                kind = spec['type']
+
+                if kind == FT.decimal:
+                    columns[key].append(to_cents(value))
+                elif kind == FT.date_string:
+                    columns[key].append(_ordinal(value))
+                elif kind == FT.integer:
+                    columns[key].append(_integer(value))
+                else:
+                    known = ids[key]
+                    if value not in known:
+                        known[value] = len(dictionaries[key])
+                        dictionaries[key].append(value)
+                    columns[key].append(known[value])
+
+        order = sorted(
+            range(rows), key=columns['Datum zapadlosti'].__getitem__)
+        columns[DUE_DATES] = array(
+            'i', (columns['Datum zapadlosti'][i] for i in order))
+        columns[DUE_TOTALS] = running = array('q')
+        total = 0
+        for i in order:
+            total += columns['Znesek'][i]
+            running.append(total)
+
+        # Lay the columns out after the header, 8-byte aligned
+        layout = {}
+        offset = 0
+        for key, values in columns.items():
+            layout[key] = [values.typecode, offset]
+            offset += len(values) * values.itemsize
+            offset += -offset % 8
+
+        def encode(base):
+            header = {
+                'source': stamp,
+                'rows': rows,
+                'columns': {
+                    key: [code, base + start]
+                    for key, (code, start) in layout.items()
+                    },
+                'dictionaries': dictionaries,
+                }
+            return json.dumps(header, ensure_ascii=False).encode('utf-8')
+
+        # The header length depends on the offsets it contains
+        base = PREAMBLE.size + len(encode(0))
+        while True:
+            base += -base % 8
+            encoded = encode(base)
+            if PREAMBLE.size + len(encoded) <= base:
+                break
+            base = PREAMBLE.size + len(encoded)
+
+        tmp = self.sidecar.with_name(self.sidecar.name + '.tmp')
+        with open(tmp, 'wb') as fh:
+            fh.write(PREAMBLE.pack(MAGIC, len(encoded)))
+            fh.write(encoded)
+            fh.write(b'\0' * (base - fh.tell()))
+            for key, values in columns.items():
+                fh.write(values.tobytes())
+                fh.write(b'\0' * (-fh.tell() % 8))
+        os.replace(tmp, self.sidecar)
+
+    def column(self, key):
+        return self._columns[key]
+
+    def value(self, key, row):
+        """The original text value of one cell"""
+        kind = self.fields[key]['type']
+        raw = self._columns[key][row]
+        if kind == FT.decimal:
+            return format_cents(int(raw))
+        if kind == FT.date_string:
+            return date.fromordinal(int(raw)).strftime('%d.%m.%Y')
+        if kind == FT.integer:
+            return '' if raw < 0 else str(raw)
+        return self._dictionaries[key][raw]
+
+    def _encode(self, key, value):
+        """Translate a query value to the stored representation"""
+        kind = self.fields[key]['type']
+        if kind == FT.date_string:
+            if isinstance(value, (date, datetime)):
+                return value.toordinal()
+            return _ordinal(value)
+        if kind == FT.decimal:
+            return to_cents(value) if isinstance(value, str) else value
+        if kind == FT.integer:
+            return int(value)
+        try:
+            return self._dictionaries[key].index(value)
+        except ValueError:
+            return -1
+
+    def where(self, key, op, value):
+        """A row mask: column <op> value"""
+        compare = OPERATORS[op]
+        column = self._columns[key]
+        value = self._encode(key, value)
+
+        if np is not None:
+            return compare(column, value)
+        return list(map(compare, column, repeat(value)))
+
+    @staticmethod
+    def both(mask, other):
+        if np is not None:
+            return mask & other
+        return list(map(operator.and_, mask, other))
+
+    def count(self, mask=None):
+        if mask is None:
+            return self.rows
+        if np is not None:
+            return int(np.count_nonzero(mask))
+        return sum(mask)
+
+    def sum(self, key, mask=None):
+        """Sum of a numeric column, e.g. 'Znesek' in cents"""
+        column = self._columns[key]
+        if np is not None:
+            return int(column.sum() if mask is None else column[mask].sum())
+        if mask is None:
+            return sum(column)
+        return sum(compress(column, mask))
+
+    def group_sum(self, key, by, mask=None):
+        """{text value of by: sum of key}"""
+        column = self._columns[key]
+        groups = self._columns[by]
+
+        if np is not None:
+            if mask is not None:
+                column, groups = column[mask], groups[mask]
+            totals = np.bincount(
+                groups, weights=column,
+                minlength=len(self._dictionaries[by]))
+            return {
+                name: int(total)
+                for name, total in zip(self._dictionaries[by], totals)
+                if total
+                }
+
+        totals = {}
+        for i, (item, group) in enumerate(zip(column, groups)):
+            if mask is None or mask[i]:
+                name = self._dictionaries[by][group]
+                totals[name] = totals.get(name, 0) + item
+        return totals
+
+    def overdue(self, as_of=None, paid=None):
+        """Cents past 'Datum zapadlosti' on as_of, without the paid rows"""
+        as_of = as_of or date.today()
+        if paid is None:
+            due = self._encode('Datum zapadlosti', as_of)
+            past = bisect_left(self._columns[DUE_DATES], due)
+            return int(self._columns[DUE_TOTALS][past - 1]) if past else 0
+
+        mask = self.where('Datum zapadlosti', '<', as_of)
+        if np is not None:
+            mask = mask & ~np.asarray(paid, dtype=bool)
+        else:
+            mask = [a and not b for a, b in zip(mask, paid)]
+        return self.sum('Znesek', mask)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,389 @@
+"""e-SLOG 2.0 e-invoices (XML), written next to the PDF invoices.
+
+Usage:
+    python -m racunovodja.eslog 01.01.2023 31.12.2023 [--pdf]
+        [--out DIR] [--workers N] [--profile NAME] [--directory DIR]
+
+Every invoice issued in the date range gets its own
+eracun_st_<sifra>_<opomba>.xml file. With --pdf, the PDFs are rendered
+on a process pool at the same time, while the XML files are written by
+the main process, so the XML output adds next to nothing to the run.
+
+The XML is written element by element with an incremental writer and
+the records are streamed from the ledgers, so a whole year is exported
+with bounded memory. The document covers the segments this application
+has data for: header, dates, issuer and buyer, bank account and payment
+reference, the line items with their discounts and VAT (a record
+without 'Postavke' is one VAT exempt item, see 94. člen ZDDV-1) and the
+totals.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from xml.sax.saxutils import XMLGenerator
+
+from .items import HUNDRED, UNIT, LineItem, format_decimal, has_items
+from .items import iter_items
+from .layout import VAT_EXEMPTION
+from .numbering import format_sifra
+from .profiles import get_profile
+from .reports import format_cents, iter_records, to_cents
+
+
+NAMESPACE = "urn:eslog:2.00"
+
+COUNTRIES = {
+    'SLOVENIA': 'SI', 'SLOVENIJA': 'SI', 'AUSTRIA': 'AT', 'AVSTRIJA': 'AT',
+    'CROATIA': 'HR', 'HRVAŠKA': 'HR', 'HRVATSKA': 'HR', 'ITALY': 'IT',
+    'ITALIJA': 'IT', 'HUNGARY': 'HU', 'MADŽARSKA': 'HU', 'GERMANY': 'DE',
+    'NEMČIJA': 'DE',
+    }
+# VAT number prefixes that differ from the ISO 3166 code of the country
+VAT_PREFIXES = {'EL': 'GR', 'XI': 'GB'}
+# UN/ECE Rec. 20 codes of the usual units, pieces otherwise
+UNITS = {
+    'ura': 'HUR', 'h': 'HUR', 'dan': 'DAY', 'kg': 'KGM', 'm': 'MTR',
+    'km': 'KMT', 'l': 'LTR', 'mes': 'MON',
+    }
+
+# Renders in flight at most, per worker, during a bulk export
+WINDOW = 4
+
+
+class Writer:
+    """Writes nested elements straight to a file, nothing is kept"""
+
+    def __init__(self, fh):
+        self.xml = XMLGenerator(fh, encoding='utf-8', short_empty_elements=True)
+
+    @contextmanager
+    def group(self, name, **attrs):
+        self.xml.startElement(name, attrs)
+        yield self
+        self.xml.endElement(name)
+
+    def element(self, name, text):
+        self.xml.startElement(name, {})
+        self.xml.characters(str(text))
+        self.xml.endElement(name)
+
+    def elements(self, group, **values):
+        """<group><D_xxxx>value</D_xxxx>...</group>"""
+        with self.group(group):
+            for name, value in values.items():
+                if value not in ('', None):
+                    self.element(name, value)
+
+
+def _iso(date):
+    return datetime.strptime(date, '%d.%m.%Y').strftime('%Y-%m-%d')
+
+
+def _amount(cents):
+    """12345 -> '123.45'"""
+    return format_cents(cents).replace(',', '.')
+
+
+def _country(name):
+    return COUNTRIES.get(name.upper(), name.upper()[:2])
+
+
+def _buyer_country(davcna_stevilka, drzava=''):
+    """The country of a buyer, from the prefix of its VAT number.
+
+    Numbers without one are Slovenian, unless the address ends in a
+    country ('Ulica 1, 1000 Kraj, Država').
+    """
+    prefix = davcna_stevilka.strip()[:2].upper()
+    if prefix.isascii() and prefix.isalpha():
+        return VAT_PREFIXES.get(prefix, prefix)
+    return _country(drzava) if drzava else 'SI'
+
+
+def _number(value):
+    """Decimal('2.50') -> '2.5'"""
+    return format_decimal(value).replace(',', '.')
+
+
+def _items(record):
+    """The LineItems of a record; one VAT exempt item without 'Postavke'"""
+    if has_items(record):
+        return iter_items(record)
+    cena = Decimal(to_cents(record['Znesek'])) / HUNDRED
+    return iter([LineItem(
+        record['Opis storitve'], Decimal(1), UNIT, cena, Decimal(0),
+        Decimal(0))])
+
+
+def _write_tax(w, rate):
+    with w.group('S_TAX'):
+        w.element('D_5283', '7')
+        w.elements('C_C241', D_5153='VAT')
+        w.elements('C_C243', D_5278=_number(rate))
+        w.element('D_5305', 'S' if rate else 'E')
+
+
+def _write_item(w, number, item):
+    """G_SG26 of one line item"""
+    with w.group('G_SG26'):
+        with w.group('S_LIN'):
+            w.element('D_1082', str(number))
+        with w.group('S_IMD'):
+            w.element('D_7077', 'F')
+            w.elements('C_C273', D_7008=item.opis)
+        with w.group('S_QTY'):
+            w.elements(
+                'C_C186', D_6063='47', D_6060=_number(item.kolicina),
+                D_6411=UNITS.get(item.em.lower(), 'H87'))
+        for code, cents in (('203', item.osnova), ('38', item.skupaj)):
+            with w.group('G_SG27'), w.group('S_MOA'):
+                w.elements('C_C516', D_5025=code, D_5004=_amount(cents))
+        # Net unit price, after the discount
+        cena = item.cena * (HUNDRED - item.popust) / HUNDRED
+        with w.group('G_SG29'), w.group('S_PRI'):
+            w.elements(
+                'C_C509', D_5125='AAA',
+                D_5118=format_decimal(cena, 2).replace(',', '.'))
+        with w.group('G_SG34'):
+            _write_tax(w, item.ddv)
+            with w.group('S_MOA'):
+                w.elements(
+                    'C_C516', D_5025='125', D_5004=_amount(item.osnova))
+        if item.popust:
+            with w.group('G_SG39'):
+                with w.group('S_ALC'):
+                    w.element('D_5463', 'A')
+                with w.group('G_SG41'), w.group('S_PCD'):
+                    w.elements(
+                        'C_C501', D_5245='1', D_5482=_number(item.popust))
+                with w.group('G_SG42'), w.group('S_MOA'):
+                    w.elements(
+                        'C_C516', D_5025='204',
+                        D_5004=_amount(item.znesek_popusta))
+
+
+def get_filename(record, profile=None):
+    profile = profile or get_profile()
+    sifra = format_sifra(
+        profile['name'], record['Št. računa'], record.get('Datum izdaje'))
+    return f"eracun_st_{sifra}_{record.get('Opomba', '')}.xml"
+
+
+def write_invoice(fh, record, profile=None):
+    """Write the e-SLOG document of one record to a binary file"""
+    profile = profile or get_profile()
+    sifra = format_sifra(
+        profile['name'], record['Št. računa'], record['Datum izdaje'])
+    ulica, kraj, drzava = (record['Naslov'].split(', ', 2) + ['', ''])[:3]
+    posta, _, mesto = kraj.partition(' ')
+
+    # The totals come first, the items are then written one at a time;
+    # both passes read the items lazily
+    net = ddv = skupaj = 0
+    rates = {}
+    for item in _items(record):
+        net += item.osnova
+        ddv += item.znesek_ddv
+        skupaj += item.skupaj
+        base, tax = rates.get(item.ddv, (0, 0))
+        rates[item.ddv] = (base + item.osnova, tax + item.znesek_ddv)
+
+    w = Writer(fh)
+    w.xml.startDocument()
+    with w.group('Invoice', xmlns=NAMESPACE), w.group('M_INVOIC', Id='data'):
+        with w.group('S_UNH'):
+            w.element('D_0062', sifra)
+            w.elements(
+                'C_S009', D_0065='INVOIC', D_0052='D', D_0054='01B',
+                D_0051='UN')
+        with w.group('S_BGM'):
+            w.elements('C_C002', D_1001='380')
+            w.elements('C_C106', D_1004=sifra)
+
+        # Issue and service dates
+        for code, key in (
+            ('137', 'Datum izdaje'), ('35', 'Datum opravljene storitve'),
+            ):
+            with w.group('S_DTM'):
+                w.elements('C_C507', D_2005=code, D_2380=_iso(record[key]))
+
+        if 0 in rates:
+            with w.group('S_FTX'):
+                w.element('D_4451', 'AAI')
+                w.elements('C_C108', D_4440=VAT_EXEMPTION)
+        if record.get('Opomba'):
+            with w.group('S_FTX'):
+                w.element('D_4451', 'GEN')
+                w.elements('C_C108', D_4440=record['Opomba'])
+
+        # Payment reference, as printed on the invoice
+        with w.group('G_SG1'), w.group('S_RFF'):
+            w.elements('C_C506', D_1153='PQ', D_1154=f"SI00 {sifra[2:]}")
+
+        with w.group('G_SG2'):
+            with w.group('S_NAD'):
+                w.element('D_3035', 'II')
+                w.elements('C_C080', D_3036=profile['name'])
+                w.elements('C_C059', D_3042=profile['street'])
+                w.element('D_3164', profile['city'])
+                w.element('D_3251', profile['post_nr'])
+                w.element('D_3207', _country(profile['country']))
+            with w.group('S_FII'):
+                w.element('D_3035', 'RB')
+                w.elements('C_C078', D_3194=profile['iban'].replace(' ', ''))
+                w.elements(
+                    'C_C088', D_3433=profile['bic'], D_3436=profile['bank'])
+            with w.group('G_SG3'), w.group('S_RFF'):
+                w.elements('C_C506', D_1153='VA', D_1154=profile['tax_nr'])
+
+        with w.group('G_SG2'):
+            with w.group('S_NAD'):
+                w.element('D_3035', 'BY')
+                w.elements('C_C080', D_3036=record['Naziv'])
+                w.elements('C_C059', D_3042=ulica)
+                w.element('D_3164', mesto)
+                w.element('D_3251', posta)
+                w.element('D_3207', _buyer_country(
+                    record['Davčna številka'], drzava))
+            with w.group('G_SG3'), w.group('S_RFF'):
+                w.elements(
+                    'C_C506', D_1153='VA', D_1154=record['Davčna številka'])
+            if record.get('Matična številka'):
+                with w.group('G_SG3'), w.group('S_RFF'):
+                    w.elements(
+                        'C_C506', D_1153='0199',
+                        D_1154=record['Matična številka'])
+
+        with w.group('G_SG7'), w.group('S_CUX'):
+            w.elements('C_C504_1', D_6347='2', D_6345='EUR')
+
+        with w.group('G_SG8'):
+            with w.group('S_PAT'):
+                w.element('D_4279', '1')
+            with w.group('S_DTM'):
+                w.elements(
+                    'C_C507', D_2005='13',
+                    D_2380=_iso(record['Datum zapadlosti']))
+            with w.group('S_PAI'):
+                w.elements('C_C534', D_4461='58')
+
+        for number, item in enumerate(_items(record), start=1):
+            _write_item(w, number, item)
+
+        with w.group('S_UNS'):
+            w.element('D_0081', 'S')
+
+        # Line items, tax base, VAT, total and amount due
+        for code, cents in (
+            ('79', net), ('389', net), ('176', ddv), ('388', skupaj),
+            ('9', skupaj),
+            ):
+            with w.group('G_SG50'), w.group('S_MOA'):
+                w.elements('C_C516', D_5025=code, D_5004=_amount(cents))
+
+        for rate, (base, tax) in sorted(rates.items()):
+            with w.group('G_SG52'):
+                _write_tax(w, rate)
+                for code, cents in (('125', base), ('124', tax)):
+                    with w.group('S_MOA'):
+                        w.elements(
+                            'C_C516', D_5025=code, D_5004=_amount(cents))
+    w.xml.endDocument()
+
+
+def export_record(record, profile=None, directory='.'):
+    """Write the e-invoice of a record to its file, returns the path.
+
+    profile is the name of the issuer profile, the active one by default.
+    """
+    profile = get_profile(profile)
+    path = Path(directory) / get_filename(record, profile)
+
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as fh:
+        write_invoice(fh, record, profile)
+    os.replace(tmp, path)
+    return path
+
+
+def export_range(records, directory='.', profile=None, pdf=False,
+    workers=None):
+    """Write the e-invoices of records, and with pdf render their PDFs.
+
+    Returns (xml paths, pdf filenames, [(record, error)]).
+    """
+    from .batch import render_record
+
+    written = []
+    rendered = []
+    failed = []
+    workers = workers or os.cpu_count() or 1
+
+    def collect(done):
+        for future in done:
+            record = futures.pop(future)
+            try:
+                rendered.append(future.result()[0])
+            except Exception as e:
+                failed.append((record, e))
+
+    futures = {}
+    pool = ProcessPoolExecutor(max_workers=workers) if pdf else None
+    try:
+        for record in records:
+            if pool is not None:
+                future = pool.submit(render_record, record, profile)
+                futures[future] = record
+            # Written while the workers render, and never more than a
+            # few records are held
+            written.append(export_record(record, profile, directory))
+            if len(futures) >= workers * WINDOW:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(futures).done)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return written, rendered, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.eslog',
+        description="Izvoz e-računov (e-SLOG 2.0) za izbrano obdobje.")
+    parser.add_argument('od', help="first issue date, dd.mm.yyyy")
+    parser.add_argument('do', help="last issue date, dd.mm.yyyy")
+    parser.add_argument('--out', default='.',
+        help="directory for the .xml files")
+    parser.add_argument('--pdf', action='store_true',
+        help="render the PDFs at the same time")
+    parser.add_argument('--workers', type=int, default=None,
+        help="number of render processes (default: all cores)")
+    parser.add_argument('--profile', default=None,
+        help="issuer profile (default: settings.profile)")
+    parser.add_argument('--directory', default=None,
+        help="ledger directory (default: that of the profile)")
+    args = parser.parse_args(argv)
+
+    directory = args.directory or get_profile(args.profile).get('directory', '.')
+    Path(args.out).mkdir(parents=True, exist_ok=True)
+    records = iter_records(args.od, args.do, directory)
+    written, rendered, failed = export_range(
+        records, args.out, args.profile, args.pdf, args.workers)
+
+    for record, error in failed:
+        print(
+            f"Račun št. {record['Št. računa']} ni bil izrisan: {error}",
+            file=sys.stderr)
+    print(f"e-računov: {len(written)}, izrisanih: {len(rendered)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
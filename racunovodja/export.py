@@ -0,0 +1,145 @@
+"""Export many invoices of the ledger into one PDF, e.g. for the accountant.
+
+Usage:
+    python -m racunovodja.export 01.04.2023 30.04.2023 [--out FILE]
+        [--directory DIR] [--per-file N] [--profile NAME]
+
+Every invoice issued in the date range gets its own pages, numbered
+from 1, and a bookmark in the outline. The font, logo and signature are
+embedded once per file. Records are streamed from the ledgers, but a
+PDF is held in memory until it is written, so an export of more than
+--per-file invoices (500 by default) is split into numbered files,
+<out>_001.pdf, <out>_002.pdf, ..., to keep memory bounded. --per-file 0
+writes a single file, with memory growing with the number of invoices.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from .pdf import PDFModel
+from .profiles import get_profile
+from .reports import iter_records
+
+
+# Invoices per file by default, about a megabyte of PDF
+PER_FILE = 500
+
+class BundlePDF(PDFModel):
+    """Many invoices in one document, each with its own page numbers"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+        # Each invoice gets its own page count placeholder, {nb} is unused
+        self.alias_nb_pages(None)
+        self.invoices = []
+        self._starting = False
+        self._closing = False
+
+    def header(self):
+        # The footer of the previous invoice is already drawn by now
+        if self._starting:
+            self._starting = False
+            if self.invoices:
+                self._finish(self.page - 1)
+            self.invoices.append((f"{{nb{len(self.invoices)}}}", self.page))
+            self.start_section(f"Račun št. {self.get_sifra_racuna()}")
+        super().header()
+
+    def footer(self):
+        alias, first = self.invoices[-1]
+        self.set_y(-15)
+        self.set_font("helvetica", "I", 8)
+        self.set_text_color(128)
+        self.cell(0, 10, f"Page {self.page - first + 1}/{alias}", align="C")
+        if self._closing:
+            self._finish(self.page)
+
+    def add_invoice(self, data):
+        """Append one ledger record, with its own issue and due dates"""
+        self.st_racuna = data['Št. računa']
+        self.datum_izdaje = data['Datum izdaje']
+        self._starting = True
+        self.render(data)
+
+    def _finish(self, last):
+        """Fill in the page count of the latest invoice, ending on last"""
+        alias, first = self.invoices[-1]
+        count = str(last - first + 1).encode('latin-1')
+        alias = alias.encode('latin-1')
+        for page in range(first, last + 1):
+            contents = self.pages[page].contents
+            self.pages[page].contents = contents.replace(alias, count)
+
+    def output(self, *args, **kwargs):
+        # The last footer is drawn by output itself
+        self._closing = True
+        return super().output(*args, **kwargs)
+
+
+def export(records, out, per_file=PER_FILE, profile=None):
+    """Write records into one PDF, or one per per_file records.
+
+    The files are numbered only when there is more than one; a falsy
+    per_file puts everything into out. The invoices are issued by
+    profile, the active one by default. Returns the list of written
+    files.
+    """
+    out = Path(out)
+    written = []
+    pdf = None
+
+    def flush(numbered):
+        if numbered:
+            path = out.with_name(f"{out.stem}_{len(written) + 1:03d}{out.suffix}")
+        else:
+            path = out
+        pdf.output(str(path))
+        written.append(path)
+
+    for record in records:
+        # A full file is written once another record shows it is not
+        # the last one
+        if per_file and pdf is not None and len(pdf.invoices) >= per_file:
+            flush(numbered=True)
+            pdf = None
+        if pdf is None:
+            pdf = BundlePDF(profile=profile)
+        pdf.add_invoice(record)
+
+    if pdf is not None:
+        flush(numbered=bool(written))
+
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.export',
+        description="Izvoz računov iz knjige v eno .pdf datoteko.")
+    parser.add_argument('od', help="first issue date, dd.mm.yyyy")
+    parser.add_argument('do', help="last issue date, dd.mm.yyyy")
+    parser.add_argument('--out', default=None)
+    parser.add_argument('--directory', default=None,
+        help="ledger directory (default: that of the profile)")
+    parser.add_argument('--per-file', type=int, default=PER_FILE,
+        help=f"start a new file after this many invoices (default: "
+             f"{PER_FILE}, 0 for a single file)")
+    parser.add_argument('--profile', default=None,
+        help="issuer profile (default: settings.profile)")
+    args = parser.parse_args(argv)
+
+    profile = get_profile(args.profile)
+    directory = args.directory or profile.get('directory', '.')
+    out = args.out or f"racuni_{args.od}-{args.do}.pdf"
+    records = iter_records(args.od, args.do, directory)
+    written = export(records, out, args.per_file, profile)
+
+    if not written:
+        print("V izbranem obdobju ni računov.")
+    for path in written:
+        print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
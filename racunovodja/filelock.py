@@ -0,0 +1,64 @@
+"""An exclusive lock on a file, shared between processes"""
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Blocks until no other process holds the same lock file.
+
+    Used as a context manager. The lock is not reentrant, so a process
+    must not take the same lock twice.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fh = None
+
+    def acquire(self):
+        self._fh = open(self.path, 'a+b')
+
+        if fcntl:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    self._fh.seek(0)
+                    msvcrt.locking(self._fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 seconds, keep waiting
+                    continue
+
+    def release(self):
+        if fcntl:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        else:
+            self._fh.seek(0)
+            msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+        self._fh.close()
+        self._fh = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+
+def fsync_dir(path):
+    """Make a created, renamed or deleted directory entry durable"""
+    if os.name != 'posix':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
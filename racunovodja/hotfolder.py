@@ -0,0 +1,528 @@
+"""Hot folder: order files dropped into a directory become invoices.
+
+Usage:
+    python -m racunovodja.hotfolder narocila [--workers N] [--poll]
+        [--processed DIR] [--failed DIR] [--profile NAME]
+
+Every .json or .csv file that appears in the folder holds one or more
+records, as for batch invoicing. A file is claimed by renaming it into
+the hidden .obdelava subfolder, so it is picked up by exactly one
+process, however many watch the folder. Its records are validated,
+numbered, booked in the ledger of the profile and rendered on a process
+pool. The file is then moved to obdelano/, or to napake/ together with a
+.napaka.txt file with the reason, when it is invalid or a PDF failed.
+Only invoices issued in the current year are booked; the ledger of a
+new year is opened once it begins.
+
+New files are noticed with inotify on Linux and by listing the folder
+every POLL seconds elsewhere (or with --poll, e.g. on network shares,
+where inotify does not see files written by other machines). Producers
+should write a file elsewhere and move it in, or at least close it
+promptly: a listed file is only taken once its size and time stayed the
+same over two listings.
+
+Claiming is separate from booking: a thread claims the files as they
+arrive, while the claimed files are booked a group at a time with a
+single commit, and the renders run on at most --workers processes. A
+burst of files is thus picked up right away and queued, instead of
+waiting for the invoices before it.
+
+The invoice numbers of a file are written next to it before it is
+booked. A file left in .obdelava by a process that stopped is finished
+on the next start: if its numbers are in the ledger it is only rendered
+again, otherwise booked with the same numbers, so nothing is booked
+twice.
+"""
+import argparse
+import csv
+import json
+import os
+import queue
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _libc.inotify_init1
+except (ImportError, OSError, AttributeError):
+    _libc = None
+
+from .batch import assign_numbers, load_records, render_record
+from .filelock import fsync_dir
+from .models import DuplicateInvoiceError, InvoiceYearError
+from .numbering import InvoiceNumberAllocator, number_key
+from .profiles import get_profile, open_year
+from .validation import get_validator
+from . import settings as s
+
+
+SUFFIXES = ('.json', '.csv')
+CLAIMED = '.obdelava'
+PROCESSED = 'obdelano'
+FAILED = 'napake'
+
+# Seconds between listings of the folder, when polling
+POLL = 0.2
+# Seconds between listings with inotify, for the files it cannot see
+RESCAN = 2.0
+# Files booked with one commit at most
+COMMIT_BATCH = 32
+# Renders queued at most, per worker
+WINDOW = 2
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+EVENT = struct.Struct('iIII')
+
+
+def is_order(name):
+    """Order files are .json or .csv, hidden and temporary files are not"""
+    return not name.startswith('.') and name.lower().endswith(SUFFIXES)
+
+
+class PollingWatcher:
+    """Finds the order files by listing the folder"""
+
+    def __init__(self, directory, interval=POLL):
+        self.directory = Path(directory)
+        self.interval = interval
+        self._seen = {}
+
+    def scan(self):
+        """Names of the files unchanged since the previous scan"""
+        current = {}
+        ready = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not is_order(entry.name) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                current[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                if self._seen.get(entry.name) == current[entry.name]:
+                    ready.append(entry.name)
+        self._seen = current
+        return ready
+
+    def wait(self):
+        """Names of the files that may be ready, after at most interval"""
+        time.sleep(self.interval)
+        return self.scan()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(PollingWatcher):
+    """Reports files as soon as they are closed or moved into the folder"""
+
+    def __init__(self, directory, interval=RESCAN):
+        super().__init__(directory, interval)
+        self.fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        watch = _libc.inotify_add_watch(
+            self.fd, os.fsencode(self.directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if watch < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch")
+        self._rescan = time.monotonic() + interval
+
+    def wait(self, timeout=POLL):
+        now = time.monotonic()
+        if now >= self._rescan:
+            self._rescan = now + self.interval
+            return self.scan()
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        names = []
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, the next call lists the folder
+                self._rescan = 0
+            elif name:
+                name = os.fsdecode(name)
+                if is_order(name):
+                    names.append(name)
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+def get_watcher(directory, poll=False):
+    """An InotifyWatcher where inotify works, a PollingWatcher otherwise"""
+    if not poll and _libc is not None:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directory)
+
+
+class Order:
+    """A claimed file and its records, until all of them are rendered"""
+
+    def __init__(self, path, claimed, latency=0.0):
+        self.path = path
+        # When the file was claimed, and how long after it arrived
+        self.claimed = claimed
+        self.latency = latency
+        self.records = []
+        self.pending = 0
+        self.errors = []
+
+    @property
+    def name(self):
+        """The name the file was dropped with"""
+        return self.path.name.split('-', 1)[1]
+
+    @property
+    def marker(self):
+        return self.path.with_name(f".{self.path.name}.stevilke")
+
+
+class HotFolder:
+    """Turns the order files dropped into a folder into invoices"""
+
+    def __init__(
+        self, inbox, processed=None, failed=None, profile=None,
+        workers=None, poll=False, model=None, allocator=None, log=None
+        ):
+        self.inbox = Path(inbox)
+        self.claimed = self.inbox / CLAIMED
+        self.processed = Path(processed or self.inbox / PROCESSED)
+        self.failed = Path(failed or self.inbox / FAILED)
+        for directory in (self.claimed, self.processed, self.failed):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        # Workers get the name, also when they do not inherit the settings
+        self.profile = profile or s.profile
+        self.issuer = get_profile(self.profile)
+        # A ledger that is not given moves on to the new year with the
+        # calendar, the folder is watched past New Year
+        self._renews = model is None
+        if model is None:
+            model, allocator = open_year(self.issuer)
+        self.model = model
+        self.allocator = allocator or InvoiceNumberAllocator(
+            self.issuer['name'], model=self.model,
+            directory=self.issuer.get('directory', '.'))
+
+        self.workers = workers or os.cpu_count() or 1
+        self.poll = poll
+        self.log = log or print
+        self.counters = {'obdelane': 0, 'napake': 0, 'racuni': 0}
+
+        self._queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(self.workers * WINDOW)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pool = None
+
+    # Claiming
+
+    def claim(self, name):
+        """Move a dropped file into .obdelava, None if it is gone already"""
+        source = self.inbox / name
+        try:
+            # Moving a file in changes its ctime, writing it its mtime
+            stat = source.stat()
+            arrived = max(stat.st_mtime, stat.st_ctime)
+            # Unique, so a file dropped again with the same name is
+            # claimed as a new order
+            path = self.claimed / f"{time.time_ns()}-{name}"
+            os.rename(source, path)
+        except FileNotFoundError:
+            # Claimed by another process, or by an earlier event
+            return None
+
+        claimed = time.time()
+        return Order(path, claimed, max(0.0, claimed - arrived))
+
+    def _watch(self, watcher):
+        while not self._stop.is_set():
+            for name in watcher.wait():
+                order = self.claim(name)
+                if order is not None:
+                    self._queue.put(order)
+
+    def recover(self):
+        """Orders left in .obdelava by a process that stopped, oldest first"""
+        orders = []
+        for path in sorted(self.claimed.iterdir()):
+            if is_order(path.name):
+                orders.append(Order(path, time.time()))
+        return orders
+
+    # Booking
+
+    def _fail(self, order, message):
+        """Move an order to the failed folder, with the reason next to it"""
+        target = self._target(self.failed, order)
+        note = target.with_name(target.name + '.napaka.txt')
+        note.write_text(message + '\n', encoding='utf-8')
+        os.replace(order.path, target)
+        order.marker.unlink(missing_ok=True)
+        with self._lock:
+            self.counters['napake'] += 1
+        self.log(f"{order.name}: NAPAKA {message}")
+
+    def _target(self, directory, order):
+        """Where an order goes, under its own name unless that is taken"""
+        target = directory / order.name
+        if target.exists():
+            target = directory / order.path.name
+        return target
+
+    def _load(self, order):
+        """Read and validate the records of an order, False if it failed"""
+        try:
+            order.records = load_records(order.path)
+        except (
+            ValueError, csv.Error, TypeError, AttributeError, KeyError
+            ) as e:
+            self._fail(order, f"Datoteke ni možno prebrati: {e}")
+            return False
+        if not order.records:
+            self._fail(order, "Datoteka nima zapisov")
+            return False
+
+        report = get_validator().validate_many(
+            order.records, skip={'Št. računa'})
+        if report.errors:
+            self._fail(order, report.format())
+            return False
+        return True
+
+    def _read_marker(self, order):
+        try:
+            with open(order.marker, 'r', encoding='utf-8') as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_marker(self, order):
+        numbers = [record['Št. računa'] for record in order.records]
+        with open(order.marker, 'w', encoding='utf-8') as fh:
+            json.dump(numbers, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def book(self, orders):
+        """Validate, number and book a group of orders with one commit.
+
+        Returns the orders that were booked, or that were booked already
+        by a process that stopped before rendering them.
+        """
+        orders = [order for order in orders if self._load(order)]
+        if self._renews and self.model.year != datetime.today().year:
+            self.model.close()
+            self.model, self.allocator = open_year(self.issuer)
+
+        new = []
+        booked = []
+        for order in orders:
+            numbers = self._read_marker(order)
+            if numbers is not None and len(numbers) == len(order.records):
+                for record, stevilka in zip(order.records, numbers):
+                    record['Št. računa'] = stevilka
+                # Markers only hold numbers that were free when written,
+                # so all of them in the ledger means the order was booked
+                issued = self.model.duplicates(order.records)
+                if len(issued) == len(order.records):
+                    booked.append(order)
+                    continue
+            new.append(order)
+
+        # Numbers given in a file must not be issued yet, nor be given
+        # by another file of the group; checked before the markers are
+        # written, so a marker never holds the number of another invoice
+        fresh = []
+        given = set()
+        for order in new:
+            outside = self.model.outside_year(order.records)
+            if outside:
+                self._fail(
+                    order, str(InvoiceYearError(outside, self.model.year)))
+                continue
+            duplicates = self.model.duplicates(order.records) + [
+                record for record in order.records
+                if number_key(record['Št. računa']) in given
+                ]
+            if duplicates:
+                self._fail(order, str(DuplicateInvoiceError(duplicates)))
+                continue
+            given.update(
+                number_key(record['Št. računa'])
+                for record in order.records if record['Št. računa'])
+            fresh.append(order)
+        new = fresh
+
+        if new:
+            # One allocation for the whole group, in file order
+            assign_numbers(
+                [record for order in new for record in order.records],
+                self.allocator)
+            for order in new:
+                self._write_marker(order)
+            fsync_dir(self.claimed.resolve())
+
+            try:
+                with self.model.transaction() as transaction:
+                    for order in new:
+                        for record in order.records:
+                            transaction.add(record)
+            except (OSError, ValueError) as e:
+                for order in new:
+                    self._fail(order, f"Računov ni možno zapisati v knjigo: {e}")
+                return booked
+
+        return booked + new
+
+    # Rendering
+
+    def render(self, order):
+        """Queue the PDFs of a booked order, blocks while the pool is full"""
+        order.pending = len(order.records)
+        for record in order.records:
+            self._slots.acquire()
+            future = self._pool.submit(render_record, record, self.profile)
+            future.add_done_callback(
+                lambda future, order=order, record=record:
+                    self._rendered(order, record, future))
+
+    def _rendered(self, order, record, future):
+        self._slots.release()
+        error = future.exception()
+        with self._lock:
+            if error is not None:
+                order.errors.append(
+                    f"Račun št. {record['Št. računa']} ni bil izrisan: {error}")
+            order.pending -= 1
+            done = not order.pending
+        if done:
+            self._finish(order)
+
+    def _finish(self, order):
+        if order.errors:
+            # Booked all the same, see python -m racunovodja.regenerate
+            self._fail(order, "\n".join(order.errors))
+            return
+
+        os.replace(order.path, self._target(self.processed, order))
+        order.marker.unlink(missing_ok=True)
+        with self._lock:
+            self.counters['obdelane'] += 1
+            self.counters['racuni'] += len(order.records)
+        numbers = ', '.join(record['Št. računa'] for record in order.records)
+        self.log(
+            f"{order.name}: računi {numbers} "
+            f"(prevzem {order.latency * 1000:.0f} ms, "
+            f"obdelava {time.time() - order.claimed:.2f} s)")
+
+    # Running
+
+    def _next_group(self, timeout):
+        """Claimed orders waiting to be booked, up to COMMIT_BATCH"""
+        try:
+            orders = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(orders) < COMMIT_BATCH:
+            try:
+                orders.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return orders
+
+    def run(self):
+        """Watch the folder until stop() is called"""
+        watcher = get_watcher(self.inbox, self.poll)
+        for order in self.recover():
+            self._queue.put(order)
+        # Files dropped while nobody was watching, once they are complete
+        watcher.scan()
+        time.sleep(POLL)
+        for name in sorted(watcher.scan()):
+            order = self.claim(name)
+            if order is not None:
+                self._queue.put(order)
+
+        thread = threading.Thread(
+            target=self._watch, args=(watcher,), daemon=True)
+        # Ctrl+C stops the watching, the invoices being rendered are
+        # still finished
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=signal.signal,
+            initargs=(signal.SIGINT, signal.SIG_IGN))
+        thread.start()
+        try:
+            while not self._stop.is_set():
+                for order in self.book(self._next_group(POLL)):
+                    self.render(order)
+        finally:
+            self._stop.set()
+            thread.join()
+            watcher.close()
+            # Claimed files not booked yet are finished on the next start
+            self._pool.shutdown()
+
+    def stop(self):
+        self._stop.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.hotfolder',
+        description="Izdaja računov iz datotek, odloženih v mapo.")
+    parser.add_argument('inbox', help="folder to watch")
+    parser.add_argument('--processed', default=None,
+        help=f"folder for processed files (default: <inbox>/{PROCESSED})")
+    parser.add_argument('--failed', default=None,
+        help=f"folder for failed files (default: <inbox>/{FAILED})")
+    parser.add_argument('--workers', type=int, default=None,
+        help="number of render processes (default: all cores)")
+    parser.add_argument('--poll', action='store_true',
+        help="list the folder instead of using inotify")
+    parser.add_argument('--profile', default=None,
+        help="issuer profile (default: settings.profile)")
+    args = parser.parse_args(argv)
+
+    hotfolder = HotFolder(
+        args.inbox, args.processed, args.failed, args.profile,
+        args.workers, args.poll)
+    watcher = "polling" if args.poll or _libc is None else "inotify"
+    print(f"Spremljam {hotfolder.inbox} ({watcher}), Ctrl+C za konec")
+    try:
+        hotfolder.run()
+    except KeyboardInterrupt:
+        pass
+
+    counters = hotfolder.counters
+    print(
+        f"Obdelanih datotek: {counters['obdelane']}, "
+        f"računov: {counters['racuni']}, napak: {counters['napake']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""One-shot import of the yearly CSV ledgers into the SQLite ledger.
+
+Usage:
+    python -m racunovodja.importer knjiga_racunov_2023.csv [...] [--db FILE]
+"""
+import argparse
+import sys
+
+from .models import SQLModel
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.importer',
+        description="Uvoz knjig računov v SQLite bazo.")
+    parser.add_argument('files', nargs='+', help="yearly .csv ledgers")
+    parser.add_argument('--db', default="knjiga_racunov.db",
+        help="SQLite database file (default: knjiga_racunov.db)")
+    args = parser.parse_args(argv)
+
+    model = SQLModel(args.db)
+    for filename in args.files:
+        count = model.import_csv(filename)
+        if count:
+            print(f"{filename}: uvoženih {count} računov")
+        else:
+            print(f"{filename}: že uvoženo")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""Line items of an invoice, with totals in exact cents.
+
+A record may list its line items under 'Postavke', each item a dict of
+strings like the ledger fields:
+
+    {'Opis': 'Svetovanje', 'Količina': '2,5', 'EM': 'ura',
+     'Cena': '40,00', 'Popust': '10', 'DDV': '22'}
+
+Popust and DDV are percentages, EM, Popust and DDV may be left out.
+Every item is rounded to whole cents on its own (half up) and the totals
+are sums of the rounded items, so they always add up on the invoice.
+
+The ledger keeps one row per invoice, with the total as Znesek; the
+items are kept in a sidecar file next to it (see CSVModel), one row per
+item. Both files are appended by the same commits, in the same order,
+so they are read side by side.
+"""
+import csv
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+
+from .reports import format_cents
+
+
+ITEMS = 'Postavke'
+FIELDS = ('Opis', 'Količina', 'EM', 'Cena', 'Popust', 'DDV')
+# Columns of the sidecar file
+COLUMNS = ('Št. računa',) + FIELDS
+
+UNIT = 'PCE'
+CENT = Decimal(1)
+HUNDRED = Decimal(100)
+
+
+def parse_decimal(text):
+    """'1.234,5', '2,5' or '2.5' -> Decimal, ValueError if not a number"""
+    text = str(text).strip().replace(' ', '').replace('€', '').rstrip('%')
+    if ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"{text!r} ni število") from None
+    if not value.is_finite():
+        raise ValueError(f"{text!r} ni število")
+    return value
+
+
+def format_decimal(value, places=0):
+    """Decimal('2.50') -> '2,5', with at least places decimals"""
+    value = value.normalize()
+    if -value.as_tuple().exponent < places:
+        value = value.quantize(Decimal(1).scaleb(-places))
+    return f"{value:f}".replace('.', ',')
+
+
+def _cents(value):
+    return int(value.quantize(CENT, rounding=ROUND_HALF_UP))
+
+
+class LineItem:
+    """One parsed line item, amounts in integer cents"""
+
+    __slots__ = (
+        'opis', 'kolicina', 'em', 'cena', 'popust', 'ddv',
+        'vrednost', 'znesek_popusta', 'osnova', 'znesek_ddv', 'skupaj',
+        )
+
+    def __init__(self, opis, kolicina, em, cena, popust, ddv):
+        self.opis = opis
+        self.kolicina = kolicina
+        self.em = em
+        self.cena = cena
+        self.popust = popust
+        self.ddv = ddv
+
+        self.vrednost = _cents(kolicina * cena * HUNDRED)
+        self.znesek_popusta = _cents(self.vrednost * popust / HUNDRED)
+        self.osnova = self.vrednost - self.znesek_popusta
+        self.znesek_ddv = _cents(self.osnova * ddv / HUNDRED)
+        self.skupaj = self.osnova + self.znesek_ddv
+
+    @classmethod
+    def parse(cls, item):
+        """A LineItem from a dict of strings, ValueError if invalid"""
+        opis = str(item.get('Opis') or '').strip()
+        if not opis:
+            raise ValueError("Opis je obvezen")
+
+        kolicina = parse_decimal(item.get('Količina') or '1')
+        if kolicina <= 0:
+            raise ValueError("Količina mora biti večja od 0")
+        cena = parse_decimal(item.get('Cena') or '')
+        if cena < 0:
+            raise ValueError("Cena ne sme biti negativna")
+        popust = parse_decimal(item.get('Popust') or '0')
+        ddv = parse_decimal(item.get('DDV') or '0')
+        for name, value in (('Popust', popust), ('DDV', ddv)):
+            if not 0 <= value <= 100:
+                raise ValueError(f"{name} mora biti med 0 in 100 %")
+
+        em = str(item.get('EM') or '').strip() or UNIT
+        return cls(opis, kolicina, em, cena, popust, ddv)
+
+
+class Totals:
+    """Running sums over line items, in cents"""
+
+    def __init__(self):
+        self.postavk = 0
+        self.vrednost = 0
+        self.popusti = 0
+        self.osnova = 0
+        self.neobdavceno = 0
+        self.ddv = 0
+        self.skupaj = 0
+
+    def add(self, item):
+        self.postavk += 1
+        self.vrednost += item.vrednost
+        self.popusti += item.znesek_popusta
+        if item.ddv:
+            self.osnova += item.osnova
+        else:
+            self.neobdavceno += item.osnova
+        self.ddv += item.znesek_ddv
+        self.skupaj += item.skupaj
+
+
+def has_items(record):
+    return bool(record.get(ITEMS))
+
+
+def iter_items(record):
+    """Parsed LineItems of a record, lazily"""
+    for item in record.get(ITEMS) or ():
+        yield LineItem.parse(item)
+
+
+def totals(items):
+    """Totals of an iterable of LineItems"""
+    result = Totals()
+    for item in items:
+        result.add(item)
+    return result
+
+
+def summarize(record):
+    """Set Znesek (and an empty Opis storitve) of a record from its items.
+
+    Records without items, or with invalid ones, are left as they are;
+    the errors are reported by validation.
+    """
+    if not has_items(record) or check_items(record):
+        return record
+    result = totals(iter_items(record))
+
+    record['Znesek'] = format_cents(result.skupaj)
+    if not record.get('Opis storitve'):
+        record['Opis storitve'] = str(record[ITEMS][0]['Opis']).strip()
+    return record
+
+
+def check_items(record):
+    """Validation rule: every item must parse"""
+    if not has_items(record):
+        return {}
+    if isinstance(record[ITEMS], (str, dict)):
+        return {ITEMS: "Postavke morajo biti seznam"}
+    for number, item in enumerate(record[ITEMS], start=1):
+        if not isinstance(item, dict):
+            return {ITEMS: f"postavka {number}: ni objekt"}
+        try:
+            LineItem.parse(item)
+        except ValueError as e:
+            return {ITEMS: f"postavka {number}: {e}"}
+    return {}
+
+
+def items_path(ledger):
+    """The sidecar file with the items of a ledger"""
+    ledger = Path(ledger)
+    return ledger.with_name(f"postavke_{ledger.name}")
+
+
+def read_items(ledger):
+    """Yield (invoice number, [item]) from the sidecar file of a ledger,
+    in file order; nothing without a sidecar file
+    """
+    path = items_path(ledger)
+    if not path.exists():
+        return
+
+    with open(path, 'r', newline='', encoding='utf-8') as fh:
+        rows = csv.DictReader(fh)
+        for stevilka, group in groupby(rows, key=itemgetter('Št. računa')):
+            items = []
+            for row in group:
+                del row['Št. računa']
+                items.append(row)
+            yield stevilka, items
+
+
+def attach_items(records, items):
+    """Yield records with their items attached.
+
+    records are in ledger order and items is read_items() of the same
+    ledger. Only the items of one invoice are held at a time.
+    """
+    items = iter(items)
+    pending = next(items, None)
+    for record in records:
+        if pending is not None and pending[0] == record['Št. računa']:
+            record = dict(record, **{ITEMS: pending[1]})
+            pending = next(items, None)
+        yield record
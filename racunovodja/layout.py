@@ -0,0 +1,338 @@
+"""Fixed-width text layout of the invoice, compiled once per issuer.
+
+All the static text of the invoice, including the issuer block, is
+built the first time a profile is used and split into static chunks and
+slots. Rendering an invoice then only fills a handful of slots and joins
+the chunks, each slot with a fixed width: short values are padded
+exactly as before, values that do not fit are cut with '…' and long
+service descriptions wrap onto extra table rows.
+"""
+import hashlib
+import string
+import textwrap
+
+from .items import format_decimal
+from .reports import format_cents
+
+
+WIDTH = 107
+ELLIPSIS = '…'
+
+VAT_EXEMPTION = "DDV po 1. odstavku 94. člena ZDDV-1 ni obračunan."
+
+# Column widths of the line item table and the totals box
+OPIS_WIDTH = 41
+ZNESEK_WIDTH = 10
+VREDNOST_WIDTH = 15
+SKUPAJ_WIDTH = 18
+DDV_WIDTH = 13
+
+_layouts = {}
+
+
+def fit(text, width):
+    """Pad text to width, or cut it to width with an ellipsis"""
+    text = str(text)
+    if len(text) > width:
+        return text[:width - 1] + ELLIPSIS
+    return text.ljust(width)
+
+
+def clip(text, width):
+    """Cut text to width, without padding"""
+    text = str(text)
+    if len(text) > width:
+        return text[:width - 1] + ELLIPSIS
+    return text
+
+
+def amount(znesek, width):
+    """'123,45' -> '123,45€   ', amounts are never cut"""
+    text = f"{znesek}€"
+    if len(text) > width:
+        raise ValueError(f"Znesek {znesek} is too long for the invoice layout")
+    return text.ljust(width)
+
+
+def _escape(text):
+    return str(text).replace('{', '{{').replace('}', '}}')
+
+
+class InvoiceLayout:
+    """The invoice text of one issuer profile, with slots to fill"""
+
+    version = 1
+
+    def __init__(self, profile):
+        p = {key: _escape(value) for key, value in profile.items()}
+
+        naziv_i = _escape(fit(profile['name'], 68))
+        kraj_i = _escape(fit(profile['post_nr'] + ' ' + profile['city'], 76))
+        ulica_i = _escape(fit(profile['street'], 67))
+        ds_i = _escape(fit(profile['tax_nr'], 54))
+        kraj_izdaje = p.get('place', "Ljutomer")
+
+        # The recipient slots start at column 76 and end at the right edge
+        self.slot_width = WIDTH - 76
+
+        # A few lines end in a space, which is kept for identical output
+        space = ' '
+
+        dash = f"+{'-' * 42}+{'-' * 10}+{'-' * 5}+{'-' * 11}+{'-' * 10}+{'-' * 5}+{'-' * 16}+"
+        double = f"+{'=' * 42}+{'=' * 10}+{'=' * 5}+{'=' * 11}+{'=' * 10}+{'=' * 5}+{'=' * 16}+"
+        box = f"{' ' * 64}+{'-' * 21}+{'-' * 19}+"
+        pad = ' ' * 64
+
+        head = f"""Izdajatelj:{' ' * 53}Prejemnik:{space}
+{naziv_i}Naziv:  {{naziv}}
+{ulica_i}Naslov:  {{naslov}}
+{kraj_i}{{posta}}
+{' ' * 71}DŠ:  {{ds}}
+DAVČNA ŠTEVILKA: {ds_i}MŠ:  {{ms}}
+
+IBAN:   {p['iban']}
+Banka:  {p['bank']}
+BIC:    {p['bic']}{space}
+
+
+Račun št. {{sifra}}
+
+{' ' * 61}Datum izdaje:  {{datum_izdaje}}
+{' ' * 60}Način plačila:  Nakazilo na TRR
+{' ' * 67}Valuta:  EUR
+{' ' * 62}Kraj izdaje:  {kraj_izdaje}
+{' ' * 48}Datum opravljene storitve:  {{datum_storitve}}
+{' ' * 57}Datum zapadlosti:  {{datum_zapadlosti}}
+{' ' * 68}Sklic:  {{sklic}}
+{' ' * 62}Koda namena:  OTHR
+
+{'_' * WIDTH}
+Na osnovi pogodbe/naročila vam zaračunavam avtorsko delo iz neodvisnega samostojnega opravljanja{space}
+dejavnosti po 46. členu Zdoh-2L.
+{'_' * WIDTH}
+
+"""
+        table_header = f"""{dash}
+| Opis storitve{' ' * 28}| Količina | EM  | Cena/EM   | Popust   | DDV | Vrednost z DDV |
+{double}
+"""
+        signature = f"""
+
+
+{' ' * 4}Podpis:
+
+{'_' * WIDTH}
+"""
+        template = head + table_header + f"""| {{opis}}|    1     | PCE | {{znesek}}| 0% 0.00€ | 0%  | {{vrednost}}|{{opis_dalje}}
+{dash}
+
+{VAT_EXEMPTION}
+
+{box}
+{pad}| Vrednost postavk:   | {{skupaj}}|
+{box}
+{pad}| Vsota popustov:     | 0,00€{' ' * 13}|
+{box}
+{pad}| Osnova za DDV:      | 0.00€{' ' * 13}|
+{box}
+{pad}| Neobdavčeno:        | {{skupaj}}|
+{box}
+{pad}| Vsota zneskov:      | DDV: 0,00€{' ' * 8}|
+{box}
+{pad}| ZA PLAČILO:         | {{skupaj}}|
+{box}""" + signature
+
+        # Invoices with line items: the same page, with a table row per
+        # item and the totals box filled from the items
+        self.items_head = head
+        self.table_header = table_header.splitlines()
+        self.items_tail = f"""{dash}
+
+{{opomba_ddv}}
+
+{box}
+{pad}| Vrednost postavk:   | {{vrednost}}|
+{box}
+{pad}| Vsota popustov:     | {{popusti}}|
+{box}
+{pad}| Osnova za DDV:      | {{osnova}}|
+{box}
+{pad}| Neobdavčeno:        | {{neobdavceno}}|
+{box}
+{pad}| Vsota zneskov:      | DDV: {{ddv}}|
+{box}
+{pad}| ZA PLAČILO:         | {{skupaj}}|
+{box}""" + signature
+        # Line of the tail the signature is drawn under
+        self.podpis_line = self.items_tail.splitlines().index(
+            f"{' ' * 4}Podpis:")
+
+        self.compile(template)
+        self.continuation = (
+            f"| {{opis}}|{' ' * 10}|{' ' * 5}|{' ' * 11}"
+            f"|{' ' * 10}|{' ' * 5}|{' ' * 16}|"
+            )
+
+        # Identifies the static text, e.g. for the render cache
+        static = (
+            ''.join(self.parts) + self.continuation + self.items_head +
+            self.items_tail
+            )
+        self.digest = hashlib.sha256(static.encode('utf-8')).hexdigest()
+
+    # Slots followed by more text on their line always have this width,
+    # all the other slots end their line
+    widths = {
+        'opis': OPIS_WIDTH,
+        'znesek': ZNESEK_WIDTH,
+        'vrednost': VREDNOST_WIDTH,
+        'skupaj': SKUPAJ_WIDTH,
+        }
+
+    def compile(self, template):
+        """Split the template into static chunks and slot positions.
+
+        The (line, column) of every slot is recorded too, so the slots
+        can be drawn on their own over a page with the static text.
+        """
+        self.parts = []
+        self.slots = []
+        self.positions = []
+        line = column = 0
+
+        for text, name, _, _ in string.Formatter().parse(template):
+            if text:
+                self.parts.append(text)
+                line += text.count('\n')
+                if '\n' in text:
+                    column = len(text) - text.rindex('\n') - 1
+                else:
+                    column += len(text)
+            if name is not None:
+                self.slots.append((len(self.parts), name))
+                self.positions.append((name, line, column))
+                self.parts.append('')
+                column += self.widths.get(name, 0)
+
+    def fill(self, values):
+        parts = self.parts[:]
+        for index, name in self.slots:
+            parts[index] = values[name]
+        return ''.join(parts)
+
+    def skeleton(self):
+        """The static text only, with every slot left blank"""
+        return self.fill({
+            name: ' ' * self.widths.get(name, 0) for _, name in self.slots
+            })
+
+    def opis_lines(self, opis):
+        if len(opis) <= OPIS_WIDTH:
+            return [opis]
+        return textwrap.wrap(opis, OPIS_WIDTH)
+
+    def header_values(self, data, sifra, datum_izdaje, datum_zapadlosti):
+        """The text of the slots above the line item table"""
+        naslov = data['Naslov'].split(', ', 1) + ['']
+        return {
+            'naziv': clip(data['Naziv'], self.slot_width),
+            'naslov': clip(naslov[0], self.slot_width),
+            'posta': clip(naslov[1], self.slot_width),
+            'ds': clip(data['Davčna številka'], self.slot_width),
+            'ms': clip(data['Matična številka'], self.slot_width),
+            'sifra': sifra,
+            'datum_izdaje': datum_izdaje,
+            'datum_storitve': data['Datum opravljene storitve'],
+            'datum_zapadlosti': datum_zapadlosti,
+            'sklic': sifra[2:],
+            }
+
+    def values(self, data, sifra, datum_izdaje, datum_zapadlosti):
+        """The text of every slot for one record"""
+        opis = self.opis_lines(data['Opis storitve'])
+        dalje = ''.join(
+            '\n' + self.continuation.format(opis=line.ljust(OPIS_WIDTH))
+            for line in opis[1:]
+            )
+
+        values = self.header_values(
+            data, sifra, datum_izdaje, datum_zapadlosti)
+        values.update({
+            'opis': opis[0].ljust(OPIS_WIDTH),
+            'znesek': amount(data['Znesek'], ZNESEK_WIDTH),
+            'vrednost': amount(data['Znesek'], VREDNOST_WIDTH),
+            'opis_dalje': dalje,
+            'skupaj': amount(data['Znesek'], SKUPAJ_WIDTH),
+            })
+        return values
+
+    def render(self, data, sifra, datum_izdaje, datum_zapadlosti):
+        """The full invoice text for one record"""
+        return self.fill(
+            self.values(data, sifra, datum_izdaje, datum_zapadlosti))
+
+    # Invoices with line items are laid out a line at a time, see
+    # PDFModel.render_items: the head, the table header, the rows of
+    # every item and the tail with the totals.
+
+    def head(self, data, sifra, datum_izdaje, datum_zapadlosti):
+        """The lines above the line item table"""
+        values = self.header_values(
+            data, sifra, datum_izdaje, datum_zapadlosti)
+        return self.items_head.format_map(values).splitlines()
+
+    def item_lines(self, item):
+        """The table rows of one LineItem, more if its description wraps"""
+        opis = self.opis_lines(item.opis)
+        kolicina = clip(format_decimal(item.kolicina), 10)
+        cena = amount(format_decimal(item.cena, 2), ZNESEK_WIDTH)
+        popust = clip(f"{format_decimal(item.popust)}%", 9)
+        ddv = clip(f"{format_decimal(item.ddv)}%", 4)
+        vrednost = amount(format_cents(item.skupaj), VREDNOST_WIDTH)
+
+        lines = [
+            f"| {opis[0].ljust(OPIS_WIDTH)}|{kolicina:^10}| {fit(item.em, 3)} "
+            f"| {cena}| {popust:<9}| {ddv:<4}| {vrednost}|"
+            ]
+        for line in opis[1:]:
+            lines.append(self.continuation.format(opis=line.ljust(OPIS_WIDTH)))
+        return lines
+
+    def item_rows(self, items, totals):
+        """The rows of every item as a list of lines, one item at a time.
+
+        items may be any iterable, e.g. a generator, and nothing is kept;
+        every item is added to totals (an items.Totals) on the way.
+        """
+        for item in items:
+            totals.add(item)
+            yield self.item_lines(item)
+
+    def tail(self, totals):
+        """The lines below the table, with the totals of the items"""
+        return self.items_tail.format(
+            opomba_ddv='' if totals.ddv else VAT_EXEMPTION,
+            vrednost=amount(format_cents(totals.vrednost), SKUPAJ_WIDTH),
+            popusti=amount(format_cents(totals.popusti), SKUPAJ_WIDTH),
+            osnova=amount(format_cents(totals.osnova), SKUPAJ_WIDTH),
+            neobdavceno=amount(format_cents(totals.neobdavceno), SKUPAJ_WIDTH),
+            ddv=amount(format_cents(totals.ddv), DDV_WIDTH),
+            skupaj=amount(format_cents(totals.skupaj), SKUPAJ_WIDTH),
+            ).splitlines()
+
+
+def get_layout(profile):
+    """The compiled layout of a profile, built on first use.
+
+    Looked up by the identity of the profile dict; the stored copy
+    catches a profile that was edited in place since.
+    """
+    entry = _layouts.get(id(profile))
+    if entry is None or entry[0] != profile:
+        entry = _layouts[id(profile)] = (dict(profile), InvoiceLayout(profile))
+    return entry[1]
+
+
+def forget_layout(profile):
+    """Drop the compiled layout of a profile that is no longer used"""
+    _layouts.pop(id(profile), None)
@@ -1,20 +1,89 @@
 import csv
 from pathlib import Path
-from datetime import datetime, timedelta
-from fpdf import FPDF
+from datetime import datetime
 import os
+import json
+import sqlite3
 
 from .constants import FieldTypes as FT
-from . import settings as s
+from .filelock import FileLock, fsync_dir
+from .items import COLUMNS as ITEM_COLUMNS, ITEMS, attach_items, items_path
+from .items import read_items
+from .numbering import format_number, number_key
+from .reports import iter_rows
 
-class CSVModel:
-    """CSV file storage"""
+
+class DuplicateInvoiceError(ValueError):
+    """Records with invoice numbers that were issued already"""
+
+    def __init__(self, records):
+        self.records = records
+        numbers = ', '.join(record['Št. računa'] for record in records)
+        if len(records) == 1:
+            message = f"Račun št. {numbers} že obstaja"
+        else:
+            message = f"Računi št. {numbers} že obstajajo"
+        super().__init__(message)
+
+
+class InvoiceYearError(ValueError):
+    """Records issued in another year than the one of the ledger"""
+
+    def __init__(self, records, year):
+        self.records = records
+        self.year = year
+        dates = ', '.join(
+            sorted({record['Datum izdaje'] for record in records}))
+        super().__init__(
+            f"Datum izdaje {dates} ni v letu {year}, za katero je odprta "
+            f"knjiga računov")
+
+
+class LedgerTransaction:
+    """Records staged for the ledger and written with a single commit.
+
+    Used as a context manager it commits when the block succeeds and
+    rolls back when it raises.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.records = []
+
+    def add(self, data):
+        self.records.append(dict(data))
+
+    def remove(self, data):
+        """Drop a staged record, e.g. when its PDF could not be rendered"""
+        self.records.remove(data)
+
+    def commit(self):
+        if self.records:
+            self.model._commit(self.records)
+            self.model._notify(self.records)
+        self.records = []
+
+    def rollback(self):
+        self.records = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+
+class LedgerModel:
+    """Interface shared by the ledger storage backends"""
 
     fields = {
     "Št. računa": {'req': True, 'type': FT.string},
     "Naziv": {'req': True, 'type': FT.string},
-    "Naslov": {'req': True, 'type': FT.string},
-    "Davčna številka": {'req': True, 'type': FT.string},
+    "Naslov": {'req': True, 'type': FT.string, 'format': 'address'},
+    "Davčna številka": {'req': True, 'type': FT.string, 'format': 'tax_number'},
     "Matična številka": {'req': False, 'type': FT.integer},
     "Opis storitve": {'req': True, 'type': FT.string},
     "Datum izdaje": {'req': True, 'type': FT.date_string},
@@ -24,11 +93,126 @@ class CSVModel:
     "Opomba": {'req': False, 'type': FT.long_string}
     }
 
-    def __init__(self):
+    # Called with every record once it is committed, see subscribe()
+    listeners = ()
+    # The year whose invoices are booked, any year when None
+    year = None
+
+    def subscribe(self, callback):
+        """Call callback(record) for every record committed from now on"""
+        self.listeners = (*self.listeners, callback)
+
+    def _notify(self, records):
+        for record in records:
+            for callback in self.listeners:
+                callback(record)
+
+    def transaction(self):
+        """Start a group of records that are committed together"""
+        return LedgerTransaction(self)
+
+    def save_record(self, data):
+        """Append a new record to the ledger"""
+        with self.transaction() as transaction:
+            transaction.add(data)
+
+    def _commit(self, records):
+        """Durably append a list of records.
+
+        Raises InvoiceYearError or DuplicateInvoiceError, and writes
+        nothing, if one of them was issued in another year than the
+        ledger's, or its number was issued already.
+        """
+        raise NotImplementedError
+
+    def _is_issued(self, record):
+        """Whether the number of a record is in the ledger already"""
+        raise NotImplementedError
+
+    def duplicates(self, records):
+        """The records whose number is in the ledger, or earlier in records.
+
+        Records without a number yet are skipped.
+        """
+        found = []
+        seen = set()
+        for record in records:
+            if not record['Št. računa']:
+                continue
+            key = number_key(record['Št. računa'])
+            if key in seen or self._is_issued(record):
+                found.append(record)
+            seen.add(key)
+        return found
+
+    def outside_year(self, records):
+        """The records issued in another year than the ledger's"""
+        if self.year is None:
+            return []
+        year = f".{self.year}"
+        return [
+            record for record in records
+            if not record['Datum izdaje'].endswith(year)
+            ]
+
+    def _check_records(self, records):
+        outside = self.outside_year(records)
+        if outside:
+            raise InvoiceYearError(outside, self.year)
+        duplicates = self.duplicates(records)
+        if duplicates:
+            raise DuplicateInvoiceError(duplicates)
+
+    def get_all_records(self):
+        """Return a list of all records"""
+        raise NotImplementedError
+
+    def get_record(self, stevilka_racuna):
+        """Return the record with the given invoice number, or None"""
+        raise NotImplementedError
+
+    def get_client_records(self, davcna_stevilka):
+        """Return all records of a client, by tax number"""
+        raise NotImplementedError
+
+    def update_record(self, stevilka_racuna, data):
+        """Overwrite the record with the given invoice number"""
+        raise NotImplementedError
+
+    def with_items(self, records):
+        """The records with their line items ('Postavke'), if they have any.
+
+        records are in ledger order, e.g. from get_all_records().
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release the storage, e.g. a database connection"""
+
+
+class CSVModel(LedgerModel):
+    """CSV file storage"""
+
+    def __init__(self, filename=None, year=None):
 
-        datestring = datetime.today().strftime("%Y")
-        filename = f"knjiga_racunov_{datestring}.csv"
+        if filename is None:
+            year = year or datetime.today().year
+            filename = f"knjiga_racunov_{year}.csv"
         self.file = Path(filename)
+        self.year = year
+        self._writeable = False
+        # (inode, offset, fieldnames, numbers) of the rows read so far
+        self._issued = (None, 0, None, set())
+
+        self.items_file = items_path(self.file)
+        self.journal = self.file.with_name(self.file.name + '.journal')
+        self.lock = FileLock(self.file.with_name(self.file.name + '.lock'))
+        self.recover()
+
+    def _check_access(self):
+        """Checked before the first write instead of at startup"""
+        if self._writeable:
+            return
 
         file_exists = os.access(self.file, os.F_OK)
         parent_writeable = os.access(self.file.parent, os.W_OK)
@@ -38,154 +222,443 @@ class CSVModel:
             (not file_exists and not parent_writeable) or 
             (file_exists and not file_writeable)
             ):
-            msg = f"Permission denied accessing file: {filename}"
+            msg = f"Permission denied accessing file: {self.file}"
             raise PermissionError(msg)
-
-    def save_record(self, data):
-        """Save a dict of data to the CSV file"""
-        newfile = not self.file.exists()
+        self._writeable = True
+
+    # Every commit is first written to the journal together with the
+    # ledger size before the append. If the append is interrupted, the
+    # journal is replayed: the ledger is cut back to that size and the
+    # rows are written again, so a row is never torn or written twice.
+    # The line items file is cut back and appended to the same way.
+
+    def _commit(self, records):
+        self._check_access()
+        with self.lock:
+            self._check_records(records)
+            offset = self.file.stat().st_size if self.file.exists() else 0
+            items_offset = (
+                self.items_file.stat().st_size
+                if self.items_file.exists() else 0
+                )
+            self._write_journal(offset, records, items_offset)
+            self._append(offset, records, items_offset)
+            self._clear_journal()
+
+    def _write_journal(self, offset, records, items_offset):
+        entry = {
+            'offset': offset, 'items_offset': items_offset,
+            'records': records,
+            }
+        with open(self.journal, 'w', encoding='utf-8') as fh:
+            json.dump(entry, fh, ensure_ascii=False)
+            fh.flush()
+            os.fsync(fh.fileno())
+        fsync_dir(self.journal.parent.resolve())
+
+    def _append(self, offset, records, items_offset=None):
+        items = [
+            {'Št. računa': record['Št. računa'], **item}
+            for record in records for item in record.get(ITEMS) or ()
+            ]
+        # Journals without an items offset never touched the items file
+        if items_offset is not None and (items or (
+            self.items_file.exists() and
+            self.items_file.stat().st_size > items_offset
+            )):
+            self._append_items(items_offset, items)
 
         with open(self.file, 'a', newline='', encoding='utf-8') as fh:
-            csvwriter = csv.DictWriter(fh, fieldnames=self.fields.keys())
+            fh.truncate(offset)
+            # The items are not part of the ledger row
+            csvwriter = csv.DictWriter(
+                fh, fieldnames=self.fields.keys(), extrasaction='ignore')
+
+            if offset == 0:
+                csvwriter.writeheader()
+
+            csvwriter.writerows(records)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def _append_items(self, offset, items):
+        with open(self.items_file, 'a', newline='', encoding='utf-8') as fh:
+            fh.truncate(offset)
+            csvwriter = csv.DictWriter(
+                fh, fieldnames=ITEM_COLUMNS, extrasaction='ignore')
 
-            if newfile:
+            if offset == 0:
                 csvwriter.writeheader()
 
-            csvwriter.writerow(data)
-
-
-class PDFModel(FPDF):
-    """PDF file storage and composition"""
-
-    def __init__(self, stevilka_racuna, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        self.st_racuna = stevilka_racuna
-
-    def header(self):
-        # Rendering logo:
-        self.image(s.user['logo'], 10, 8, 24)
-        # Setting font:
-        self.add_font(fname="files/UbuntuMono-Regular.ttf")
-        self.set_font("UbuntuMono-Regular", '', 14)
-        title = f"Račun št. {self.get_sifra_racuna()}"
-        width = len(title) + 36
-        self.set_x((210 - width) / 2)
-        self.set_fill_color(200, 220, 255)
-        # Moving cursor to the right:
-        self.cell(
-            width,
-            9,
-            title,
-            border=1,
-            new_x="LMARGIN",
-            new_y="NEXT",
-            align="C",
-            fill=True,
-        )
-        # Performing a line break:
-        self.ln(10)
-
-    def footer(self):
-        # Position cursor at 1.5 cm from bottom:
-        self.set_y(-15)
-        # Setting font: helvetica italic 8
-        self.set_font("helvetica", "I", 8)
-        self.set_text_color(128)
-        # Printing page number:
-        self.cell(0, 10, f"Page {self.page_no()}/{{nb}}", align="C")
-
-    def get_racun_string(self, data):
-        # Podatki o izdajatelju računa:
-        naziv_i = s.user['name'] + (' ' * (68 - len(s.user['name'])))
-        kraj_i = s.user['post_nr'] + ' ' + s.user['city']\
-            + (' ' * (75 - len(s.user['post_nr']) - len(s.user['city'])))
-        ulica_i = s.user['street'] + (' ' * (67 - len(s.user['street'])))
-        ds_i = s.user['tax_nr'] + (' ' * (54 - len(s.user['tax_nr'])))
-        iban_i = s.user['iban']
-        banka_i = s.user['bank']
-        bic_i = s.user['bic']
-
-        # Podatki o prejemniku računa:
-        naziv_p = data['Naziv']
-        naslov_p = data['Naslov'].split(', ')
-        ds_p = data['Davčna številka']
-        ms_p = data['Matična številka']
-
-        # Podatki o računu
-        datum_storitve = data['Datum opravljene storitve']
-        datum_izdaje = datetime.today().strftime("%d.%m.%Y")
-        datum_zapadlosti = (datetime.today()\
-            + timedelta(days=14)).strftime("%d.%m.%Y")
-        opis_input = data['Opis storitve']
-        znesek_input = data['Znesek']
-        sklic = self.get_sifra_racuna()[2:]
-        opis = opis_input + (' ' * (41 - len(opis_input)))
-        znesek = znesek_input + '€' + (' ' * (9 - len(znesek_input)))
-        znesek2 = znesek_input + '€' + (' ' * (14 - len(znesek_input)))
-        znesek3 = znesek_input + '€' + (' ' * (17 - len(znesek_input)))
-
-        # Konstrukcija računa
-        racun_string = f"""Izdajatelj:{' ' * 53}Prejemnik: 
-{naziv_i}Naziv:  {naziv_p}
-{ulica_i}Naslov:  {naslov_p[0]}
-{kraj_i}{naslov_p[1]}
-{' ' * 71}DŠ:  {ds_p}
-DAVČNA ŠTEVILKA: {ds_i}MŠ:  {ms_p}
-
-IBAN:   {iban_i}
-Banka:  {banka_i}
-BIC:    {bic_i} 
-
-
-Račun št. {self.get_sifra_racuna()}
-
-{' ' * 61}Datum izdaje:  {datum_izdaje}
-{' ' * 60}Način plačila:  Nakazilo na TRR
-{' ' * 67}Valuta:  EUR
-{' ' * 62}Kraj izdaje:  Ljutomer
-{' ' * 48}Datum opravljene storitve:  {datum_storitve}
-{' ' * 57}Datum zapadlosti:  {datum_zapadlosti}
-{' ' * 68}Sklic:  {sklic}
-{' ' * 62}Koda namena:  OTHR
-
-{'_' * 107}
-Na osnovi pogodbe/naročila vam zaračunavam avtorsko delo iz neodvisnega samostojnega opravljanja 
-dejavnosti po 46. členu Zdoh-2L.
-{'_' * 107}
-
-+{'-' * 42}+{'-' * 10}+{'-' * 5}+{'-' * 11}+{'-' * 10}+{'-' * 5}+{'-' * 16}+
-| Opis storitve{' ' * 28}| Količina | EM  | Cena/EM   | Popust   | DDV | Vrednost z DDV |
-+{'=' * 42}+{'=' * 10}+{'=' * 5}+{'=' * 11}+{'=' * 10}+{'=' * 5}+{'=' * 16}+
-| {opis}|    1     | PCE | {znesek}| 0% 0.00€ | 0%  | {znesek2}|
-+{'-' * 42}+{'-' * 10}+{'-' * 5}+{'-' * 11}+{'-' * 10}+{'-' * 5}+{'-' * 16}+
-
-DDV po 1. odstavku 94. člena ZDDV-1 ni obračunan.
-
-{' ' * 64}+{'-' * 21}+{'-' * 19}+
-{' ' * 64}| Vrednost postavk:   | {znesek3}|
-{' ' * 64}+{'-' * 21}+{'-' * 19}+
-{' ' * 64}| Vsota popustov:     | 0,00€{' ' * 13}|
-{' ' * 64}+{'-' * 21}+{'-' * 19}+
-{' ' * 64}| Osnova za DDV:      | 0.00€{' ' * 13}|
-{' ' * 64}+{'-' * 21}+{'-' * 19}+
-{' ' * 64}| Neobdavčeno:        | {znesek3}|
-{' ' * 64}+{'-' * 21}+{'-' * 19}+
-{' ' * 64}| Vsota zneskov:      | DDV: 0,00€{' ' * 8}|
-{' ' * 64}+{'-' * 21}+{'-' * 19}+
-{' ' * 64}| ZA PLAČILO:         | {znesek3}|
-{' ' * 64}+{'-' * 21}+{'-' * 19}+
-
-
-{' ' * 4}Podpis:
-
-{'_' * 107}
-"""
-        return racun_string
-
-    def get_sifra_racuna(self):
-        name_split = s.user['name'].split()
-        initials = name_split[0][0] + name_split[1][0]
-        year = datetime.today().strftime('%y')
-        code = ('0'*(3 - len(self.st_racuna))) + self.st_racuna
-        return f"{initials}{year}-{code}"
+            csvwriter.writerows(items)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def _clear_journal(self):
+        self.journal.unlink()
+        fsync_dir(self.journal.parent.resolve())
+
+    def recover(self):
+        """Finish a commit that was interrupted, returns the replayed rows"""
+        if not self.journal.exists():
+            return 0
+
+        with self.lock:
+            try:
+                with open(self.journal, 'r', encoding='utf-8') as fh:
+                    entry = json.load(fh)
+            except FileNotFoundError:
+                # Another process recovered it in the meantime
+                return 0
+            except ValueError:
+                # A torn journal means the ledger was never touched
+                self._clear_journal()
+                return 0
+
+            self._append(
+                entry['offset'], entry['records'],
+                entry.get('items_offset'))
+            self._clear_journal()
+
+        return len(entry['records'])
+
+    def _numbers(self):
+        """Invoice numbers in the ledger, only new rows are read"""
+        if not self.file.exists():
+            return set()
+
+        inode, offset, fieldnames, numbers = self._issued
+        stat = self.file.stat()
+        if inode != stat.st_ino or stat.st_size < offset:
+            # Rewritten by update_record, or cut back by recover
+            offset, fieldnames, numbers = 0, None, set()
+        for record, offset, fieldnames in iter_rows(
+            self.file, offset, fieldnames
+            ):
+            if record is not None:
+                numbers.add(number_key(record['Št. računa']))
+
+        self._issued = (stat.st_ino, offset, fieldnames, numbers)
+        return numbers
+
+    def _is_issued(self, record):
+        return number_key(record['Št. računa']) in self._numbers()
+
+    def get_all_records(self):
+        if not self.file.exists():
+            return []
+
+        with open(self.file, 'r', newline='', encoding='utf-8') as fh:
+            return list(csv.DictReader(fh))
+
+    def get_record(self, stevilka_racuna):
+        for record in self.get_all_records():
+            if record['Št. računa'] == str(stevilka_racuna):
+                return record
+        return None
+
+    def get_client_records(self, davcna_stevilka):
+        return [
+            record for record in self.get_all_records()
+            if record['Davčna številka'] == davcna_stevilka
+            ]
+
+    def update_record(self, stevilka_racuna, data):
+        self._check_access()
+        with self.lock:
+            # The line items of an invoice stay as they were booked, and
+            # are found by its number, in ledger order
+            if str(data['Št. računa']) != str(stevilka_racuna):
+                raise ValueError(
+                    f"Številke računa št. {stevilka_racuna} ni mogoče "
+                    f"spremeniti")
+            data = {key: value for key, value in data.items() if key != ITEMS}
+            records = self.get_all_records()
+            for i, record in enumerate(records):
+                if record['Št. računa'] == str(stevilka_racuna):
+                    records[i] = data
+                    break
+            else:
+                raise KeyError(f"Račun št. {stevilka_racuna} ne obstaja")
+
+            # Write a full copy first, so the ledger is never left half written
+            tmp = self.file.with_name(self.file.name + '.tmp')
+            with open(tmp, 'w', newline='', encoding='utf-8') as fh:
+                csvwriter = csv.DictWriter(fh, fieldnames=self.fields.keys())
+                csvwriter.writeheader()
+                csvwriter.writerows(records)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, self.file)
+            fsync_dir(self.file.parent.resolve())
+
+    def with_items(self, records):
+        return list(attach_items(records, read_items(self.file)))
+
+
+class SQLModel(LedgerModel):
+    """Indexed SQLite storage, with the same fields as the CSV ledger"""
+
+    columns = {
+    "Št. računa": 'st_racuna',
+    "Naziv": 'naziv',
+    "Naslov": 'naslov',
+    "Davčna številka": 'davcna_stevilka',
+    "Matična številka": 'maticna_stevilka',
+    "Opis storitve": 'opis_storitve',
+    "Datum izdaje": 'datum_izdaje',
+    "Datum opravljene storitve": 'datum_storitve',
+    "Datum zapadlosti": 'datum_zapadlosti',
+    "Znesek": 'znesek',
+    "Opomba": 'opomba',
+    }
+
+    create_query = """
+        CREATE TABLE IF NOT EXISTS racuni (
+            id INTEGER PRIMARY KEY,
+            leto INTEGER NOT NULL,
+            st_racuna TEXT NOT NULL,
+            naziv TEXT NOT NULL,
+            naslov TEXT NOT NULL,
+            davcna_stevilka TEXT NOT NULL,
+            maticna_stevilka TEXT,
+            opis_storitve TEXT NOT NULL,
+            datum_izdaje TEXT NOT NULL,
+            datum_storitve TEXT NOT NULL,
+            datum_zapadlosti TEXT NOT NULL,
+            znesek TEXT NOT NULL,
+            opomba TEXT
+        );
+        CREATE INDEX IF NOT EXISTS racuni_st_racuna
+            ON racuni (st_racuna, leto);
+        CREATE INDEX IF NOT EXISTS racuni_davcna_stevilka
+            ON racuni (davcna_stevilka, datum_izdaje);
+        CREATE INDEX IF NOT EXISTS racuni_datum_izdaje
+            ON racuni (datum_izdaje);
+        CREATE INDEX IF NOT EXISTS racuni_datum_storitve
+            ON racuni (datum_storitve);
+        CREATE INDEX IF NOT EXISTS racuni_datum_zapadlosti
+            ON racuni (datum_zapadlosti);
+        CREATE TABLE IF NOT EXISTS postavke (
+            leto INTEGER NOT NULL,
+            st_racuna TEXT NOT NULL,
+            zap INTEGER NOT NULL,
+            opis TEXT NOT NULL,
+            kolicina TEXT NOT NULL,
+            em TEXT,
+            cena TEXT NOT NULL,
+            popust TEXT,
+            ddv TEXT
+        );
+        CREATE INDEX IF NOT EXISTS postavke_st_racuna
+            ON postavke (st_racuna, leto, zap);
+        CREATE TABLE IF NOT EXISTS uvozi (
+            datoteka TEXT PRIMARY KEY,
+            uvozeno TEXT NOT NULL
+        );
+    """
+
+    item_columns = {
+    "Opis": 'opis',
+    "Količina": 'kolicina',
+    "EM": 'em',
+    "Cena": 'cena',
+    "Popust": 'popust',
+    "DDV": 'ddv',
+    }
+
+    date_columns = ('datum_izdaje', 'datum_storitve', 'datum_zapadlosti')
+
+    def __init__(self, filename="knjiga_racunov.db", year=None):
+        self.file = Path(filename)
+        self.year = year
+        # The service opens the ledger on the event loop and writes it
+        # from its ledger thread, one commit at a time
+        self.connection = sqlite3.connect(self.file, check_same_thread=False)
+        self.connection.executescript(self.create_query)
+
+    # Dates are kept as ISO strings in the database, so they sort and
+    # index correctly; the records use the dd.mm.yyyy form everywhere.
+    @staticmethod
+    def _to_iso(date):
+        return datetime.strptime(date, '%d.%m.%Y').strftime('%Y-%m-%d')
+
+    @staticmethod
+    def _from_iso(date):
+        return datetime.strptime(date, '%Y-%m-%d').strftime('%d.%m.%Y')
+
+    def _to_row(self, data):
+        row = {
+            column: str(data.get(key, ''))
+            for key, column in self.columns.items()
+            }
+        for column in self.date_columns:
+            row[column] = self._to_iso(row[column])
+        row['leto'] = int(row['datum_izdaje'][:4])
+        return row
+
+    def _to_record(self, row):
+        record = dict(zip(('leto',) + tuple(self.columns), row))
+        del record['leto']
+        for key, column in self.columns.items():
+            if column in self.date_columns:
+                record[key] = self._from_iso(record[key])
+        return record
+
+    def _select(self, where='', params=()):
+        query = (
+            f"SELECT leto, {', '.join(self.columns.values())} FROM racuni "
+            f"{where} ORDER BY datum_izdaje, id"
+            )
+        cursor = self.connection.execute(query, params)
+        return [self._to_record(row) for row in cursor]
+
+    def _insert(self, rows):
+        names = ['leto'] + list(self.columns.values())
+        query = (
+            f"INSERT INTO racuni ({', '.join(names)}) "
+            f"VALUES ({', '.join(':' + name for name in names)})"
+            )
+        self.connection.executemany(query, rows)
+
+    def _item_rows(self, records):
+        for record in records:
+            items = record.get(ITEMS)
+            if not items:
+                continue
+            row = self._to_row(record)
+            for zap, item in enumerate(items, start=1):
+                yield {
+                    'leto': row['leto'], 'st_racuna': row['st_racuna'],
+                    'zap': zap,
+                    **{
+                        column: str(item.get(key) or '')
+                        for key, column in self.item_columns.items()
+                        },
+                    }
+
+    def _insert_items(self, rows):
+        names = ['leto', 'st_racuna', 'zap'] + list(self.item_columns.values())
+        query = (
+            f"INSERT INTO postavke ({', '.join(names)}) "
+            f"VALUES ({', '.join(':' + name for name in names)})"
+            )
+        self.connection.executemany(query, rows)
+
+    def _is_issued(self, record):
+        # Numbers are unique within the year of issue
+        key = number_key(record['Št. računa'])
+        leto = int(self._to_iso(record['Datum izdaje'])[:4])
+        found = self.connection.execute(
+            "SELECT 1 FROM racuni WHERE st_racuna IN (?, ?, ?) AND leto = ?",
+            (record['Št. računa'], key, format_number(key), leto)
+            ).fetchone()
+        return found is not None
+
+    def _commit(self, records):
+        with self.connection:
+            # Taken before the check, so no other process can write between
+            self.connection.execute("BEGIN IMMEDIATE")
+            self._check_records(records)
+            self._insert(self._to_row(record) for record in records)
+            self._insert_items(self._item_rows(records))
+
+    def get_all_records(self):
+        return self._select()
+
+    def get_record(self, stevilka_racuna, leto=None):
+        where = "WHERE st_racuna = ?"
+        params = [str(stevilka_racuna)]
+        if leto is not None:
+            where += " AND leto = ?"
+            params.append(int(leto))
+
+        records = self._select(where, params)
+        return records[-1] if records else None
+
+    def get_client_records(self, davcna_stevilka):
+        return self._select("WHERE davcna_stevilka = ?", (davcna_stevilka,))
+
+    def get_records_between(self, od, do, column='datum_izdaje'):
+        """Records with a date column between od and do, inclusive"""
+        if column not in self.date_columns:
+            raise ValueError(f"Not a date column: {column}")
+        return self._select(
+            f"WHERE {column} BETWEEN ? AND ?",
+            (self._to_iso(od), self._to_iso(do))
+            )
+
+    def update_record(self, stevilka_racuna, data, leto=None):
+        row = self._to_row(data)
+        assignments = ', '.join(f"{name} = :{name}" for name in row)
+        where = "st_racuna = :old_st_racuna"
+        row['old_st_racuna'] = str(stevilka_racuna)
+        if leto is not None:
+            where += " AND leto = :old_leto"
+            row['old_leto'] = int(leto)
+
+        with self.connection:
+            cursor = self.connection.execute(
+                f"UPDATE racuni SET {assignments} WHERE {where}", row)
+
+        if not cursor.rowcount:
+            raise KeyError(f"Račun št. {stevilka_racuna} ne obstaja")
+
+    def with_items(self, records):
+        query = (
+            f"SELECT {', '.join(self.item_columns.values())} FROM postavke "
+            f"WHERE st_racuna = ? AND leto = ? ORDER BY zap"
+            )
+        result = []
+        for record in records:
+            leto = int(self._to_iso(record['Datum izdaje'])[:4])
+            items = [
+                dict(zip(self.item_columns, row))
+                for row in self.connection.execute(
+                    query, (str(record['Št. računa']), leto))
+                ]
+            if items:
+                record = dict(record, **{ITEMS: items})
+            result.append(record)
+        return result
+
+    def close(self):
+        self.connection.close()
+
+    def import_csv(self, filename):
+        """Import a yearly CSV ledger once, returns the number of rows.
+
+        Files that were already imported are skipped.
+        """
+        name = str(Path(filename).resolve())
+        with self.connection:
+            done = self.connection.execute(
+                "SELECT 1 FROM uvozi WHERE datoteka = ?", (name,)).fetchone()
+            if done:
+                return 0
+
+            with open(filename, 'r', newline='', encoding='utf-8') as fh:
+                records = list(csv.DictReader(fh))
+            self._insert(self._to_row(record) for record in records)
+            self._insert_items(self._item_rows(
+                attach_items(records, read_items(filename))))
+            self.connection.execute(
+                "INSERT INTO uvozi VALUES (?, ?)",
+                (name, datetime.now().isoformat(timespec='seconds'))
+                )
+
+        return len(records)
+
+
+backends = {
+    'csv': CSVModel,
+    'sqlite': SQLModel,
+    }
+
+
+def __getattr__(name):
+    # PDFModel used to live here; fpdf2 is only imported when it is used
+    if name == 'PDFModel':
+        from .pdf import PDFModel
+        return PDFModel
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
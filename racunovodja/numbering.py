@@ -0,0 +1,156 @@
+"""Automatic invoice numbers, safe to use from several processes.
+
+The last issued number of each issuer and year is kept in a small
+counter file. Allocating reads and rewrites only that file under a file
+lock, so it never has to rescan the ledger.
+"""
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from .filelock import FileLock, fsync_dir
+
+
+def get_initials(name):
+    """'JANEZ NOVAK' -> 'JN'"""
+    name_split = name.split()
+    return name_split[0][0] + name_split[1][0]
+
+
+def format_number(stevilka_racuna):
+    """Zero-pad to three digits; longer numbers are kept as they are"""
+    return str(stevilka_racuna).zfill(3)
+
+
+def number_key(stevilka_racuna):
+    """'005' and '5' are the same invoice number"""
+    stevilka_racuna = str(stevilka_racuna).strip()
+    if stevilka_racuna.isdigit():
+        return str(int(stevilka_racuna))
+    return stevilka_racuna
+
+
+def format_sifra(name, stevilka_racuna, datum_izdaje=None):
+    """'JN23-001': initials, year of issue (or this year) and number"""
+    if datum_izdaje:
+        # A booked invoice keeps the year it was issued in
+        year = datum_izdaje[-2:]
+    else:
+        year = datetime.today().strftime('%y')
+    return f"{get_initials(name)}{year}-{format_number(stevilka_racuna)}"
+
+
+class Reservation:
+    """Numbers handed out while the counter is held, see reserve().
+
+    Has allocate() and observe() like the allocator, so it can number
+    records the same way.
+    """
+
+    def __init__(self, last):
+        self.last = last
+        # The first number allocated, None until then
+        self.first = None
+
+    def allocate(self, count=1):
+        if self.first is None:
+            self.first = self.last + 1
+        numbers = range(self.last + 1, self.last + count + 1)
+        self.last += count
+        return [str(n) for n in numbers]
+
+    def observe(self, stevilka_racuna):
+        self.last = max(self.last, int(stevilka_racuna))
+
+    def keep(self, count):
+        """Keep only the first count numbers allocated and give the rest
+        back, returns the kept ones
+        """
+        if self.first is None:
+            return []
+        self.last = self.first + count - 1
+        return [str(n) for n in range(self.first, self.last + 1)]
+
+
+class InvoiceNumberAllocator:
+    """Hands out consecutive invoice numbers for one issuer and year"""
+
+    def __init__(self, name, year=None, model=None, directory='.'):
+        self.year = int(year or datetime.today().year)
+        self.model = model
+
+        code = f"{get_initials(name)}{self.year}"
+        self.file = Path(directory) / f"stevec_racunov_{code}.txt"
+        self.lock = FileLock(self.file.with_name(self.file.name + '.lock'))
+
+    def _seed(self):
+        """Highest number already in the ledger, only used once per year"""
+        if self.model is None:
+            return 0
+
+        highest = 0
+        for record in self.model.get_all_records():
+            stevilka = record['Št. računa']
+            if (
+                stevilka.isdigit() and
+                record['Datum izdaje'].endswith(str(self.year))
+                ):
+                highest = max(highest, int(stevilka))
+        return highest
+
+    def _read(self):
+        try:
+            return int(self.file.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return self._seed()
+
+    def _write(self, last):
+        tmp = self.file.with_name(self.file.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            fh.write(str(last))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.file)
+        fsync_dir(self.file.parent.resolve())
+
+    def allocate(self, count=1):
+        """Reserve count consecutive numbers, returns them as strings"""
+        with self.lock:
+            last = self._read()
+            self._write(last + count)
+
+        return [str(n) for n in range(last + 1, last + count + 1)]
+
+    @contextmanager
+    def reserve(self):
+        """Hold the counter while a batch is numbered and issued.
+
+        Yields a Reservation. Other processes wait for their numbers
+        until the block ends; only the numbers the reservation kept are
+        used up then, none if the block raises.
+        """
+        with self.lock:
+            reservation = Reservation(self._read())
+            yield reservation
+            self._write(reservation.last)
+
+    def next(self):
+        return self.allocate()[0]
+
+    def peek(self):
+        """The number the next allocation will most likely return.
+
+        Only a suggestion: another process may take it before it is
+        used, so a suggested number is allocated again when it is saved.
+        """
+        with self.lock:
+            return str(self._read() + 1)
+
+    def observe(self, stevilka_racuna):
+        """Account for a number that was entered by hand"""
+        stevilka_racuna = int(stevilka_racuna)
+
+        with self.lock:
+            if stevilka_racuna > self._read():
+                self._write(stevilka_racuna)
@@ -0,0 +1,290 @@
+"""PDF rendering of a single invoice.
+
+Kept apart from the ledger models, because importing fpdf2 is the
+slowest part of starting the application; this module is only imported
+once the first invoice is rendered.
+"""
+import copy
+import hashlib
+import json
+from datetime import datetime, timedelta
+from fpdf import FPDF
+
+from . import layout as invoice_layout
+from . import settings as s
+from .assets import FONT_FILE, registry
+from .items import Totals, has_items, iter_items
+from .numbering import format_sifra
+from .layout import get_layout
+from .tracing import traced
+
+
+class PDFModel(FPDF):
+    """PDF file storage and composition"""
+
+    # Pre-rendered static pages, by profile
+    _skeletons = {}
+
+    def __init__(
+        self, stevilka_racuna, *args, datum_izdaje=None, profile=None,
+        **kwargs
+        ):
+        super().__init__(*args, **kwargs)
+
+        self.st_racuna = stevilka_racuna
+        # dd.mm.yyyy of a booked invoice, None for one issued today
+        self.datum_izdaje = datum_izdaje or None
+        # The issuer, the active profile unless given
+        self.profile = profile or s.user
+
+    @classmethod
+    def for_data(cls, data, profile=None):
+        """An empty PDFModel numbered and dated like a record"""
+        return cls(
+            data['Št. računa'], datum_izdaje=data.get('Datum izdaje'),
+            profile=profile)
+
+    @traced('pdf.header')
+    def header(self):
+        # Rendering logo:
+        registry.image(self, self.profile['logo'], 10, 8, 24)
+        # Setting font (parsed once per process):
+        family = registry.add_font(self)
+        self.set_font(family, '', 14)
+        self._title_y = self.y
+        if self.st_racuna is None:
+            # Static page without a number, the title is stamped later
+            self.ln(9)
+        else:
+            self._draw_title()
+        # Performing a line break:
+        self.ln(10)
+
+    def _draw_title(self):
+        self.set_font_size(14)
+        title = f"Račun št. {self.get_sifra_racuna()}"
+        width = len(title) + 36
+        self.set_x((210 - width) / 2)
+        self.set_fill_color(200, 220, 255)
+        # Moving cursor to the right:
+        self.cell(
+            width,
+            9,
+            title,
+            border=1,
+            new_x="LMARGIN",
+            new_y="NEXT",
+            align="C",
+            fill=True,
+        )
+
+    @traced('pdf.footer')
+    def footer(self):
+        # Position cursor at 1.5 cm from bottom:
+        self.set_y(-15)
+        # Setting font: helvetica italic 8
+        self.set_font("helvetica", "I", 8)
+        self.set_text_color(128)
+        # Printing page number:
+        self.cell(0, 10, f"Page {self.page_no()}/{{nb}}", align="C")
+
+    def _get_dates(self, data=None):
+        """Issue and due date of a record as booked, or from today"""
+        if data and data.get('Datum izdaje') and data.get('Datum zapadlosti'):
+            return data['Datum izdaje'], data['Datum zapadlosti']
+
+        today = datetime.today()
+        datum_izdaje = today.strftime("%d.%m.%Y")
+        datum_zapadlosti = (today + timedelta(days=14)).strftime("%d.%m.%Y")
+        return datum_izdaje, datum_zapadlosti
+
+    @traced('pdf.layout')
+    def get_racun_string(self, data):
+        # Podatki o računu
+        datum_izdaje, datum_zapadlosti = self._get_dates(data)
+
+        # Static text and issuer block are compiled once per profile
+        layout = get_layout(self.profile)
+        return layout.render(
+            data, self.get_sifra_racuna(), datum_izdaje, datum_zapadlosti)
+
+    def render(self, data):
+        """Lay out the invoice for a record on a new page"""
+        if has_items(data):
+            self.render_items(data)
+            return
+        racun_string = self.get_racun_string(data)
+        self._render_text(racun_string)
+
+    def _render_text(self, racun_string):
+        self._start_page()
+        self._body_y = self.y
+        self.multi_cell(0, 4, racun_string, border = 0, align = 'L')
+        registry.image(self, self.profile['signature'], 30, 230, 45)
+
+    def _start_page(self):
+        self.add_page()
+        self.set_font_size(9.5)
+        self.ln(5)
+
+    def _lines(self, lines):
+        """Write lines 4 mm apart, at the baseline cell() would use.
+
+        text() skips the width and alignment work of cell(), which made
+        up nearly all the time of a long table.
+        """
+        x = self.l_margin + self.c_margin
+        for line in lines:
+            self.text(x, self.y + 2 + 0.3 * self.font_size, line)
+            self.y += 4
+
+    def _fits(self, lines):
+        return self.y + 4 * lines <= self.page_break_trigger
+
+    @traced('pdf.items')
+    def render_items(self, data):
+        """Lay out an invoice with line items, on as many pages as needed.
+
+        The table is drawn a row at a time straight from the items, so
+        memory stays flat and the time linear in the number of items.
+        A row that does not fit goes to a new page, below the repeated
+        table header; the totals and the signature are kept together.
+        """
+        layout = get_layout(self.profile)
+        datum_izdaje, datum_zapadlosti = self._get_dates(data)
+        self._start_page()
+        self._lines(layout.head(
+            data, self.get_sifra_racuna(), datum_izdaje, datum_zapadlosti))
+        self._lines(layout.table_header)
+
+        totals = Totals()
+        # One line is always left for the rule that closes the table
+        rule = layout.table_header[:1]
+        for lines in layout.item_rows(iter_items(data), totals):
+            if not self._fits(len(lines) + 1):
+                self._lines(rule)
+                self._start_page()
+                self._lines(layout.table_header)
+            self._lines(lines)
+
+        tail = layout.tail(totals)
+        self._lines(tail[:1])
+        if not self._fits(len(tail) - 1):
+            self._start_page()
+        self._lines(tail[1:layout.podpis_line])
+        # Where a one page invoice has it, relative to the Podpis line
+        registry.image(self, self.profile['signature'], 30, self.y - 8, 45)
+        self._lines(tail[layout.podpis_line:])
+
+    @classmethod
+    def skeleton(cls, profile=None):
+        """The invoice page without any invoice data, built once.
+
+        It holds the logo, signature, static text and frames of a
+        profile, the active one by default. It is rebuilt when the
+        profile or one of the image files changes.
+        """
+        profile = profile or s.user
+        layout = get_layout(profile)
+        key = (
+            id(layout),
+            registry.digest(profile['logo']),
+            registry.digest(profile['signature']),
+            )
+
+        entry = cls._skeletons.get(id(profile))
+        if entry is None or entry[0] != key:
+            pdf = cls(None, profile=profile)
+            pdf._render_text(layout.skeleton())
+            entry = cls._skeletons[id(profile)] = (key, pdf)
+        return entry[1]
+
+    @classmethod
+    def forget(cls, profile):
+        """Drop the skeleton of a profile that is no longer used"""
+        cls._skeletons.pop(id(profile), None)
+
+    @classmethod
+    def stamp(cls, stevilka_racuna, data, profile=None):
+        """Render a record by drawing only its data on a skeleton copy.
+
+        The text is monospaced, so every slot goes to the exact spot the
+        full layout would put it. Records whose description wraps change
+        the line count and are rendered in full instead, as are those
+        with line items.
+        """
+        profile = profile or s.user
+        layout = get_layout(profile)
+        pdf = cls(
+            stevilka_racuna, datum_izdaje=data.get('Datum izdaje'),
+            profile=profile)
+        if has_items(data):
+            pdf.render_items(data)
+            return pdf
+
+        values = layout.values(
+            data, pdf.get_sifra_racuna(), *pdf._get_dates(data))
+
+        if values['opis_dalje']:
+            pdf._render_text(layout.fill(values))
+            return pdf
+
+        # The profile itself is shared, not copied
+        pdf = copy.deepcopy(cls.skeleton(profile), {id(profile): profile})
+        registry.detach_fonts(pdf)
+        pdf.st_racuna = stevilka_racuna
+        pdf.datum_izdaje = data.get('Datum izdaje') or None
+
+        pdf.set_y(pdf._title_y)
+        pdf._draw_title()
+
+        pdf.set_font_size(9.5)
+        char_width = pdf.get_string_width(' ')
+        for name, line, column in layout.positions:
+            text = values[name].rstrip()
+            if text:
+                pdf.set_xy(
+                    pdf.l_margin + column * char_width,
+                    pdf._body_y + line * 4
+                    )
+                pdf.cell(text=text, h=4)
+
+        return pdf
+
+    @classmethod
+    def cache_key(cls, data, profile=None):
+        """Hash of everything the rendered PDF of a record depends on"""
+        pdf = cls.for_data(data, profile)
+        layout = get_layout(pdf.profile)
+        files = (
+            pdf.profile['logo'], pdf.profile['signature'], FONT_FILE,
+            __file__, invoice_layout.__file__,
+            )
+        parts = {
+            'record': {key: str(value) for key, value in data.items()},
+            'profile': pdf.profile,
+            'sifra': pdf.get_sifra_racuna(),
+            'dates': pdf._get_dates(data),
+            'mode': s.render_mode,
+            'layout': [layout.version, layout.digest],
+            'files': [registry.digest(path) for path in files],
+            }
+        encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def for_record(cls, data, profile=None):
+        """A rendered PDFModel for a record, in the configured mode"""
+        if s.render_mode == 'stamp':
+            return cls.stamp(data['Št. računa'], data, profile)
+
+        pdf = cls.for_data(data, profile)
+        pdf.render(data)
+        return pdf
+
+    def get_filename(self, opomba=''):
+        return f"racun_st_{self.get_sifra_racuna()}_{opomba}.pdf"
+
+    def get_sifra_racuna(self):
+        return format_sifra(
+            self.profile['name'], self.st_racuna, self.datum_izdaje)
@@ -0,0 +1,203 @@
+"""Issuer profiles, switchable while the application runs.
+
+A profile holds the issuer data printed on an invoice: name, address,
+tax number, bank details, logo, signature and place of issue. Profiles
+are listed in settings.profiles and, to add some without editing the
+code, in the JSON file settings.profiles_file ({name: profile}).
+
+The active profile is settings.user. Every profile that was used keeps
+a ProfileSession with its ledger, number allocator, compiled layout and
+parsed images, so switching back to it is instant. Sessions left unused
+for settings.profile_idle seconds are evicted.
+"""
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from . import settings as s
+from .layout import forget_layout, get_layout
+from .models import backends
+from .numbering import InvoiceNumberAllocator
+
+
+FIELDS = (
+    'name', 'street', 'post_nr', 'city', 'country', 'tax_nr', 'iban',
+    'bank', 'bic', 'logo', 'signature',
+    )
+PLACE = "Ljutomer"
+
+_profiles = None
+
+
+def load_profiles():
+    """{name: profile} from settings and the profiles file, read once.
+
+    The same dicts are returned on every call; the compiled layouts and
+    skeletons are looked up by their identity.
+    """
+    global _profiles
+    if _profiles is not None:
+        return _profiles
+
+    profiles = dict(s.profiles)
+    path = Path(s.profiles_file) if s.profiles_file else None
+    if path is not None and path.exists():
+        with open(path, 'r', encoding='utf-8') as fh:
+            profiles.update(json.load(fh))
+
+    # Profiles must not share a ledger and an invoice counter, so only
+    # one of them may keep the default directory
+    directories = {}
+    for name, profile in profiles.items():
+        missing = [key for key in FIELDS if not profile.get(key)]
+        if missing:
+            raise ValueError(
+                f"Profil {name} nima polj: {', '.join(missing)}")
+        profile.setdefault('place', PLACE)
+
+        directory = profile.get('directory', '.')
+        other = directories.setdefault(Path(directory).resolve(), name)
+        if other != name:
+            raise ValueError(
+                f"Profila {other} in {name} imata isto mapo {directory!r}, "
+                f"vsak potrebuje svojo ('directory')")
+
+    _profiles = profiles
+    return _profiles
+
+
+def get_profile(name=None):
+    """A profile by name, the active one (settings.user) by default"""
+    if name is None:
+        return s.user
+    try:
+        return load_profiles()[name]
+    except KeyError:
+        raise ValueError(f"Profil {name} ne obstaja") from None
+
+
+def activate(name=None):
+    """Make a profile the active one, returns it"""
+    name = name or s.profile
+    s.user = get_profile(name)
+    s.profile = name
+    return s.user
+
+
+def open_ledger(profile, year=None):
+    """The ledger of a profile, in its 'directory', for booking the
+    invoices issued in year (this year by default)
+    """
+    directory = Path(profile.get('directory', '.'))
+    directory.mkdir(parents=True, exist_ok=True)
+
+    year = year or datetime.today().year
+    if s.storage == 'sqlite':
+        return backends['sqlite'](directory / "knjiga_racunov.db", year)
+    return backends['csv'](directory / f"knjiga_racunov_{year}.csv", year)
+
+
+def open_year(profile, year=None):
+    """(ledger, number allocator) of a profile for one year"""
+    model = open_ledger(profile, year)
+    allocator = InvoiceNumberAllocator(
+        profile['name'], model.year, model=model,
+        directory=profile.get('directory', '.'))
+    return model, allocator
+
+
+class ProfileSession:
+    """The ledger, allocator and loaded assets of one profile"""
+
+    def __init__(self, name, profile):
+        self.name = name
+        self.profile = profile
+        self.model, self.allocator = open_year(profile)
+        self.used = time.monotonic()
+
+    def renew(self):
+        """Move on to the ledger and numbers of a new year, once it has
+        begun; returns whether they changed. Subscriptions are kept.
+        """
+        year = datetime.today().year
+        if year == self.model.year:
+            return False
+
+        listeners = self.model.listeners
+        self.model.close()
+        self.model, self.allocator = open_year(self.profile, year)
+        self.model.listeners = listeners
+        return True
+
+    def warm_up(self):
+        """Compile the layout and load the images ahead of the first render"""
+        from .pdf import PDFModel
+
+        PDFModel.skeleton(self.profile)
+
+    def release(self, keep=()):
+        """Drop the cached state, except image files in keep"""
+        self.model.close()
+        forget_layout(self.profile)
+
+        # Nothing was loaded if fpdf2 was never imported
+        pdf = sys.modules.get(f"{__package__}.pdf")
+        if pdf is None:
+            return
+        pdf.PDFModel.forget(self.profile)
+        for path in (self.profile['logo'], self.profile['signature']):
+            if path not in keep:
+                pdf.registry.discard(path)
+
+
+class ProfileCache:
+    """Warm sessions of the profiles used recently"""
+
+    def __init__(self, idle=None, on_open=None):
+        self.idle = s.profile_idle if idle is None else idle
+        self.on_open = on_open
+        self.sessions = {}
+        self.active = None
+
+    def names(self):
+        return list(load_profiles())
+
+    def get(self, name):
+        """The session of a profile, opened on first use"""
+        session = self.sessions.get(name)
+        if session is None:
+            session = ProfileSession(name, get_profile(name))
+            # The layout is cheap, the images are loaded by warm_up
+            get_layout(session.profile)
+            self.sessions[name] = session
+            if self.on_open:
+                self.on_open(session)
+        session.used = time.monotonic()
+        return session
+
+    def activate(self, name):
+        """Switch to a profile, returns its session"""
+        session = self.get(name)
+        activate(name)
+        self.active = name
+        return session
+
+    def evict(self, now=None):
+        """Release the sessions idle for too long, returns their names"""
+        now = time.monotonic() if now is None else now
+        idle = [
+            name for name, session in self.sessions.items()
+            if name != self.active and now - session.used > self.idle
+            ]
+
+        for name in idle:
+            session = self.sessions.pop(name)
+            keep = {
+                path for other in self.sessions.values()
+                for path in (other.profile['logo'], other.profile['signature'])
+                }
+            session.release(keep)
+
+        return idle
@@ -0,0 +1,434 @@
+"""Payments from bank statements, matched to the invoices of the ledger.
+
+Usage:
+    python -m racunovodja.reconcile izpisek.xml [izpiski.csv ...]
+        [--profile NAME] [--as-of dd.mm.yyyy]
+
+Statements are ISO 20022 camt.053 XML files or CSV exports of a bank.
+Both are read incrementally, one entry at a time, so memory does not
+grow with the size of a statement. Only credits are considered.
+
+Every invoice of the profile is put in a hash index by its payment
+reference (sklic, e.g. '23-001' as printed on the invoice), and open
+invoices also by (amount, payer). A credit is matched by its reference
+first ('SI00 23-001', 'SI0023-001' and '23-001' are the same), then by
+its amount and payer name.
+
+Payments are kept in .placila.json in the directory of the profile,
+with the entries already matched, so a statement can be read again; its
+matched entries are skipped, and a statement whose every credit was
+matched is not read again until it changes. An invoice is paid
+(placano) once the payments reach its amount, with the date of the last
+payment, partially paid (delno) before that, and overdue (zapadlo) when
+it is not paid after its due date; partially paid and overdue (delno
+zapadlo) when some of it was paid by then.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from xml.etree.ElementTree import XMLPullParser
+
+from .clients import fold
+from .numbering import format_sifra
+from .profiles import get_profile
+from .reports import find_ledgers, format_cents, iter_rows, to_cents
+
+
+STATE = ".placila.json"
+
+PAID = "placano"
+PARTIAL = "delno"
+OPEN = "odprto"
+OVERDUE = "zapadlo"
+# Partially paid and past its due date
+PARTIAL_OVERDUE = "delno zapadlo"
+
+# 'SI00 23-001' -> '23-001', the model is not part of the reference
+MODEL = re.compile(r'^(SI|RF)\d\d')
+# A reference written in free text, e.g. 'Račun JN23-001'
+FREE_REFERENCE = re.compile(r'(\d\d-\d{3,})')
+ISO_DATE = re.compile(r'\d{4}-\d\d-\d\d', re.ASCII)
+
+# Header names of the columns in bank CSV exports, compared folded
+CSV_COLUMNS = {
+    'date': ('datum knjizenja', 'datum valute', 'datum', 'booking date', 'date'),
+    'amount': ('priliv', 'znesek v dobro', 'znesek', 'credit', 'amount'),
+    'reference': ('sklic prejemnika', 'sklic', 'referenca', 'reference'),
+    'payer': ('placnik', 'naziv placnika', 'naziv', 'payer', 'name'),
+    'purpose': ('namen', 'opis', 'purpose', 'description'),
+    'id': ('id transakcije', 'referenca banke', 'transaction id', 'id'),
+    }
+
+
+def normalize_reference(reference):
+    """'SI00 23-001' -> '23-001'"""
+    reference = reference.replace(' ', '').upper()
+    return MODEL.sub('', reference)
+
+
+def parse_date(text):
+    """'2023-04-05', '2023-04-05T10:00:00' or '05.04.2023' -> 'dd.mm.yyyy'"""
+    text = text.strip()[:10]
+    if ISO_DATE.fullmatch(text):
+        return f"{text[8:10]}.{text[5:7]}.{text[:4]}"
+    return datetime.strptime(text, '%d.%m.%Y').strftime('%d.%m.%Y')
+
+
+class Credit:
+    """One payment received, as read from a statement"""
+
+    def __init__(self, id, date, cents, reference='', payer='', purpose=''):
+        self.id = id
+        self.date = date
+        self.cents = cents
+        self.reference = normalize_reference(reference)
+        self.payer = payer
+        self.purpose = purpose
+
+        if not self.reference:
+            found = FREE_REFERENCE.search(purpose)
+            if found:
+                self.reference = found.group(1)
+
+
+def _entry_id(source, parts, seen):
+    """Bank reference of an entry, or a hash of its content.
+
+    Only the content is hashed, so a payment gets the same id in every
+    statement it is in, also when re-exported or overlapping another.
+    Identical payments in one statement are told apart by counting
+    them in seen, {hash: occurrences} of the statement.
+    """
+    if source:
+        return source
+    text = '|'.join(str(part) for part in parts)
+    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    seen[digest] = count = seen.get(digest, 0) + 1
+    return digest if count == 1 else f"{digest}/{count}"
+
+
+def _texts(element, skip, prefix='', stop=('NtryDtls',)):
+    """{'BookgDt/Dt': '2023-04-05', ...}: the text of every leaf below
+    element by its path of local names; skip is the namespace length.
+    The first of repeated paths wins, subtrees named in stop are left out.
+    """
+    texts = {}
+    for child in element:
+        name = child.tag[skip:]
+        if name in stop:
+            continue
+        if len(child):
+            for key, text in _texts(child, skip, f"{prefix}{name}/").items():
+                texts.setdefault(key, text)
+        else:
+            texts.setdefault(prefix + name, (child.text or '').strip())
+    return texts
+
+
+def _events(path, chunk=64 * 1024):
+    parser = XMLPullParser(events=('start', 'end'))
+    with open(path, 'rb') as fh:
+        while True:
+            data = fh.read(chunk)
+            if not data:
+                break
+            parser.feed(data)
+            yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def read_camt(path):
+    """Yield the credits of a camt.053 statement, one entry at a time"""
+    seen = {}
+    ns = ntry = tx_details = None
+    # The open elements, to drop an entry from its parent once read
+    stack = []
+
+    for event, element in _events(path):
+        if ns is None:
+            tag = element.tag
+            ns = tag[:tag.index('}') + 1] if '}' in tag else ''
+            ntry = f"{ns}Ntry"
+            tx_details = f"{ns}NtryDtls/{ns}TxDtls"
+        if event == 'start':
+            stack.append(element)
+            continue
+        stack.pop()
+        if element.tag != ntry:
+            continue
+
+        entry = _texts(element, len(ns))
+        if entry.get('CdtDbtInd') == 'CRDT':
+            date = parse_date(
+                entry.get('BookgDt/Dt') or entry.get('ValDt/Dt', ''))
+            entry_ref = entry.get('AcctSvcrRef', '')
+            details = element.findall(tx_details) or [None]
+
+            # A batch booking has one TxDtls per payment
+            for tx in details:
+                tx = {} if tx is None else _texts(tx, len(ns))
+                amount = (
+                    tx.get('Amt') or tx.get('AmtDtls/TxAmt/Amt') or
+                    entry.get('Amt', ''))
+                reference = tx.get('RmtInf/Strd/CdtrRefInf/Ref', '')
+                purpose = tx.get('RmtInf/Ustrd', '')
+                payer = (
+                    tx.get('RltdPties/Dbtr/Nm') or
+                    tx.get('RltdPties/Dbtr/Pty/Nm', ''))
+                tx_ref = (
+                    tx.get('Refs/AcctSvcrRef') or tx.get('Refs/EndToEndId', ''))
+                if tx_ref == 'NOTPROVIDED':
+                    tx_ref = ''
+
+                cents = to_cents(amount)
+                if entry_ref and len(details) > 1:
+                    source = f"{entry_ref}/{tx_ref}" if tx_ref else ''
+                else:
+                    source = tx_ref or entry_ref
+                yield Credit(
+                    _entry_id(source, (date, cents, reference, payer), seen),
+                    date, cents, reference, payer, purpose)
+
+        # Entries already read are dropped, memory stays constant
+        if stack:
+            stack[-1].remove(element)
+
+
+def _column(fieldnames, key):
+    names = {fold(name.strip()): name for name in fieldnames}
+    for candidate in CSV_COLUMNS[key]:
+        if candidate in names:
+            return names[candidate]
+    return None
+
+
+def read_csv(path):
+    """Yield the credits of a CSV statement export, row by row"""
+    with open(path, 'r', newline='', encoding='utf-8-sig') as fh:
+        sample = fh.read(4096)
+        fh.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(fh, dialect=dialect)
+
+        columns = {
+            key: _column(reader.fieldnames or (), key) for key in CSV_COLUMNS
+            }
+        if columns['date'] is None or columns['amount'] is None:
+            raise ValueError(f"{path}: ni stolpcev z datumom in zneskom")
+
+        seen = {}
+        for row in reader:
+            value = {
+                key: (row.get(column) or '').strip() if column else ''
+                for key, column in columns.items()
+                }
+            if not value['amount']:
+                continue
+            cents = to_cents(value['amount'])
+            if cents <= 0:
+                continue
+
+            date = parse_date(value['date'])
+            parts = (date, cents, value['reference'], value['payer'])
+            yield Credit(
+                _entry_id(value['id'], parts, seen), date, cents,
+                value['reference'], value['payer'], value['purpose'])
+
+
+def read_statement(path):
+    if Path(path).suffix.lower() == '.xml':
+        return read_camt(path)
+    return read_csv(path)
+
+
+class Reconciliation:
+    """Payments of the invoices of one profile, kept between runs"""
+
+    def __init__(self, profile=None, directory=None, state=STATE):
+        self.profile = get_profile(profile)
+        self.directory = Path(
+            directory or self.profile.get('directory', '.'))
+        self.state_file = self.directory / state
+        self.matched = set()
+        self.payments = {}
+        # Statements with every credit matched, by path: [size, mtime]
+        self.statements = {}
+
+        if self.state_file.exists():
+            with open(self.state_file, 'r', encoding='utf-8') as fh:
+                state = json.load(fh)
+            self.matched = set(state['vnosi'])
+            self.payments = state['racuni']
+            self.statements = state['izpiski']
+
+        self.invoices = {}
+        # (sifra, record) of the invoices whose number is booked twice
+        self.duplicates = []
+        self._by_reference = {}
+        self._by_amount = {}
+        self._index()
+
+    def _index(self):
+        """Hash indexes of the invoices in all ledgers of the profile"""
+        for path in find_ledgers(self.directory):
+            for record, _, _ in iter_rows(path):
+                if record is None:
+                    continue
+                sifra = format_sifra(
+                    self.profile['name'], record['Št. računa'],
+                    record['Datum izdaje'])
+                if sifra in self.invoices:
+                    # Payments are matched to the first one
+                    self.duplicates.append((sifra, record))
+                    continue
+                cents = to_cents(record['Znesek'])
+                self.invoices[sifra] = (record, cents)
+                self._by_reference.setdefault(sifra[2:], []).append(sifra)
+                if self.paid(sifra) < cents:
+                    key = (cents, fold(record['Naziv']))
+                    self._by_amount.setdefault(key, []).append(sifra)
+
+    def paid(self, sifra):
+        payment = self.payments.get(sifra)
+        return payment['placano'] if payment else 0
+
+    def _match(self, credit):
+        """The invoice a credit pays, or None"""
+        candidates = self._by_reference.get(credit.reference, ())
+        for sifra in candidates:
+            if self.paid(sifra) < self.invoices[sifra][1]:
+                return sifra
+        if candidates:
+            # Paid already, e.g. twice by mistake; booked on the latest
+            return candidates[-1]
+
+        # Oldest open invoice first; paid ones are dropped on the way
+        open_invoices = self._by_amount.get((credit.cents, fold(credit.payer)))
+        while open_invoices:
+            sifra = open_invoices[0]
+            if self.paid(sifra) < self.invoices[sifra][1]:
+                return sifra
+            open_invoices.pop(0)
+        return None
+
+    def _apply(self, sifra, credit):
+        payment = self.payments.setdefault(
+            sifra, {'placano': 0, 'datum_placila': None, 'vnosi': []})
+        payment['placano'] += credit.cents
+        payment['vnosi'].append(credit.id)
+        if payment['placano'] >= self.invoices[sifra][1]:
+            payment['datum_placila'] = credit.date
+
+    def run(self, paths):
+        """Match the credits of statements, returns (matched, unmatched)"""
+        matched = 0
+        unmatched = []
+
+        for path in paths:
+            name = str(Path(path).resolve())
+            stat = os.stat(path)
+            stamp = [stat.st_size, stat.st_mtime_ns]
+            # Fully matched before and not changed since
+            if self.statements.get(name) == stamp:
+                continue
+
+            complete = True
+            for credit in read_statement(path):
+                if credit.id in self.matched:
+                    continue
+                sifra = self._match(credit)
+                if sifra is None:
+                    unmatched.append(credit)
+                    complete = False
+                    continue
+                self._apply(sifra, credit)
+                self.matched.add(credit.id)
+                matched += 1
+
+            if complete:
+                self.statements[name] = stamp
+
+        self._save()
+        return matched, unmatched
+
+    def _save(self):
+        tmp = self.state_file.with_name(self.state_file.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(
+                {
+                    'vnosi': sorted(self.matched),
+                    'racuni': self.payments,
+                    'izpiski': self.statements,
+                    },
+                fh, ensure_ascii=False
+                )
+        os.replace(tmp, self.state_file)
+
+    def status(self, sifra, as_of=None):
+        """(status, paid cents, paid date) of an invoice"""
+        record, cents = self.invoices[sifra]
+        payment = self.payments.get(sifra) or {}
+        paid = payment.get('placano', 0)
+
+        if paid >= cents:
+            return PAID, paid, payment['datum_placila']
+
+        as_of = as_of or datetime.today()
+        due = datetime.strptime(record['Datum zapadlosti'], '%d.%m.%Y')
+        if due < as_of:
+            return (PARTIAL_OVERDUE if paid else OVERDUE), paid, None
+        return (PARTIAL if paid else OPEN), paid, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.reconcile',
+        description="Usklajevanje plačil iz bančnih izpiskov z računi.")
+    parser.add_argument('statements', nargs='+',
+        help="camt.053 .xml or .csv statements")
+    parser.add_argument('--profile', default=None,
+        help="issuer profile (default: settings.profile)")
+    parser.add_argument('--as-of', default=None,
+        help="date for overdue invoices, dd.mm.yyyy (default: today)")
+    args = parser.parse_args(argv)
+
+    reconciliation = Reconciliation(args.profile)
+    matched, unmatched = reconciliation.run(args.statements)
+    as_of = args.as_of and datetime.strptime(args.as_of, '%d.%m.%Y')
+
+    for sifra in reconciliation.invoices:
+        status, paid, date = reconciliation.status(sifra, as_of)
+        if status != PAID:
+            cents = reconciliation.invoices[sifra][1]
+            print(
+                f"  {sifra:<12} {status:<13} "
+                f"{format_cents(paid):>12} / {format_cents(cents):>12} €")
+
+    for sifra, record in reconciliation.duplicates:
+        print(
+            f"Račun {sifra} je v knjigi večkrat ({record['Naziv']}, "
+            f"{record['Znesek']} €), plačila se vežejo na prvega",
+            file=sys.stderr)
+
+    for credit in unmatched:
+        print(
+            f"Neusklajeno: {credit.date} {format_cents(credit.cents)} € "
+            f"{credit.payer} {credit.reference or credit.purpose}",
+            file=sys.stderr)
+
+    print(f"Usklajenih plačil: {matched}, neusklajenih: {len(unmatched)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
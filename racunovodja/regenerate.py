@@ -0,0 +1,166 @@
+"""Render every invoice of a year again from its ledger.
+
+Usage:
+    python -m racunovodja.regenerate 2023 [--workers N] [--force]
+        [--profile NAME]
+
+For example after the logo, bank details or layout changed, or when
+PDFs got lost. Every record of the year in the ledger of the profile,
+knjiga_racunov_<year>.csv or the SQLite database (settings.storage), is
+rendered with the dates it was booked with, on a process pool.
+
+Progress is kept in a checkpoint file, with the render key (see
+PDFModel.cache_key) of every finished PDF. An interrupted run picks up
+where it stopped, and a PDF that exists with an unchanged key is up to
+date and skipped. --force renders everything again.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from .batch import render_record
+from .models import CSVModel
+from .profiles import get_profile, open_ledger
+from . import settings as s
+
+
+# Written at most this often while rendering, in seconds
+CHECKPOINT_INTERVAL = 1.0
+
+
+class Regeneration:
+    """Re-renders the invoices of one ledger, resumably"""
+
+    def __init__(self, year, ledger=None, checkpoint=None, profile=None):
+        self.year = year
+        self.profile = profile or s.profile
+        directory = Path(get_profile(self.profile).get('directory', '.'))
+        # A CSV ledger given explicitly, the ledger of the profile if None
+        self.ledger = Path(ledger) if ledger else None
+        self.checkpoint = Path(
+            checkpoint or directory / f".regeneracija_{year}.json")
+        self.done = {}
+
+        if self.checkpoint.exists():
+            with open(self.checkpoint, 'r', encoding='utf-8') as fh:
+                self.done = json.load(fh)
+
+    def _save(self):
+        tmp = self.checkpoint.with_name(self.checkpoint.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(self.done, fh, ensure_ascii=False)
+        os.replace(tmp, self.checkpoint)
+
+    def records(self):
+        """The records of the year, with their line items"""
+        if self.ledger is not None:
+            model = CSVModel(self.ledger)
+        else:
+            model = open_ledger(get_profile(self.profile), self.year)
+
+        try:
+            if s.storage == 'sqlite' and self.ledger is None:
+                # The database holds the invoices of every year
+                records = model.get_records_between(
+                    f"01.01.{self.year}", f"31.12.{self.year}")
+            else:
+                records = model.get_all_records()
+            return model.with_items(records)
+        finally:
+            model.close()
+
+    def pending(self, records, force=False):
+        """[(filename, key, record)] of the records out of date"""
+        from .pdf import PDFModel
+
+        profile = get_profile(self.profile)
+        jobs = []
+        for record in records:
+            pdf = PDFModel.for_data(record, profile)
+            filename = pdf.get_filename(record['Opomba'])
+            key = PDFModel.cache_key(record, profile)
+            if (
+                not force and
+                self.done.get(filename) == key and
+                os.path.exists(filename)
+                ):
+                continue
+            jobs.append((filename, key, record))
+        return jobs
+
+    def run(self, workers=None, force=False, progress=None):
+        """Render the pending invoices, returns (rendered, skipped, failed)"""
+        records = self.records()
+        jobs = self.pending(records, force)
+        skipped = len(records) - len(jobs)
+        failed = []
+        rendered = 0
+        saved = time.monotonic()
+
+        # The checkpoint is also written when the run is interrupted
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(render_record, record, self.profile):
+                        (filename, key, record)
+                    for filename, key, record in jobs
+                    }
+                for future in as_completed(futures):
+                    filename, key, record = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed.append((record, e))
+                    else:
+                        self.done[filename] = key
+                        rendered += 1
+
+                    if progress:
+                        progress(rendered + len(failed), len(jobs))
+                    if time.monotonic() - saved > CHECKPOINT_INTERVAL:
+                        self._save()
+                        saved = time.monotonic()
+        finally:
+            self._save()
+
+        return rendered, skipped, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.regenerate',
+        description="Ponoven izris vseh računov iz knjige računov.")
+    parser.add_argument('year', type=int)
+    parser.add_argument('--ledger', default=None,
+        help="ledger file (default: knjiga_racunov_<year>.csv)")
+    parser.add_argument('--workers', type=int, default=None,
+        help="number of render processes (default: all cores)")
+    parser.add_argument('--force', action='store_true',
+        help="render also the invoices that are up to date")
+    parser.add_argument('--profile', default=None,
+        help="issuer profile (default: settings.profile)")
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        print(f"\r{done}/{total}", end='', flush=True)
+
+    regeneration = Regeneration(args.year, args.ledger, profile=args.profile)
+    rendered, skipped, failed = regeneration.run(
+        args.workers, args.force, progress)
+
+    print()
+    if not (rendered or skipped or failed):
+        print(f"V knjigi računov ni računov iz leta {args.year}")
+        return 1
+    print(f"Izrisanih: {rendered}, že ažurnih: {skipped}, napak: {len(failed)}")
+    for record, error in failed:
+        print(f"  račun št. {record['Št. računa']}: {error}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Background PDF rendering for the GUI.
+
+Jobs are rendered on a worker thread. The worker never touches Tk; it
+only puts events on a queue, which the Tk main loop polls with after(),
+so all callbacks run on the GUI thread.
+"""
+import queue
+import threading
+import time
+
+from .batch import render_record, warm_up
+from .eslog import export_record
+
+
+class RenderJob:
+    """A single record waiting to be rendered"""
+
+    def __init__(self, data, profile=None, eslog=False):
+        self.data = data
+        # Name of the issuer profile, it may change before the job runs
+        self.profile = profile
+        # Also write the e-invoice
+        self.eslog = eslog
+        self.filename = None
+        self.error = None
+        self.seconds = None
+        self.attempts = 0
+
+    @property
+    def label(self):
+        return self.data.get('Št. računa', '')
+
+
+class RenderQueue:
+    """Renders jobs on a worker thread and reports back through Tk"""
+
+    def __init__(
+        self, root, render=render_record, on_change=None, on_done=None,
+        on_error=None, poll_ms=100
+        ):
+        self.root = root
+        self.render = render
+        self.on_change = on_change
+        self.on_done = on_done
+        self.on_error = on_error
+        self.poll_ms = poll_ms
+
+        self.queued = 0
+        self.rendering = 0
+        self.done = 0
+        self.failed = []
+
+        self._jobs = queue.Queue()
+        self._events = queue.Queue()
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+        self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, data, profile=None, eslog=False):
+        """Queue a record for rendering, returns the job"""
+        job = RenderJob(dict(data), profile, eslog)
+        self._put(job)
+        return job
+
+    def retry(self, job):
+        """Put a failed job back in the queue"""
+        if job in self.failed:
+            self.failed.remove(job)
+        job.error = None
+        self._put(job)
+
+    def warm_up(self, func=warm_up):
+        """Run func on the worker thread ahead of the queued jobs"""
+        self._jobs.put(func)
+
+    def _put(self, job):
+        self.queued += 1
+        self._jobs.put(job)
+        self._changed()
+
+    def pending(self):
+        return self.queued + self.rendering
+
+    def status(self):
+        text = (
+            f"V vrsti: {self.queued}, v izrisu: {self.rendering}, "
+            f"izrisanih: {self.done}"
+            )
+        if self.failed:
+            text += f", napak: {len(self.failed)}"
+        return text
+
+    def stop(self, timeout=None):
+        """Finish the queued jobs and stop the worker"""
+        self._jobs.put(None)
+        self._thread.join(timeout)
+        self.root.after_cancel(self._poll_id)
+        self._poll()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            if not isinstance(job, RenderJob):
+                # A failed warm-up shows up again on the first real job
+                try:
+                    job()
+                except Exception:
+                    pass
+                continue
+
+            self._events.put(('start', job))
+            job.attempts += 1
+            started = time.perf_counter()
+
+            try:
+                job.filename, _ = self.render(job.data, job.profile)
+                if job.eslog:
+                    export_record(job.data, job.profile)
+            except Exception as e:
+                job.error = e
+                self._events.put(('failed', job))
+            else:
+                self._events.put(('done', job))
+            finally:
+                job.seconds = time.perf_counter() - started
+
+    def _poll(self):
+        """Runs on the Tk thread: hand worker events to the callbacks"""
+        while True:
+            try:
+                event, job = self._events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event == 'start':
+                self.queued -= 1
+                self.rendering += 1
+            elif event == 'done':
+                self.rendering -= 1
+                self.done += 1
+                if self.on_done:
+                    self.on_done(job)
+            elif event == 'failed':
+                self.rendering -= 1
+                self.failed.append(job)
+                if self.on_error:
+                    self.on_error(job)
+
+            self._changed()
+
+        if self._thread.is_alive():
+            self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change(self)
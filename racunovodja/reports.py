@@ -0,0 +1,300 @@
+"""Totals over all yearly ledgers, for tax filing.
+
+Usage:
+    python -m racunovodja.reports [--year 2023] [--as-of dd.mm.yyyy]
+
+The ledgers are streamed row by row, so memory does not grow with the
+history. Partial totals and the byte offset reached in every ledger are
+kept in a checkpoint file, so a re-run only reads the rows that were
+appended since. A ledger that was rewritten (e.g. by update_record) is
+read again from the start.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+
+from . import settings as s
+
+
+CHECKPOINT = ".knjiga_porocila.json"
+
+DUE_BUCKETS = (
+    (0, "ni zapadlo"),
+    (30, "1-30 dni"),
+    (60, "31-60 dni"),
+    (90, "61-90 dni"),
+    )
+DUE_OVER = "več kot 90 dni"
+
+
+def to_cents(znesek):
+    """'1.234,56' or '123,45' -> exact integer cents"""
+    znesek = znesek.strip().replace(' ', '').replace('€', '')
+    if ',' in znesek:
+        znesek = znesek.replace('.', '').replace(',', '.')
+    cents = Decimal(znesek) * 100
+    return int(cents.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_cents(cents):
+    """12345 -> '123,45'"""
+    sign = '-' if cents < 0 else ''
+    euros, cents = divmod(abs(cents), 100)
+    return f"{sign}{euros},{cents:02d}"
+
+
+def find_ledgers(directory='.'):
+    """The yearly CSV ledgers in a directory, oldest first.
+
+    The reports, the client directory, the search and the reconciliation
+    follow the byte offsets of these files; they cannot read an SQLite
+    ledger, so they refuse to run instead of finding nothing.
+    """
+    if s.storage != 'csv':
+        raise ValueError(
+            f"Knjiga računov je v bazi ({s.storage}), ta funkcija bere "
+            f"samo knjige .csv (settings.storage = 'csv')")
+    return sorted(Path(directory).glob("knjiga_racunov_*.csv"))
+
+
+def iter_rows(path, offset=0, fieldnames=None):
+    """Yield (record, end_offset, fieldnames) for complete rows after offset.
+
+    The header row is yielded with record None.
+
+    Quoted fields may span lines, so lines are joined until the quotes
+    are balanced. A last row without a line ending is still being
+    written and is left for the next run.
+    """
+    with open(path, 'rb') as fh:
+        fh.seek(offset)
+        pending = b''
+
+        for line in fh:
+            pending += line
+            if pending.count(b'"') % 2 or not pending.endswith(b'\n'):
+                continue
+
+            row = next(csv.reader([pending.decode('utf-8')]), None)
+            offset += len(pending)
+            pending = b''
+
+            if not row:
+                continue
+            if fieldnames is None:
+                fieldnames = row
+                yield None, offset, fieldnames
+                continue
+
+            yield dict(zip(fieldnames, row)), offset, fieldnames
+
+
+def iter_records(od, do, directory='.'):
+    """Ledger records issued between od and do (dd.mm.yyyy), inclusive.
+
+    Records with line items get them as 'Postavke'.
+    """
+    # items imports this module for its amounts
+    from .items import attach_items, read_items
+
+    od = datetime.strptime(od, '%d.%m.%Y')
+    do = datetime.strptime(do, '%d.%m.%Y')
+
+    for path in find_ledgers(directory):
+        rows = (record for record, _, _ in iter_rows(path) if record)
+        # The items are read alongside, so every row passes through
+        for record in attach_items(rows, read_items(path)):
+            izdan = datetime.strptime(record['Datum izdaje'], '%d.%m.%Y')
+            if od <= izdan <= do:
+                yield record
+
+
+def _iso(date):
+    return datetime.strptime(date, '%d.%m.%Y').strftime('%Y-%m-%d')
+
+
+class LedgerReport:
+    """Incrementally maintained totals over all yearly ledgers"""
+
+    def __init__(self, directory='.', checkpoint=CHECKPOINT):
+        self.directory = Path(directory)
+        self.checkpoint = self.directory / checkpoint
+        self.files = {}
+        self.clients = {}
+
+        if self.checkpoint.exists():
+            with open(self.checkpoint, 'r', encoding='utf-8') as fh:
+                state = json.load(fh)
+            self.files = state['files']
+            self.clients = state['clients']
+
+    def _empty(self, stat):
+        return {
+            'inode': stat.st_ino,
+            'offset': 0,
+            'fieldnames': None,
+            'rows': 0,
+            # cents per 'YYYY-MM|davčna' and per due date 'YYYY-MM-DD'
+            'by_month': {},
+            'by_due_date': {},
+            }
+
+    def update(self):
+        """Read the rows appended since the last run, returns their count"""
+        new_rows = 0
+        seen = set()
+
+        for path in find_ledgers(self.directory):
+            name = path.name
+            seen.add(name)
+            stat = path.stat()
+            state = self.files.get(name)
+
+            if (
+                state is None or
+                state['inode'] != stat.st_ino or
+                stat.st_size < state['offset']
+                ):
+                state = self.files[name] = self._empty(stat)
+
+            if stat.st_size == state['offset']:
+                continue
+
+            rows = iter_rows(path, state['offset'], state['fieldnames'])
+            for record, offset, fieldnames in rows:
+                state['offset'] = offset
+                state['fieldnames'] = fieldnames
+                if record is None:
+                    continue
+
+                self._add(state, record)
+                new_rows += 1
+
+        for name in set(self.files) - seen:
+            del self.files[name]
+
+        self._save()
+        return new_rows
+
+    def _add(self, state, record):
+        cents = to_cents(record['Znesek'])
+        davcna = record['Davčna številka']
+        self.clients[davcna] = record['Naziv']
+
+        month = _iso(record['Datum izdaje'])[:7]
+        key = f"{month}|{davcna}"
+        state['by_month'][key] = state['by_month'].get(key, 0) + cents
+
+        due = _iso(record['Datum zapadlosti'])
+        state['by_due_date'][due] = state['by_due_date'].get(due, 0) + cents
+        state['rows'] += 1
+
+    def _save(self):
+        tmp = self.checkpoint.with_name(self.checkpoint.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(
+                {'files': self.files, 'clients': self.clients},
+                fh, ensure_ascii=False
+                )
+        os.replace(tmp, self.checkpoint)
+
+    def _months(self):
+        for state in self.files.values():
+            for key, cents in state['by_month'].items():
+                month, davcna = key.split('|', 1)
+                yield month, davcna, cents
+
+    def by_year(self):
+        """{year: cents}"""
+        totals = defaultdict(int)
+        for month, _, cents in self._months():
+            totals[month[:4]] += cents
+        return dict(sorted(totals.items()))
+
+    def by_month(self, year=None):
+        """{'YYYY-MM': cents}"""
+        totals = defaultdict(int)
+        for month, _, cents in self._months():
+            if year is None or month.startswith(str(year)):
+                totals[month] += cents
+        return dict(sorted(totals.items()))
+
+    def by_client(self, year=None):
+        """{davčna številka: cents}"""
+        totals = defaultdict(int)
+        for month, davcna, cents in self._months():
+            if year is None or month.startswith(str(year)):
+                totals[davcna] += cents
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def by_client_month(self, year=None):
+        """{(davčna številka, 'YYYY-MM'): cents}"""
+        totals = defaultdict(int)
+        for month, davcna, cents in self._months():
+            if year is None or month.startswith(str(year)):
+                totals[(davcna, month)] += cents
+        return dict(sorted(totals.items()))
+
+    def by_due_bucket(self, as_of=None):
+        """{bucket: cents}, by days past 'Datum zapadlosti'"""
+        as_of = as_of or datetime.today()
+        totals = {label: 0 for _, label in DUE_BUCKETS}
+        totals[DUE_OVER] = 0
+
+        for state in self.files.values():
+            for due, cents in state['by_due_date'].items():
+                days = (as_of - datetime.strptime(due, '%Y-%m-%d')).days
+                for limit, label in DUE_BUCKETS:
+                    if days <= limit:
+                        totals[label] += cents
+                        break
+                else:
+                    totals[DUE_OVER] += cents
+
+        return totals
+
+
+def _print_table(title, totals, label=str):
+    print(title)
+    for key, cents in totals.items():
+        print(f"  {label(key):<40} {format_cents(cents):>14} €")
+    print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.reports',
+        description="Seštevki knjig računov.")
+    parser.add_argument('--year', type=int, default=None)
+    parser.add_argument('--as-of', default=None,
+        help="date for the due-date buckets, dd.mm.yyyy (default: today)")
+    parser.add_argument('--directory', default='.')
+    args = parser.parse_args(argv)
+
+    report = LedgerReport(args.directory)
+    new_rows = report.update()
+    as_of = args.as_of and datetime.strptime(args.as_of, '%d.%m.%Y')
+
+    def client(davcna):
+        return f"{report.clients.get(davcna, '')} ({davcna})"
+
+    _print_table("Po letih:", report.by_year())
+    _print_table("Po mesecih:", report.by_month(args.year))
+    _print_table("Po strankah:", report.by_client(args.year), client)
+    _print_table(
+        "Po strankah in mesecih:", report.by_client_month(args.year),
+        lambda key: f"{key[1]} {client(key[0])}"
+        )
+    _print_table("Po zapadlosti:", report.by_due_bucket(as_of))
+    print(f"Novih vrstic: {new_rows}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
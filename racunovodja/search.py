@@ -0,0 +1,287 @@
+"""Full-text search over the service descriptions and notes of invoices.
+
+Usage:
+    python -m racunovodja.search "svetov jan" [--limit N]
+        [--profile NAME] [--directory DIR]
+
+The words of Opis storitve and Opomba of every ledger row are kept in
+an inverted index: {word: [row ids]}, row ids in ledger order. Words are
+case- and diacritic-folded like the client names, so 'sluzb' finds
+'službena pot'. Every word of a query is a prefix and all of them must
+match. The prefixes are looked up by bisecting the sorted words, and
+only the rows that are shown are read back from the ledgers.
+
+Like the client directory, the index is built incrementally: the words,
+the rows and the byte offset reached in every ledger are kept in a
+checkpoint file, and only rows appended since are read. A row is
+remembered by its ledger and offset and read back when it is found. A
+ledger that was rewritten (e.g. by update_record) rebuilds the index.
+
+The rows added by an update are appended to a log next to the
+checkpoint, one JSON line per update, so saving does not grow with the
+archive. The checkpoint is only rewritten, and the log emptied, once
+the log is larger than the checkpoint.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from bisect import bisect_left, insort
+from pathlib import Path
+
+from .clients import fold
+from .numbering import format_sifra
+from .profiles import get_profile
+from .reports import find_ledgers, iter_rows
+
+
+CHECKPOINT = ".iskanje.json"
+
+# The text fields that are searched
+FIELDS = ('Opis storitve', 'Opomba')
+
+WORD = re.compile(r'\w+')
+# Shorter words are not indexed, they still match as query prefixes
+MIN_LENGTH = 2
+
+
+def words(text):
+    """'Službena pot, 2x' -> ['sluzbena', 'pot', '2x']"""
+    return WORD.findall(fold(text))
+
+
+def pdf_filename(record, name):
+    """The name render_record gives the PDF of a record"""
+    sifra = format_sifra(name, record['Št. računa'], record['Datum izdaje'])
+    return f"racun_st_{sifra}_{record.get('Opomba', '')}.pdf"
+
+
+class SearchIndex:
+    """Inverted index over the text fields of all ledgers in a directory"""
+
+    def __init__(
+        self, directory='.', checkpoint=CHECKPOINT, profile=None,
+        pdf_directory='.'
+        ):
+        self.directory = Path(directory)
+        self.checkpoint = self.directory / checkpoint
+        self.log = self.checkpoint.with_name(self.checkpoint.name + '.log')
+        # The PDFs are named after the issuer and rendered in the
+        # working directory
+        self.name = get_profile(profile)['name']
+        self.pdf_directory = Path(pdf_directory)
+        self._reset()
+
+        if self.checkpoint.exists():
+            with open(self.checkpoint, 'r', encoding='utf-8') as fh:
+                state = json.load(fh)
+            self.files = state['files']
+            self.rows = state['rows']
+            self.postings = state['postings']
+            self._compact = False
+        if self.log.exists():
+            self._replay()
+        self._words = sorted(self.postings)
+
+    def _reset(self):
+        self.files = {}
+        # [ledger name, offset of the row]
+        self.rows = []
+        self.postings = {}
+        self._words = []
+        # The checkpoint is rewritten on the next save
+        self._compact = True
+
+    def _replay(self):
+        """Add the rows logged since the checkpoint was written"""
+        with open(self.log, 'r', encoding='utf-8') as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if entry is not None and entry['row'] < len(self.rows):
+                    # Already in the checkpoint, the log was not emptied
+                    continue
+                if entry is None or entry['row'] > len(self.rows):
+                    # Torn by a crash: the rest is read from the ledgers
+                    # again and the checkpoint rewritten
+                    self._compact = True
+                    break
+                for name, offset, found in entry['rows']:
+                    self._add(name, offset, found)
+                self.files.update(entry['files'])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, name, offset, record):
+        """Index one ledger row, starting at offset; returns its words"""
+        found = set()
+        for key in FIELDS:
+            found.update(words(str(record.get(key) or '')))
+        found = [word for word in found if len(word) >= MIN_LENGTH]
+        self._add(name, offset, found)
+        return found
+
+    def _add(self, name, offset, found):
+        row = len(self.rows)
+        self.rows.append([name, offset])
+
+        for word in found:
+            postings = self.postings.get(word)
+            if postings is None:
+                postings = self.postings[word] = []
+                insort(self._words, word)
+            postings.append(row)
+
+    def update(self, *_):
+        """Index the rows appended to the ledgers since the last run.
+
+        Also usable as a LedgerModel.subscribe callback: the committed
+        rows are in the ledger by then.
+        """
+        first = len(self.rows)
+        added = []
+        paths = find_ledgers(self.directory)
+
+        for path in paths:
+            stat = path.stat()
+            state = self.files.get(path.name)
+            if state is not None and (
+                state['inode'] != stat.st_ino or
+                stat.st_size < state['offset']
+                ):
+                # Rows may have moved, their offsets are no longer valid
+                self._reset()
+                return self.update()
+
+        for path in paths:
+            stat = path.stat()
+            state = self.files.get(path.name)
+            if state is None:
+                state = self.files[path.name] = {
+                    'inode': stat.st_ino, 'offset': 0, 'fieldnames': None,
+                    }
+            if stat.st_size == state['offset']:
+                continue
+
+            start = state['offset']
+            rows = iter_rows(path, start, state['fieldnames'])
+            for record, offset, fieldnames in rows:
+                state['offset'] = offset
+                state['fieldnames'] = fieldnames
+                if record is not None:
+                    found = self.add(path.name, start, record)
+                    added.append([path.name, start, found])
+                start = offset
+
+        if added:
+            self._save(first, added)
+        return len(added)
+
+    def _save(self, first, added):
+        """Log the rows added from row first on, or write a checkpoint"""
+        if not self._compact:
+            files = {name: self.files[name] for name, _, _ in added}
+            entry = {'row': first, 'files': files, 'rows': added}
+            with open(self.log, 'a', encoding='utf-8') as fh:
+                fh.write(json.dumps(
+                    entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+                logged = fh.tell()
+            if logged <= self.checkpoint.stat().st_size:
+                return
+
+        tmp = self.checkpoint.with_name(self.checkpoint.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(
+                {
+                    'files': self.files, 'rows': self.rows,
+                    'postings': self.postings,
+                    },
+                fh, ensure_ascii=False, separators=(',', ':')
+                )
+        os.replace(tmp, self.checkpoint)
+        self.log.unlink(missing_ok=True)
+        self._compact = False
+
+    def _scan(self, prefix):
+        index = bisect_left(self._words, prefix)
+        while (
+            index < len(self._words) and
+            self._words[index].startswith(prefix)
+            ):
+            yield self._words[index]
+            index += 1
+
+    def find(self, query):
+        """Ids of the rows matching every word of query, newest first"""
+        prefixes = set(words(query))
+        if not prefixes:
+            return []
+
+        found = None
+        # Longer prefixes match fewer words and rows
+        for prefix in sorted(prefixes, key=len, reverse=True):
+            rows = set()
+            for word in self._scan(prefix):
+                rows.update(self.postings[word])
+            found = rows if found is None else found & rows
+            if not found:
+                return []
+        return sorted(found, reverse=True)
+
+    def record(self, row):
+        """The ledger record of a row id"""
+        name, offset = self.rows[row]
+        fieldnames = self.files[name]['fieldnames']
+        rows = iter_rows(self.directory / name, offset, fieldnames)
+        return next(rows)[0]
+
+    def result(self, row):
+        """(record, PDF path) of a row id"""
+        record = self.record(row)
+        return record, self.pdf_directory / pdf_filename(record, self.name)
+
+    def search(self, query, limit=50):
+        """[(record, PDF path)] of the newest rows matching query"""
+        return [self.result(row) for row in self.find(query)[:limit]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.search',
+        description="Iskanje računov po opisu storitve in opombi.")
+    parser.add_argument('query', help="words or beginnings of words")
+    parser.add_argument('--limit', type=int, default=50,
+        help="most invoices shown (default: 50)")
+    parser.add_argument('--profile', default=None,
+        help="issuer profile (default: settings.profile)")
+    parser.add_argument('--directory', default=None,
+        help="ledger directory (default: that of the profile)")
+    args = parser.parse_args(argv)
+
+    directory = args.directory or get_profile(args.profile).get('directory', '.')
+    index = SearchIndex(directory, profile=args.profile)
+    index.update()
+
+    started = time.perf_counter()
+    found = index.find(args.query)
+    results = [index.result(row) for row in found[:args.limit]]
+    elapsed = time.perf_counter() - started
+
+    for record, pdf in results:
+        missing = '' if pdf.exists() else ' (ni datoteke)'
+        print(
+            f"{record['Datum izdaje']}  {record['Št. računa']:>5}  "
+            f"{record['Znesek']:>10}  {record['Naziv']}: "
+            f"{record['Opis storitve']}  {pdf}{missing}"
+            )
+    print(f"Zadetkov: {len(found)} ({elapsed * 1000:.1f} ms)")
+    return 0 if found else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
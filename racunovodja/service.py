@@ -0,0 +1,480 @@
+"""Local HTTP service for issuing invoices from other programs.
+
+Usage:
+    python -m racunovodja.service [--port 8765] [--workers N] [--queue N]
+        [--profile NAME]
+
+Only listens on 127.0.0.1. Endpoints:
+
+    POST /racuni           a record as JSON, with the keys of
+                           CSVModel.fields and optionally 'Postavke';
+                           'Št. računa' may be left out
+    GET  /racuni/<file>    the rendered PDF
+    GET  /metrics          queue depth, counters and latency histograms,
+                           in the Prometheus text format
+
+Accepted records wait in a bounded queue. A single task books them in
+the ledger in the order they arrived, grouping whatever is waiting into
+one commit, and hands them to a process pool for rendering. At most
+--workers renders run at a time; when they are all busy the queue fills
+up and new records are refused with 503 and Retry-After, instead of
+piling up in memory.
+
+The response is sent once the PDF is rendered:
+
+    201 {"sifra_racuna": "JN23-001", "racun": "/racuni/racun_st_JN23-001_.pdf"}
+
+A record with a number that was issued already is refused with 409, and
+one issued in another year than the current one with 422.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+from .batch import render_record, warm_up
+from .models import CSVModel, DuplicateInvoiceError, InvoiceYearError
+from .numbering import format_sifra
+from .items import ITEMS, summarize
+from .profiles import ProfileSession, get_profile
+from .validation import get_validator
+from . import settings as s
+
+
+HOST = '127.0.0.1'
+PORT = 8765
+QUEUE_SIZE = 64
+# Room for a record with a few thousand line items
+MAX_BODY = 1024 * 1024
+# Records booked with one commit at most
+COMMIT_BATCH = 32
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Histogram:
+    """Cumulative latency buckets, as Prometheus expects them"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+
+    def lines(self, name):
+        yield f"# TYPE {name} histogram"
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket{{le="{bound}"}} {count}'
+        yield f'{name}_bucket{{le="+Inf"}} {self.count}'
+        yield f"{name}_sum {self.sum:.6f}"
+        yield f"{name}_count {self.count}"
+
+
+class Job:
+    """A record on its way through the ledger and the renderer"""
+
+    def __init__(self, record, future):
+        self.record = record
+        self.future = future
+        self.started = time.perf_counter()
+
+    def finish(self, filename=None, error=None):
+        # The request may have been cancelled meanwhile
+        if self.future.done():
+            return
+        if error is None:
+            self.future.set_result(filename)
+        else:
+            self.future.set_exception(error)
+
+
+class InvoiceService:
+    """Books and renders records posted over HTTP, in arrival order"""
+
+    def __init__(
+        self, profile=None, workers=None, queue_size=QUEUE_SIZE,
+        render=render_record
+        ):
+        self.profile = profile or s.profile
+        self.session = ProfileSession(self.profile, get_profile(self.profile))
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.render = render
+
+        self.counters = {
+            'sprejeti': 0, 'zavrnjeni': 0, 'neveljavni': 0,
+            'izrisani': 0, 'napake': 0,
+            }
+        self.latency = {
+            'commit': Histogram(), 'render': Histogram(), 'total': Histogram(),
+            }
+        self.rendering = 0
+        self.server = None
+        self._tasks = set()
+
+    async def start(self, host=HOST, port=PORT):
+        """Start listening, returns the bound (host, port)"""
+        self._queue = asyncio.Queue(self.queue_size)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        # The workers are forked before any connection is accepted, or
+        # they would inherit its socket and keep it open after close
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._pool, warm_up, self.profile)
+        # The ledger is written from one thread, in order
+        self._ledger = ThreadPoolExecutor(max_workers=1)
+        self._booking = asyncio.create_task(self._book())
+        self.server = await asyncio.start_server(self._serve, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self._booking.cancel()
+        self._pool.shutdown()
+        self._ledger.shutdown()
+        self.session.model.close()
+
+    # Booking and rendering
+
+    def _commit(self, records):
+        """Number and book records with one commit, on the ledger thread.
+
+        Returns (record, error) of the records that were refused: issued
+        in another year than the ledger's, or with a number that was
+        issued already or by an earlier record.
+        """
+        # The year is checked on every commit, the service runs past
+        # New Year
+        self.session.renew()
+        model = self.session.model
+        allocator = self.session.allocator
+
+        refused = [
+            (record, InvoiceYearError([record], model.year))
+            for record in model.outside_year(records)
+            ]
+        refused += [
+            (record, DuplicateInvoiceError([record]))
+            for record in model.duplicates(records)
+            ]
+        records = [
+            record for record in records
+            if not any(record is other for other, _ in refused)
+            ]
+
+        blank = [record for record in records if not record['Št. računa']]
+        for record in records:
+            stevilka = record['Št. računa']
+            if stevilka and stevilka.isdigit():
+                allocator.observe(stevilka)
+        for record, stevilka in zip(blank, allocator.allocate(len(blank))):
+            record['Št. računa'] = stevilka
+
+        with model.transaction() as transaction:
+            for record in records:
+                transaction.add(record)
+        return refused
+
+    async def _book(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            jobs = [await self._queue.get()]
+            while len(jobs) < COMMIT_BATCH and not self._queue.empty():
+                jobs.append(self._queue.get_nowait())
+
+            started = time.perf_counter()
+            try:
+                refused = await loop.run_in_executor(
+                    self._ledger, self._commit, [job.record for job in jobs])
+            except Exception as e:
+                for job in jobs:
+                    job.finish(error=e)
+                continue
+            self.latency['commit'].observe(time.perf_counter() - started)
+
+            booked = []
+            for job in jobs:
+                for record, error in refused:
+                    if job.record is record:
+                        job.finish(error=error)
+                        break
+                else:
+                    booked.append(job)
+            jobs = booked
+
+            for job in jobs:
+                # Waits for a free worker, so the queue backs up meanwhile
+                await self._slots.acquire()
+                self.rendering += 1
+                task = asyncio.create_task(self._render(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _render(self, job):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            filename, _ = await loop.run_in_executor(
+                self._pool, self.render, job.record, self.profile)
+        except Exception as e:
+            self.counters['napake'] += 1
+            job.finish(error=e)
+        else:
+            self.counters['izrisani'] += 1
+            self.latency['render'].observe(time.perf_counter() - started)
+            job.finish(filename)
+        finally:
+            self.rendering -= 1
+            self._slots.release()
+
+    def sifra(self, record):
+        return format_sifra(
+            self.session.profile['name'], record['Št. računa'],
+            record['Datum izdaje'])
+
+    # HTTP
+
+    async def _serve(self, reader, writer):
+        """Answer requests on one connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._respond(
+                        writer, e.status, {'napaka': str(e)}, e.headers,
+                        close=True)
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                close = headers.get('connection', '').lower() == 'close'
+                try:
+                    status, payload, extra = await self._dispatch(
+                        method, path, body)
+                except HTTPError as e:
+                    status, payload, extra = e.status, {'napaka': str(e)}, e.headers
+                await self._respond(writer, status, payload, extra, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """(method, path, headers, body), or None at the end of a connection"""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Nepopolna zahteva")
+        except asyncio.LimitOverrunError:
+            raise HTTPError(
+                HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Glava je prevelika")
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, path, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Neveljavna zahteva")
+
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise HTTPError(
+                HTTPStatus.BAD_REQUEST, "Neveljavna dolžina zahteve")
+        if length > MAX_BODY:
+            raise HTTPError(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Zahteva je prevelika")
+        body = await reader.readexactly(length) if length else b''
+        return method, path, headers, body
+
+    async def _dispatch(self, method, path, body):
+        if path == '/racuni':
+            if method != 'POST':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Samo POST")
+            return await self._post_invoice(body)
+
+        if path.startswith('/racuni/') and method == 'GET':
+            return await self._get_pdf(unquote(path[len('/racuni/'):]))
+
+        if path == '/metrics' and method == 'GET':
+            return HTTPStatus.OK, self.metrics(), {
+                'Content-Type': 'text/plain; version=0.0.4'}
+
+        raise HTTPError(HTTPStatus.NOT_FOUND, "Ni najdeno")
+
+    async def _post_invoice(self, body):
+        try:
+            data = json.loads(body)
+            record = {
+                key: str(data.get(key) or '').strip()
+                for key in CSVModel.fields
+                }
+            if data.get(ITEMS):
+                record[ITEMS] = data[ITEMS]
+        except (ValueError, AttributeError):
+            self.counters['neveljavni'] += 1
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Pričakovan je JSON objekt")
+
+        summarize(record)
+        # Missing numbers are allocated when the record is booked
+        errors = get_validator().validate(record, skip={'Št. računa'})
+        year = self.session.model.year
+        if not errors and self.session.model.outside_year([record]):
+            # Invoices of another year belong in another ledger
+            errors = {
+                'Datum izdaje': str(InvoiceYearError([record], year))}
+        if errors:
+            self.counters['neveljavni'] += 1
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {'napake': errors}, {}
+
+        job = Job(record, asyncio.get_running_loop().create_future())
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.counters['zavrnjeni'] += 1
+            raise HTTPError(
+                HTTPStatus.SERVICE_UNAVAILABLE, "Vrsta je polna",
+                {'Retry-After': '1'})
+        self.counters['sprejeti'] += 1
+
+        try:
+            filename = await job.future
+        except DuplicateInvoiceError as e:
+            self.counters['neveljavni'] += 1
+            return HTTPStatus.CONFLICT, {'napaka': str(e)}, {}
+        except InvoiceYearError as e:
+            # The year turned while the record was queued
+            self.counters['neveljavni'] += 1
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {
+                'napake': {'Datum izdaje': str(e)}}, {}
+        except Exception as e:
+            payload = {'napaka': str(e)}
+            if record['Št. računa']:
+                # Booked, but not rendered
+                payload['sifra_racuna'] = self.sifra(record)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, payload, {}
+
+        self.latency['total'].observe(time.perf_counter() - job.started)
+        return HTTPStatus.CREATED, {
+            'sifra_racuna': self.sifra(record),
+            'racun': f"/racuni/{quote(os.path.basename(filename))}",
+            }, {}
+
+    async def _get_pdf(self, name):
+        # Only invoices, and only from the working directory
+        if (
+            os.path.basename(name) != name or
+            not name.startswith('racun_st_') or
+            not name.endswith('.pdf')
+            ):
+            raise HTTPError(HTTPStatus.NOT_FOUND, "Ni najdeno")
+        try:
+            data = await asyncio.to_thread(Path(name).read_bytes)
+        except FileNotFoundError:
+            raise HTTPError(HTTPStatus.NOT_FOUND, "Ni najdeno")
+        return HTTPStatus.OK, data, {'Content-Type': 'application/pdf'}
+
+    async def _respond(self, writer, status, payload, headers, close=False):
+        if isinstance(payload, bytes):
+            body = payload
+        elif isinstance(payload, str):
+            body = payload.encode('utf-8')
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            headers = {'Content-Type': 'application/json', **headers}
+
+        head = [f"HTTP/1.1 {status.value} {status.phrase}"]
+        headers = {
+            **headers,
+            'Content-Length': str(len(body)),
+            'Connection': 'close' if close else 'keep-alive',
+            }
+        head += [f"{key}: {value}" for key, value in headers.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    def metrics(self):
+        lines = [
+            "# TYPE racunovodja_queue_depth gauge",
+            f"racunovodja_queue_depth {self._queue.qsize()}",
+            "# TYPE racunovodja_rendering gauge",
+            f"racunovodja_rendering {self.rendering}",
+            ]
+        for name, value in self.counters.items():
+            lines.append(f"# TYPE racunovodja_{name}_total counter")
+            lines.append(f"racunovodja_{name}_total {value}")
+        for name, histogram in self.latency.items():
+            lines.extend(histogram.lines(f"racunovodja_{name}_seconds"))
+        return '\n'.join(lines) + '\n'
+
+
+async def serve(port=PORT, **kwargs):
+    service = InvoiceService(**kwargs)
+    host, port = await service.start(HOST, port)
+    print(f"Storitev posluša na http://{host}:{port}/racuni")
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.service',
+        description="Lokalna HTTP storitev za izdajo računov.")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=None,
+        help="number of render processes (default: all cores)")
+    parser.add_argument('--queue', type=int, default=QUEUE_SIZE,
+        help="records waiting before new ones are refused")
+    parser.add_argument('--profile', default=None,
+        help="issuer profile (default: settings.profile)")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(
+            args.port, profile=args.profile, workers=args.workers,
+            queue_size=args.queue))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,52 @@
-# ADD FUNCTIONALITY FOR LOGIN/MULTIPLE USERS TO AUTOMATICALLY CHANGE ALL SETTINGS
-
-# Podatki o izdajatelju računa:
-user = {
-    'name': "JANEZ NOVAK",
-    'street': "PREŠERNOVA 123",
-    'post_nr': "1234",
-    'city': "KAKOVCI",
-    'country': 'SLOVENIA',
-    'tax_nr': "12311123",
-    'iban': 'SI56 0123 4567 8901 234',
-    'bank': 'Nova Ljubljanska Banka',
-    'bic': 'LJBASI2XXXX',
-    'logo': "files/logo.png",
-    'signature': "files/podpis.png",
-    }
\ No newline at end of file
+# Podatki o izdajateljih računov, po kratkem imenu profila. Vsak profil
+# ima svojo knjigo računov in števec v mapi 'directory' (privzeto trenutna
+# mapa, ki jo lahko uporablja samo en profil). Dodatni profili se lahko
+# vpišejo v profiles_file (JSON, enake oblike), med profili se preklaplja
+# v aplikaciji.
+profiles = {
+    'janez': {
+        'name': "JANEZ NOVAK",
+        'street': "PREŠERNOVA 123",
+        'post_nr': "1234",
+        'city': "KAKOVCI",
+        'country': 'SLOVENIA',
+        'tax_nr': "12311123",
+        'iban': 'SI56 0123 4567 8901 234',
+        'bank': 'Nova Ljubljanska Banka',
+        'bic': 'LJBASI2XXXX',
+        'logo': "files/logo.png",
+        'signature': "files/podpis.png",
+        'place': "Ljutomer",
+        },
+    }
+profiles_file = "profili.json"
+
+# Izbrani profil, s katerim se aplikacija zažene
+profile = 'janez'
+
+# Podatki o izdajatelju računa (izbrani profil):
+user = profiles[profile]
+
+# Profili, ki niso bili uporabljeni toliko sekund, se sprostijo iz pomnilnika
+profile_idle = 30 * 60
+
+# Shramba knjige računov: 'csv' (knjiga_racunov_<leto>.csv) ali 'sqlite'
+storage = 'csv'
+
+# Ob izdaji računa se izvozi tudi e-račun (e-SLOG 2.0 XML); v obrazcu se
+# lahko izbere za vsak račun posebej
+eslog = False
+
+# Izris računov: 'stamp' nariše samo podatke računa na vnaprej pripravljeno
+# stran, 'full' vsakič izriše celo stran
+render_mode = 'stamp'
+
+# Sledenje: trajanja korakov shranjevanja in izrisa se zapisujejo v
+# trace_file (python -m racunovodja.tracing jih povzame)
+trace = False
+trace_file = "sledenje.jsonl"
+
+# Že izrisani računi se hranijo v tej mapi in se ob enakih podatkih samo
+# skopirajo (None izklopi predpomnilnik); velikost je v bajtih
+render_cache = ".predpomnilnik_racunov"
+render_cache_size = 200 * 1024 * 1024
@@ -0,0 +1,46 @@
+"""Startup time of the application, for the benchmark suite.
+
+Usage:
+    python -m racunovodja.startup
+
+Run in a fresh interpreter, it prints as JSON the seconds spent
+importing the application and, when a display is available, the
+seconds until the window is first painted (null otherwise).
+"""
+import json
+import sys
+import time
+
+_started = time.perf_counter()
+
+
+def measure():
+    """(import seconds, first paint seconds or None)"""
+    from .application import Application
+    imported = time.perf_counter() - _started
+
+    import tkinter as tk
+    try:
+        app = Application()
+    except tk.TclError:
+        # No display
+        return imported, None
+
+    while not app.winfo_ismapped():
+        app.update()
+    app.update_idletasks()
+    painted = time.perf_counter() - _started
+
+    app.renderer.stop()
+    app.destroy()
+    return imported, painted
+
+
+def main():
+    imported, painted = measure()
+    print(json.dumps({'import': imported, 'paint': painted}))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
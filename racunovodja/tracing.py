@@ -0,0 +1,236 @@
+"""Named timing spans of the save and render path.
+
+Tracing is off unless enable() is called (settings.trace); span() then
+returns a shared do-nothing context manager and traced functions call
+straight through, so the instrumentation costs next to nothing.
+
+When it is on, every finished span is written as one JSON line to a
+rotating trace file:
+
+    {"name": "save.ledger", "ms": 1.93, "parent": "save", "start": ...}
+
+and its duration is kept in memory for p50/p95/max per span name.
+
+Usage:
+    python -m racunovodja.tracing [sledenje.jsonl]
+"""
+import argparse
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+
+TRACE_FILE = "sledenje.jsonl"
+
+_tracer = None
+_noop = nullcontext()
+
+
+class Span:
+    """Times the block it wraps and reports it to the tracer"""
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *_):
+        seconds = time.perf_counter() - self._started
+        self.tracer._stack().pop()
+        self.tracer.record(self, seconds, exc_type)
+        return False
+
+
+class Tracer:
+    """Writes spans to a rotating file and keeps their recent durations"""
+
+    def __init__(self, path=TRACE_FILE, max_bytes=1000000, backups=3,
+        keep=1000):
+        self.path = Path(path)
+        self.keep = keep
+        self.durations = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        handler = RotatingFileHandler(
+            self.path, maxBytes=max_bytes, backupCount=backups,
+            encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger = logging.getLogger(f"{__name__}.{id(self)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(handler)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name):
+        return Span(self, name)
+
+    def record(self, span, seconds, exc_type=None):
+        entry = {
+            'name': span.name,
+            'ms': round(seconds * 1000, 3),
+            'parent': span.parent,
+            'start': round(span.start, 6),
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            }
+        if exc_type is not None:
+            entry['error'] = exc_type.__name__
+
+        with self._lock:
+            durations = self.durations.get(span.name)
+            if durations is None:
+                durations = self.durations[span.name] = deque(maxlen=self.keep)
+            durations.append(seconds)
+
+        self.logger.info(json.dumps(entry, ensure_ascii=False))
+
+    def stats(self):
+        """{name: {'count', 'p50', 'p95', 'max'}}, in milliseconds"""
+        with self._lock:
+            durations = {
+                name: list(values) for name, values in self.durations.items()
+                }
+        return {
+            name: summarize(values, 1000)
+            for name, values in sorted(durations.items())
+            }
+
+    def close(self):
+        for handler in self.logger.handlers[:]:
+            handler.close()
+            self.logger.removeHandler(handler)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    index = max(0, min(len(values) - 1, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+def summarize(values, scale=1):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.50) * scale,
+        'p95': percentile(values, 0.95) * scale,
+        'max': values[-1] * scale,
+        }
+
+
+def enable(path=TRACE_FILE, **kwargs):
+    """Start tracing to path, returns the tracer"""
+    global _tracer
+    disable()
+    _tracer = Tracer(path, **kwargs)
+    return _tracer
+
+
+def disable():
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = None
+
+
+def tracer():
+    """The active tracer, or None"""
+    return _tracer
+
+
+def span(name):
+    """A context manager timing the block as name"""
+    if _tracer is None:
+        return _noop
+    return Span(_tracer, name)
+
+
+def traced(name):
+    """Decorator timing every call of a function as name"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with Span(_tracer, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def status():
+    """A short summary for the status bar, '' when tracing is off"""
+    if _tracer is None:
+        return ''
+    stats = _tracer.stats()
+    parts = [
+        f"{name} p95 {stats[name]['p95']:.0f} ms"
+        for name in ('save', 'render') if name in stats
+        ]
+    return ', '.join(parts)
+
+
+def read_trace(path=TRACE_FILE):
+    """All spans in the trace file and its rotated backups, oldest first"""
+    path = Path(path)
+    backups = [
+        backup for backup in path.parent.glob(path.name + '.*')
+        if backup.suffix[1:].isdigit()
+        ]
+    backups.sort(key=lambda backup: -int(backup.suffix[1:]))
+    for name in backups + [path]:
+        if not name.exists():
+            continue
+        with open(name, 'r', encoding='utf-8') as fh:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.tracing',
+        description="Trajanja korakov shranjevanja in izrisa računov.")
+    parser.add_argument('file', nargs='?', default=TRACE_FILE)
+    args = parser.parse_args(argv)
+
+    durations = {}
+    for entry in read_trace(args.file):
+        durations.setdefault(entry['name'], []).append(entry['ms'])
+
+    if not durations:
+        print("Sledenje je prazno.")
+        return 0
+
+    print(f"{'span':<24}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, values in sorted(durations.items()):
+        stats = summarize(values)
+        print(
+            f"{name:<24}{stats['count']:>8}{stats['p50']:>10.2f}"
+            f"{stats['p95']:>10.2f}{stats['max']:>10.2f}"
+            )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
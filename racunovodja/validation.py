@@ -0,0 +1,237 @@
+"""Validation of ledger records, compiled once from the field specs.
+
+Every field of LedgerModel.fields is turned into a single check
+function: value -> error message or None. The check covers the 'req'
+flag, the FieldTypes type and an optional 'format' of the spec. Rules
+that span several fields run after the field checks of a record.
+
+The same compiled checks are used by the form widgets, batch invoicing
+and the bulk validator:
+
+    python -m racunovodja.validation racuni.csv
+"""
+import argparse
+import csv
+import re
+import sys
+from datetime import date
+from pathlib import Path
+
+from .constants import FieldTypes as FT
+from .items import (
+    ITEMS, Totals, check_items, format_decimal, has_items, iter_items)
+from .layout import SKUPAJ_WIDTH, VREDNOST_WIDTH, ZNESEK_WIDTH
+from .models import LedgerModel
+from .reports import format_cents
+
+
+REQUIRED = "A value is required"
+
+DATE = re.compile(r'(\d\d)\.(\d\d)\.(\d{4})', re.ASCII)
+# '123', '123,4', '1234,56' or '1.234,56'
+AMOUNT = re.compile(r'(\d{1,3}(\.\d{3})+|\d+)(,\d{1,2})?', re.ASCII)
+# The longest amount that fits its column, with the '€', e.g. '999999,99'
+AMOUNT_LENGTH = ZNESEK_WIDTH - 1
+INTEGER = re.compile(r'\d+', re.ASCII)
+# Slovenian 'SI12345678' or '12345678', or another EU VAT number: a
+# country prefix other than SI and 8 to 12 characters, with digits
+TAX_NUMBER = re.compile(
+    r'(SI)?\d{8}|(?!SI)[A-Z]{2}(?=[0-9A-Z+*]*\d)[0-9A-Z+*]{8,12}', re.ASCII)
+
+
+def parse_date(value):
+    """'05.04.2023' -> date, or None"""
+    match = DATE.fullmatch(value)
+    if match is None:
+        return None
+    day, month, year = match.groups()
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def check_date(value):
+    if parse_date(value) is None:
+        return "Datum mora biti v obliki dd.mm.llll"
+
+
+def check_amount(value):
+    if AMOUNT.fullmatch(value) is None:
+        return "Znesek mora biti v obliki 123,45"
+    # Amounts are never cut on the invoice
+    if len(value) > AMOUNT_LENGTH:
+        return f"Znesek je predolg, največ {AMOUNT_LENGTH} znakov"
+
+
+def check_integer(value):
+    if INTEGER.fullmatch(value) is None:
+        return "Vnesite samo števke"
+
+
+def check_tax_number(value):
+    if TAX_NUMBER.fullmatch(value.replace(' ', '')) is None:
+        return "Davčna številka mora biti v obliki SI12345678"
+
+
+def check_address(value):
+    if ', ' not in value:
+        return "Naslov mora biti v obliki 'Ulica 12, 1000 Mesto'"
+
+
+type_checks = {
+    FT.date_string: check_date,
+    FT.decimal: check_amount,
+    FT.integer: check_integer,
+    }
+
+format_checks = {
+    'tax_number': check_tax_number,
+    'address': check_address,
+    }
+
+
+def compile_field(spec):
+    """The check function of one field spec"""
+    required = spec.get('req', False)
+    checks = [
+        check for check in (
+            type_checks.get(spec.get('type')),
+            format_checks.get(spec.get('format')),
+            )
+        if check is not None
+        ]
+
+    def check(value):
+        value = value.strip()
+        if not value:
+            return REQUIRED if required else None
+        for check in checks:
+            message = check(value)
+            if message:
+                return message
+        return None
+
+    return check
+
+
+def due_after_issue(record):
+    """Datum zapadlosti must not be before Datum izdaje"""
+    izdaja = parse_date(record.get('Datum izdaje', ''))
+    zapadlost = parse_date(record.get('Datum zapadlosti', ''))
+    if izdaja and zapadlost and zapadlost < izdaja:
+        return {'Datum zapadlosti': "Datum zapadlosti je pred datumom izdaje"}
+    return {}
+
+
+def items_fit(record):
+    """The amounts of line items must fit their columns on the invoice"""
+    if not has_items(record) or check_items(record):
+        return {}
+    result = Totals()
+    for number, item in enumerate(iter_items(record), start=1):
+        if (
+            len(format_decimal(item.cena, 2)) > AMOUNT_LENGTH or
+            len(format_cents(item.skupaj)) >= VREDNOST_WIDTH
+            ):
+            return {ITEMS: f"postavka {number}: znesek je predolg za račun"}
+        result.add(item)
+    if len(format_cents(max(result.vrednost, result.skupaj))) >= SKUPAJ_WIDTH:
+        return {ITEMS: "Skupni znesek postavk je predolg za račun"}
+    return {}
+
+
+RULES = (due_after_issue, check_items, items_fit)
+
+
+class ValidationReport:
+    """Errors of many records as {row: {field: message}}, rows from 1"""
+
+    def __init__(self):
+        self.rows = 0
+        self.errors = {}
+
+    def __bool__(self):
+        return not self.errors
+
+    @property
+    def invalid(self):
+        return len(self.errors)
+
+    def format(self):
+        lines = []
+        for row, fields in self.errors.items():
+            for key, message in fields.items():
+                lines.append(f"vrstica {row}, {key}: {message}")
+        return "\n".join(lines)
+
+
+class RecordValidator:
+    """All field checks and cross-field rules of a ledger"""
+
+    def __init__(self, fields=LedgerModel.fields, rules=RULES):
+        self.checks = [(key, compile_field(spec)) for key, spec in fields.items()]
+        self.rules = rules
+
+    def validate(self, record, skip=()):
+        """{field: message} for one record, empty when it is valid"""
+        errors = {}
+        for key, check in self.checks:
+            if key in skip:
+                continue
+            message = check(str(record.get(key) or ''))
+            if message:
+                errors[key] = message
+
+        for rule in self.rules:
+            for key, message in rule(record).items():
+                errors.setdefault(key, message)
+
+        return errors
+
+    def validate_many(self, records, skip=()):
+        """Validate an iterable of records in one pass"""
+        report = ValidationReport()
+        validate = self.validate
+
+        for row, record in enumerate(records, start=1):
+            report.rows = row
+            errors = validate(record, skip)
+            if errors:
+                report.errors[row] = errors
+
+        return report
+
+    def validate_file(self, path, skip=()):
+        """Validate a .csv file without loading it into memory"""
+        with open(path, 'r', newline='', encoding='utf-8') as fh:
+            return self.validate_many(csv.DictReader(fh), skip)
+
+
+_validator = None
+
+
+def get_validator():
+    """The validator of LedgerModel.fields, compiled on first use"""
+    global _validator
+    if _validator is None:
+        _validator = RecordValidator()
+    return _validator
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m racunovodja.validation',
+        description="Preverjanje zapisov v .csv datoteki.")
+    parser.add_argument('file', type=Path)
+    args = parser.parse_args(argv)
+
+    report = get_validator().validate_file(args.file)
+    if report.errors:
+        print(report.format())
+    print(f"Vrstic: {report.rows}, z napakami: {report.invalid}")
+    return 0 if report else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,9 +3,11 @@ from tkinter import ttk
 from datetime import datetime, timedelta
 from pathlib import Path
 import os
+import webbrowser
 
 from . import widgets as w
 from . import settings as s
+from .validation import RULES
 
 
 class DataRecordForm(ttk.Frame):
@@ -22,10 +24,35 @@ class DataRecordForm(ttk.Frame):
     def _on_save(self):
         self.event_generate('<<SaveRecord>>')
 
-    def __init__(self, parent, model, *args, **kwargs):
+    def _client_input(self):
+        """LabelInput arguments of a field that suggests past clients"""
+        if self.clients is None:
+            return {}
+        return {
+            'input_class': w.ClientCombobox,
+            'input_args': {
+                'lookup': self._lookup_clients,
+                'on_select': self._fill_client,
+                },
+            }
+
+    def _lookup_clients(self, prefix):
+        return self.clients.lookup(prefix)
+
+    def _fill_client(self, client):
+        """Fill in all recipient fields from a past client"""
+        for key, value in client.items():
+            self._vars[key].set(value)
+
+    def __init__(
+        self, parent, model, *args, allocator=None, clients=None, **kwargs
+        ):
         super().__init__(parent, *args, **kwargs)
 
         self.model = model
+        self.allocator = allocator
+        self.clients = clients
+        self.suggested_number = None
         fields = self.model.fields
 
         self._vars = {
@@ -33,7 +60,7 @@ class DataRecordForm(ttk.Frame):
         'Naziv': tk.StringVar(),
         'Naslov': tk.StringVar(),
         'Davčna številka': tk.StringVar(),
-        'Matična številka': tk.IntVar(),
+        'Matična številka': tk.StringVar(),
         'Opis storitve': tk.StringVar(),
         'Datum izdaje': tk.StringVar(),
         'Datum opravljene storitve': tk.StringVar(),
@@ -45,14 +72,14 @@ class DataRecordForm(ttk.Frame):
         p_info = self._add_frame("Prejemnik:")
 
         w.LabelInput(p_info, "Naziv", field_spec=fields['Naziv'], 
-            var=self._vars['Naziv']
+            var=self._vars['Naziv'], **self._client_input()
             ).grid(row=0, column=0)
         w.LabelInput(p_info, "Naslov", field_spec=fields['Naslov'],
             var=self._vars['Naslov']
             ).grid(row=0, column=1)
         w.LabelInput(p_info, "Davčna številka", 
             field_spec=fields['Davčna številka'], 
-            var=self._vars['Davčna številka'] 
+            var=self._vars['Davčna številka'], **self._client_input()
             ).grid(row=1, column=0)
         w.LabelInput(p_info, "Matična številka", 
             field_spec=fields['Matična številka'], 
@@ -94,6 +121,11 @@ class DataRecordForm(ttk.Frame):
 
         self.resetbutton = ttk.Button(buttons, text='Ponastavi', command=self.reset)
         self.resetbutton.pack(side=tk.RIGHT)
+
+        # Not a ledger field, so it is kept when the form is reset
+        self.eslog = tk.BooleanVar(value=s.eslog)
+        ttk.Checkbutton(buttons, text='e-račun (XML)', variable=self.eslog
+            ).pack(side=tk.LEFT)
         self.reset()
 
     def reset(self):
@@ -106,7 +138,10 @@ class DataRecordForm(ttk.Frame):
         datum_zapadlosti = (datetime.today() + timedelta(days=14)).strftime("%d.%m.%Y")
         self._vars['Datum izdaje'].set(datum_izdaje)
         self._vars['Datum zapadlosti'].set(datum_zapadlosti)
-        #self._vars['Št. računa'].set('1')
+
+        if self.allocator:
+            self.suggested_number = self.allocator.peek()
+            self._vars['Št. računa'].set(self.suggested_number)
 
         #"""FOR TESTING PURPOUSES:
         self._vars['Datum opravljene storitve'].set(datum_izdaje)
@@ -118,6 +153,18 @@ class DataRecordForm(ttk.Frame):
         self._vars['Opis storitve'].set('Delo na črno')
         #"""
 
+    def set_allocator(self, allocator):
+        """Suggest numbers of another allocator, e.g. of another issuer"""
+        self.allocator = allocator
+        number = self._vars['Št. računa']
+        if not number.get() or number.get() == self.suggested_number:
+            self.suggested_number = allocator.peek()
+            number.set(self.suggested_number)
+
+    def set_clients(self, clients):
+        """Suggest the clients of another issuer"""
+        self.clients = clients
+
     def get(self):
         data = dict()
         
@@ -143,6 +190,15 @@ class DataRecordForm(ttk.Frame):
             if error.get():
                 errors[key] = error.get()
 
+        # A blank number is allocated when the record is saved
+        if not self._vars['Št. računa'].get():
+            errors.pop('Št. računa', None)
+
+        # Rules across fields, e.g. the due date after the issue date
+        if not errors:
+            for rule in RULES:
+                errors.update(rule(self.get()))
+
         return errors
 
     def get_stevilka_racuna(self):
@@ -150,3 +206,63 @@ class DataRecordForm(ttk.Frame):
 
     def get_naslov_racuna(self):
         return self._vars['Opomba'].get()
+
+
+class SearchFrame(ttk.LabelFrame):
+    """Past invoices found by their service description and note"""
+
+    columns = {
+        'Datum izdaje': 80,
+        'Št. računa': 70,
+        'Naziv': 160,
+        'Opis storitve': 260,
+        'Znesek': 80,
+        }
+
+    def __init__(self, parent, search, *args, limit=50, **kwargs):
+        super().__init__(parent, *args, text="Iskanje računov:", **kwargs)
+        self.search = search
+        self.limit = limit
+        self._pdfs = {}
+        self.columnconfigure(0, weight=1)
+
+        self.query = tk.StringVar()
+        entry = ttk.Entry(self, textvariable=self.query)
+        entry.grid(row=0, column=0, sticky=tk.W + tk.E)
+        entry.bind('<KeyRelease>', self._search)
+
+        self.results = ttk.Treeview(
+            self, columns=list(self.columns), show='headings', height=6)
+        for column, width in self.columns.items():
+            self.results.heading(column, text=column)
+            self.results.column(column, width=width)
+        self.results.grid(row=1, column=0, sticky=tk.W + tk.E)
+        # A double click opens the PDF of an invoice
+        self.results.bind('<Double-1>', self._open)
+
+        self.found = tk.StringVar()
+        ttk.Label(self, textvariable=self.found).grid(row=2, sticky=tk.W)
+
+    def _search(self, *_):
+        self.results.delete(*self.results.get_children())
+        self._pdfs = {}
+        query = self.query.get()
+        if not query.strip():
+            self.found.set('')
+            return
+
+        results = self.search(query, self.limit)
+        for record, pdf in results:
+            item = self.results.insert('', tk.END,
+                values=[record[column] for column in self.columns])
+            self._pdfs[item] = pdf
+        self.found.set(f"Zadetkov: {len(results)}")
+
+    def _open(self, *_):
+        pdf = self._pdfs.get(self.results.focus())
+        if pdf is None:
+            return
+        if not pdf.exists():
+            self.found.set(f"Datoteka {pdf} ne obstaja.")
+            return
+        webbrowser.open(pdf.resolve().as_uri())
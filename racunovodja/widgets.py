@@ -1,8 +1,8 @@
 import tkinter as tk
 from tkinter import ttk
-from datetime import datetime
 from decimal import Decimal, InvalidOperation
 from .constants import FieldTypes as FT
+from .validation import compile_field
 
 
 class BoundText(tk.Text):
@@ -31,10 +31,18 @@ class BoundText(tk.Text):
 
 
 class ValidatedMixin:
-    """Adds validation functionality to an input widget"""
+    """Adds validation functionality to an input widget.
 
-    def __init__(self, *args, error_var=None, **kwargs):
+    On focus-out the value is checked with a compiled field check from
+    validation.compile_field, the same one batch imports use.
+    """
+
+    # Used when no field spec is given
+    default_spec = {'req': False}
+
+    def __init__(self, *args, error_var=None, check=None, **kwargs):
         self.error = error_var or tk.StringVar()
+        self.check = check or compile_field(self.default_spec)
         super().__init__(*args, **kwargs)
 
         vcmd = self.register(self._validate)
@@ -69,6 +77,10 @@ class ValidatedMixin:
         return valid
 
     def _focusout_validate(self, **kwargs):
+        message = self.check(self.get())
+        if message:
+            self.error.set(message)
+            return False
         return True
 
     def _key_validate(self, **kwargs):
@@ -100,19 +112,45 @@ class ValidatedMixin:
 class RequiredEntry(ValidatedMixin, ttk.Entry):
     """An Entry that requires a value"""
 
-    def _focusout_validate(self, event):
-        valid = True
-        
-        if not self.get():
-            valid = False
-            self.error.set("A value is required")
-        
-        return valid
+    default_spec = {'req': True}
+
+
+class ClientCombobox(ValidatedMixin, ttk.Combobox):
+    """A required Combobox suggesting past clients while typing"""
+
+    default_spec = {'req': True}
+
+    def __init__(self, *args, lookup=None, on_select=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lookup = lookup
+        self.on_select = on_select
+        self._suggestions = {}
+
+        self.bind('<KeyRelease>', self._suggest)
+        self.bind('<<ComboboxSelected>>', self._select)
+
+    def _suggest(self, event):
+        if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
+
+        clients = self.lookup(self.get()) if self.lookup else []
+        self._suggestions = {
+            f"{client['Naziv']} ({client['Davčna številka']})": client
+            for client in clients
+            }
+        self.configure(values=list(self._suggestions))
+
+    def _select(self, *_):
+        client = self._suggestions.get(self.get())
+        if client and self.on_select:
+            self.on_select(client)
 
 
 class DateEntry(ValidatedMixin, ttk.Entry):
     """An Entry that only accepts ISO Date strings"""
 
+    default_spec = {'req': True, 'type': FT.date_string}
+
     def _key_validate(self, action, index, char, **kwargs):
         valid = True
 
@@ -127,21 +165,6 @@ class DateEntry(ValidatedMixin, ttk.Entry):
 
         return valid
 
-    def _focusout_validate(self, event):
-        valid = True
-
-        if not self.get():
-            self.error.set('Datum je potrebno vnesti')
-            valid = False
-        
-        try:
-            datetime.strptime(self.get(), '%d.%m.%Y')
-        except ValueError:
-            self.error.set('Nepravilen vnos')
-            valid = False
-        
-        return valid
-
 
 class LabelInput(tk.Frame):
     """A widget containing a label and input together."""
@@ -177,6 +200,8 @@ class LabelInput(tk.Frame):
                 input_args['increment'] = field_spec.get('inc')
             if 'values' in field_spec and 'values' not in input_args:
                 input_args['values'] = field_spec.get('values')
+            if issubclass(input_class, ValidatedMixin):
+                input_args.setdefault('check', compile_field(field_spec))
 
         if input_class in (ttk.Checkbutton, ttk.Button):
             input_args["text"] = label
@@ -0,0 +1,64 @@
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from racunovodja.models import CSVModel
+
+FILES = Path(__file__).resolve().parent.parent / "files"
+
+
+class Today(datetime):
+    """A datetime whose today() is set by the today fixture"""
+
+    date = datetime(2026, 10, 18)
+
+    @classmethod
+    def today(cls):
+        return cls.date
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """An empty working directory for the ledgers and counters"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def today(monkeypatch):
+    """Fix the date the ledgers are opened by; set today.date to move on"""
+    monkeypatch.setattr(Today, 'date', Today.date)
+    for module in ('profiles', 'hotfolder'):
+        monkeypatch.setattr(f'racunovodja.{module}.datetime', Today)
+    return Today
+
+
+@pytest.fixture
+def assets(workdir):
+    """The font, logo and signature, where the profiles expect them"""
+    (workdir / "files").symlink_to(FILES)
+    return workdir
+
+
+@pytest.fixture
+def make_record():
+    """make_record('5', {'Znesek': '12,00'}) -> a valid ledger record"""
+
+    def make(stevilka='', fields=None):
+        record = {key: '' for key in CSVModel.fields}
+        record.update({
+            'Št. računa': stevilka,
+            'Naziv': "Podjetje d.o.o.",
+            'Naslov': "Gozdna pot 1, 1234 Hosta",
+            'Davčna številka': "SI12345678",
+            'Opis storitve': "Svetovanje",
+            'Datum izdaje': "01.02.2026",
+            'Datum opravljene storitve': "01.02.2026",
+            'Datum zapadlosti': "01.03.2026",
+            'Znesek': "100,00",
+            })
+        record.update(fields or {})
+        return record
+
+    return make
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from racunovodja.batch import load_records, run_batch
+from racunovodja.models import CSVModel
+from racunovodja.numbering import InvoiceNumberAllocator
+
+LEDGER = "knjiga_racunov_2026.csv"
+
+
+@pytest.fixture
+def model(assets):
+    return CSVModel(LEDGER, 2026)
+
+
+@pytest.fixture
+def allocator(model):
+    return InvoiceNumberAllocator("JANEZ NOVAK", 2026, model=model)
+
+
+def numbers(model):
+    return [record['Št. računa'] for record in model.get_all_records()]
+
+
+def test_load_records(workdir):
+    path = workdir / "racuni.json"
+    path.write_text(json.dumps({
+        'Naziv': " Podjetje d.o.o. ", 'Znesek': 5,
+        'Postavke': [{'Opis': "Prevod", 'Cena': '12,50', 'Količina': '2'}],
+        }), encoding='utf-8')
+
+    [record] = load_records(path)
+    assert set(CSVModel.fields) < set(record)
+    assert record['Naziv'] == "Podjetje d.o.o."
+    # The amount of an invoice with items is their total
+    assert (record['Znesek'], record['Opis storitve']) == ('25,00', "Prevod")
+
+
+def test_batch_is_booked_in_file_order(model, allocator, make_record):
+    records = [make_record(), make_record('7'), make_record()]
+
+    result = run_batch(records, model=model, allocator=allocator, workers=2)
+
+    assert result.failed == []
+    assert [record['Št. računa'] for record, _, _ in result.invoices] == [
+        '8', '7', '9']
+    assert numbers(model) == ['8', '7', '9']
+    for _, filename, _ in result.invoices:
+        assert (model.file.parent / filename).exists()
+    assert allocator.peek() == '10'
+
+
+def test_failed_renders_leave_no_gaps(model, allocator, make_record):
+    # The PDF of the second record cannot be written
+    records = [
+        make_record(), make_record(fields={'Opomba': "ni/mape"}),
+        make_record(), make_record(),
+        ]
+
+    result = run_batch(
+        records, model=model, allocator=allocator, workers=2, eslog=True)
+
+    [(record, error)] = result.failed
+    assert record is records[1] and record['Št. računa'] == ''
+    assert isinstance(error, OSError)
+    assert numbers(model) == ['1', '2', '3']
+    assert sorted(path.name for path in model.file.parent.glob('*.pdf')) == [
+        "racun_st_JN26-001_.pdf", "racun_st_JN26-002_.pdf",
+        "racun_st_JN26-003_.pdf",
+        ]
+    assert len(list(model.file.parent.glob('*.xml'))) == 3
+    assert allocator.next() == '4'
@@ -0,0 +1,53 @@
+import os
+
+from racunovodja.cache import RenderCache
+
+KEY = 'ab' + '0' * 62
+OTHER = 'cd' + '0' * 62
+
+
+def pdf(path, size=100):
+    path.write_bytes(b'%PDF' + b'x' * (size - 4))
+    return path
+
+
+def test_fetch_gives_a_copy(workdir):
+    cache = RenderCache(workdir / "cache")
+    cache.store(KEY, pdf(workdir / "racun.pdf"))
+
+    dest = workdir / "kopija.pdf"
+    assert cache.fetch(KEY, dest)
+    # Editing the invoice leaves the cached entry as it was
+    assert not os.path.samefile(dest, cache._path(KEY))
+    dest.write_bytes(b'spremenjeno')
+    assert cache._path(KEY).read_bytes().startswith(b'%PDFxx')
+    assert cache.fetch(KEY, dest) and dest.read_bytes().startswith(b'%PDF')
+    assert (cache.hits, cache.misses) == (2, 0)
+    assert not list(workdir.glob('.*.tmp'))
+
+
+def test_missing_entry_is_a_miss(workdir):
+    cache = RenderCache(workdir / "cache")
+    dest = workdir / "racun.pdf"
+
+    assert not cache.fetch(KEY, dest)
+    cache.store(KEY, pdf(workdir / "vir.pdf"))
+    cache._path(KEY).unlink()
+    assert not cache.fetch(KEY, dest)
+    assert not dest.exists()
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_least_recently_used_are_evicted(workdir):
+    cache = RenderCache(workdir / "cache", max_bytes=250)
+    cache.store(KEY, pdf(workdir / "prvi.pdf"))
+    cache.store(OTHER, pdf(workdir / "drugi.pdf"))
+    os.utime(cache._path(KEY), ns=(1, 1))
+    assert cache.fetch(KEY, workdir / "racun.pdf")
+    os.utime(cache._path(OTHER), ns=(2, 2))
+
+    cache.store('ef' + '0' * 62, pdf(workdir / "tretji.pdf"))
+
+    assert cache._path(KEY).exists()
+    assert not cache._path(OTHER).exists()
+    assert cache.size() == 200
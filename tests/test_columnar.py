@@ -0,0 +1,55 @@
+from datetime import date
+
+import pytest
+
+from racunovodja.columnar import ColumnarLedger
+from racunovodja.models import CSVModel
+
+
+@pytest.fixture
+def ledger(workdir, make_record):
+    model = CSVModel("knjiga_racunov_2026.csv")
+    with model.transaction() as transaction:
+        transaction.add(make_record('1'))
+        transaction.add(make_record('2', {
+            'Znesek': '1250,05', 'Datum zapadlosti': '01.05.2026',
+            'Matična številka': '1234567000'}))
+        # A credit note
+        transaction.add(make_record('3', {
+            'Znesek': '-0,50', 'Naziv': "Drugo podjetje d.o.o."}))
+    return model
+
+
+def test_values_read_back(ledger):
+    with ColumnarLedger(ledger.file) as columns:
+        records = ledger.get_all_records()
+        assert columns.rows == len(records) == 3
+        for row, record in enumerate(records):
+            for key in ('Znesek', 'Naziv', 'Datum zapadlosti',
+                        'Matična številka'):
+                assert columns.value(key, row) == record[key], key
+
+
+def test_filters_and_sums(ledger):
+    with ColumnarLedger(ledger.file) as columns:
+        assert columns.sum('Znesek') == 10000 + 125005 - 50
+        mask = columns.where('Naziv', '==', "Podjetje d.o.o.")
+        assert columns.count(mask) == 2
+        assert columns.sum('Znesek', mask) == 135005
+        assert columns.group_sum('Znesek', 'Naziv') == {
+            "Podjetje d.o.o.": 135005, "Drugo podjetje d.o.o.": -50}
+        assert columns.overdue(date(2026, 4, 1)) == 10000 - 50
+        assert columns.overdue(date(2026, 4, 1), [True, False, False]) == -50
+
+
+def test_sidecar_follows_the_ledger(ledger, make_record):
+    columns = ColumnarLedger(ledger.file)
+    before = columns.column('Znesek')
+    ledger.save_record(make_record('4', {'Znesek': '7,00'}))
+
+    columns.refresh()
+    assert columns.rows == 4
+    assert columns.value('Znesek', 3) == '7,00'
+    # Columns handed out earlier are a snapshot
+    assert len(before) == 3
+    columns.close()
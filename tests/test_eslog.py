@@ -0,0 +1,79 @@
+import io
+from xml.etree import ElementTree
+
+import pytest
+
+from racunovodja.eslog import NAMESPACE, export_record, write_invoice
+from racunovodja.items import ITEMS
+
+NS = {'e': NAMESPACE}
+
+
+def document(record):
+    fh = io.BytesIO()
+    write_invoice(fh, record)
+    return ElementTree.fromstring(fh.getvalue())
+
+
+def buyer(root):
+    for nad in root.iterfind('.//e:S_NAD', NS):
+        if nad.findtext('e:D_3035', namespaces=NS) == 'BY':
+            return nad
+
+
+def totals(root):
+    return {
+        moa.findtext('e:D_5025', namespaces=NS):
+            moa.findtext('e:D_5004', namespaces=NS)
+        for moa in root.iterfind('e:M_INVOIC/e:G_SG50/e:S_MOA/e:C_C516', NS)
+        }
+
+
+@pytest.mark.parametrize('tax_number, address, country', [
+    ('SI12345678', "Gozdna pot 1, 1234 Hosta", 'SI'),
+    ('12345678', "Gozdna pot 1, 1234 Hosta", 'SI'),
+    ('DE123456789', "Hauptstraße 1, 10115 Berlin", 'DE'),
+    ('EL123456789', "Odos 1, 10431 Atene", 'GR'),
+    ('', "Hauptstraße 1, 10115 Berlin, Nemčija", 'DE'),
+    ('', "Ringstraße 2, 1010 Dunaj, AT", 'AT'),
+    ])
+def test_buyer_country(make_record, tax_number, address, country):
+    record = make_record('1', {
+        'Davčna številka': tax_number, 'Naslov': address})
+
+    nad = buyer(document(record))
+    assert nad.findtext('e:D_3207', namespaces=NS) == country
+    assert nad.findtext('e:C_C059/e:D_3042', namespaces=NS) == (
+        address.split(', ')[0])
+    assert nad.findtext('e:D_3251', namespaces=NS) == (
+        address.split(', ')[1].split()[0])
+
+
+def test_invoice_without_items(make_record):
+    root = document(make_record('1', {'Znesek': '1.234,50'}))
+
+    assert root.findtext('e:M_INVOIC/e:S_UNH/e:D_0062', namespaces=NS) == (
+        'JN26-001')
+    assert totals(root) == {
+        '79': '1234.50', '389': '1234.50', '176': '0.00', '388': '1234.50',
+        '9': '1234.50'}
+    assert len(root.findall('.//e:G_SG26', NS)) == 1
+
+
+def test_invoice_with_items(workdir, make_record):
+    record = make_record('1', {ITEMS: [
+        {'Opis': "Prevod", 'Količina': '2', 'EM': 'ura', 'Cena': '50'},
+        {'Opis': "Lektura", 'Količina': '1', 'Cena': '100', 'Popust': '10',
+         'DDV': '22'},
+        ]})
+
+    path = export_record(record, directory=workdir)
+
+    assert path.name == "eracun_st_JN26-001_.xml"
+    root = ElementTree.parse(path).getroot()
+    assert totals(root) == {
+        '79': '190.00', '389': '190.00', '176': '19.80', '388': '209.80',
+        '9': '209.80'}
+    units = [
+        unit.text for unit in root.iterfind('.//e:C_C186/e:D_6411', NS)]
+    assert units == ['HUR', 'H87']
@@ -0,0 +1,24 @@
+from racunovodja.export import export
+
+
+def records(make_record, count):
+    return (make_record(str(number)) for number in range(1, count + 1))
+
+
+def test_files_are_numbered_only_when_split(assets, make_record):
+    out = assets / "racuni.pdf"
+
+    assert export(records(make_record, 2), out, per_file=2) == [out]
+    assert export(records(make_record, 5), out, per_file=2) == [
+        assets / "racuni_001.pdf", assets / "racuni_002.pdf",
+        assets / "racuni_003.pdf",
+        ]
+    for path in assets.glob('racuni*.pdf'):
+        assert path.read_bytes().startswith(b'%PDF')
+
+
+def test_single_file(assets, make_record):
+    out = assets / "vsi.pdf"
+
+    assert export(records(make_record, 3), out, per_file=0) == [out]
+    assert export(iter(()), out) == []
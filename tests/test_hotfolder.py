@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+
+import pytest
+
+from racunovodja.hotfolder import (
+    CLAIMED, FAILED, PROCESSED, HotFolder, PollingWatcher)
+
+
+@pytest.fixture
+def inbox(assets, today):
+    return assets / "narocila"
+
+
+@pytest.fixture
+def folder(inbox):
+    folder = HotFolder(inbox, workers=1, poll=True, log=lambda line: None)
+    yield folder
+    folder.model.close()
+
+
+def drop(inbox, name, records):
+    path = inbox / name
+    path.write_text(json.dumps(records), encoding='utf-8')
+    return name
+
+
+def numbers(folder):
+    return [record['Št. računa'] for record in folder.model.get_all_records()]
+
+
+def test_files_are_taken_once_complete(inbox):
+    inbox.mkdir()
+    watcher = PollingWatcher(inbox)
+    drop(inbox, "narocilo.json", [])
+    drop(inbox, ".skrito.json", [])
+    (inbox / "narocilo.json.tmp").write_text('', encoding='utf-8')
+
+    assert watcher.scan() == []
+    assert watcher.scan() == ["narocilo.json"]
+    (inbox / "narocilo.json").write_text('[{}]', encoding='utf-8')
+    assert watcher.scan() == []
+
+
+def test_orders_are_booked_in_one_commit(folder, inbox, make_record):
+    names = [
+        drop(inbox, "prvo.json", [make_record(), make_record()]),
+        drop(inbox, "drugo.json", make_record('7')),
+        drop(inbox, "napacno.json", make_record(fields={'Znesek': 'x'})),
+        drop(inbox, "lansko.json", make_record(fields={
+            'Datum izdaje': '20.12.2025'})),
+        ]
+    orders = [folder.claim(name) for name in names]
+    assert folder.claim("prvo.json") is None
+
+    booked = folder.book(orders)
+
+    assert booked == orders[:2]
+    assert numbers(folder) == ['8', '9', '7']
+    assert sorted(path.name for path in (inbox / FAILED).iterdir()) == [
+        "lansko.json", "lansko.json.napaka.txt",
+        "napacno.json", "napacno.json.napaka.txt",
+        ]
+    assert '2026' in (inbox / FAILED / "lansko.json.napaka.txt").read_text(
+        encoding='utf-8')
+
+
+def test_claimed_orders_are_not_booked_twice(folder, inbox, make_record):
+    drop(inbox, "narocilo.json", [make_record(), make_record()])
+    [order] = folder.book([folder.claim("narocilo.json")])
+
+    # The process stopped before rendering: booked again on the next start
+    [recovered] = folder.recover()
+    assert recovered.path == order.path
+    assert folder.book([recovered]) == [recovered]
+    assert [r['Št. računa'] for r in recovered.records] == ['1', '2']
+    assert numbers(folder) == ['1', '2']
+
+
+def test_run(folder, inbox, make_record):
+    thread = threading.Thread(target=folder.run)
+    thread.start()
+    try:
+        drop(inbox, "narocilo.json", make_record())
+        deadline = time.monotonic() + 30
+        while not (inbox / PROCESSED / "narocilo.json").exists():
+            assert time.monotonic() < deadline, "the order was not processed"
+            time.sleep(0.05)
+    finally:
+        folder.stop()
+        thread.join()
+
+    assert folder.counters == {'obdelane': 1, 'napake': 0, 'racuni': 1}
+    assert (inbox.parent / "racun_st_JN26-001_.pdf").exists()
+    assert not list((inbox / CLAIMED).iterdir())
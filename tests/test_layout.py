@@ -0,0 +1,50 @@
+import pytest
+
+from benchmarks.bench_assets import SAMPLE
+from benchmarks.bench_layout import legacy_racun_string
+from racunovodja import settings as s
+from racunovodja.layout import ELLIPSIS, OPIS_WIDTH, WIDTH, get_layout
+from racunovodja.pdf import PDFModel
+
+SIFRA = 'JN26-001'
+DATES = ('01.02.2026', '01.03.2026')
+
+
+def render(record):
+    return get_layout(s.user).render(record, SIFRA, *DATES)
+
+
+def test_same_text_as_the_original(make_record):
+    # The original always dated an invoice today
+    for data in (SAMPLE, make_record('1')):
+        data = dict(data, **{'Datum izdaje': '', 'Datum zapadlosti': ''})
+        pdf = PDFModel(data['Št. računa'])
+
+        assert pdf.get_racun_string(data) == legacy_racun_string(pdf, data)
+
+
+def test_long_recipient_is_cut(make_record):
+    short = render(make_record('1')).splitlines()
+    lines = render(make_record('1', {'Naziv': "Podjetje " * 10})).splitlines()
+
+    assert len(lines) == len(short)
+    assert len(lines[1]) == WIDTH and lines[1].endswith(ELLIPSIS)
+    assert lines[1][:76] == short[1][:76]
+
+
+def test_long_description_wraps(make_record):
+    opis = "Svetovanje pri prenovi spletne strani in urejanje vsebin za trgovino"
+    short = render(make_record('1')).splitlines()
+    lines = render(make_record('1', {'Opis storitve': opis})).splitlines()
+
+    assert len(lines) == len(short) + 1
+    row = next(i for i, line in enumerate(lines) if line.startswith('| Sve'))
+    assert len(lines[row]) == len(lines[row + 1]) == len(short[row])
+    assert lines[row][2:2 + OPIS_WIDTH].rstrip() + ' ' + (
+        lines[row + 1][2:2 + OPIS_WIDTH].rstrip()) == opis
+    assert lines[row + 2] == short[row + 1]
+
+
+def test_amount_too_long(make_record):
+    with pytest.raises(ValueError):
+        render(make_record('1', {'Znesek': '1.000.000,00'}))
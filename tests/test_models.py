@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from racunovodja.items import ITEMS
+from racunovodja.models import CSVModel, InvoiceYearError
+
+LEDGER = "knjiga_racunov_2026.csv"
+
+
+def item(opis):
+    return {
+        'Opis': opis, 'Količina': '1', 'EM': 'kos', 'Cena': '100,00',
+        'Popust': '', 'DDV': '22',
+        }
+
+
+def interrupt(model, records, written=None):
+    """Leave the journal of a commit behind, with only the written bytes
+    of the append, or all of it without them
+    """
+    offset = model.file.stat().st_size
+    items_offset = model.items_file.stat().st_size
+    entry = {
+        'offset': offset, 'items_offset': items_offset, 'records': records,
+        }
+    model.journal.write_text(json.dumps(entry), encoding='utf-8')
+    if written is None:
+        model._append(offset, records, items_offset)
+    else:
+        with open(model.file, 'ab') as fh:
+            fh.write(written)
+
+
+def numbers(model):
+    return [record['Št. računa'] for record in model.get_all_records()]
+
+
+@pytest.fixture
+def model(workdir, make_record):
+    model = CSVModel(LEDGER)
+    model.save_record(make_record('1', {ITEMS: [item("Prva")]}))
+    return model
+
+
+def test_recover_replays_a_torn_append(model, make_record):
+    records = [
+        make_record('2', {ITEMS: [item("Druga")]}),
+        make_record('3'),
+        ]
+    interrupt(model, records, '2,Podjetje d.o.o.,Goz'.encode())
+
+    assert CSVModel(LEDGER).recover() == 0  # Replayed by the constructor
+    assert not model.journal.exists()
+    assert numbers(model) == ['1', '2', '3']
+
+    records = model.with_items(model.get_all_records())
+    assert [
+        [i['Opis'] for i in record.get(ITEMS, ())] for record in records
+        ] == [["Prva"], ["Druga"], []]
+
+
+def test_recover_does_not_write_rows_twice(model, make_record):
+    # The append finished, only the journal was left behind
+    interrupt(model, [make_record('2', {ITEMS: [item("Druga")]})])
+
+    assert model.recover() == 1
+    assert numbers(model) == ['1', '2']
+    assert model.items_file.read_text(encoding='utf-8').count("Druga") == 1
+
+
+def test_torn_journal_is_dropped(model):
+    model.journal.write_text('{"offset": 12', encoding='utf-8')
+
+    assert CSVModel(LEDGER).recover() == 0
+    assert not model.journal.exists()
+    assert numbers(model) == ['1']
+
+
+
+def test_ledger_of_a_year_refuses_other_years(workdir, make_record):
+    model = CSVModel(LEDGER, 2026)
+    records = [
+        make_record('1'), make_record('2', {'Datum izdaje': '31.12.2025'})]
+
+    with pytest.raises(InvoiceYearError) as error:
+        with model.transaction() as transaction:
+            for record in records:
+                transaction.add(record)
+    assert error.value.records == records[1:]
+    assert model.get_all_records() == []
+
+    # Without a year, e.g. for imports, any year is booked
+    CSVModel(LEDGER).save_record(records[1])
+    assert numbers(model) == ['2']
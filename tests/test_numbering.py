@@ -0,0 +1,97 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from racunovodja.batch import run_batch
+from racunovodja.models import CSVModel, DuplicateInvoiceError, SQLModel
+from racunovodja.numbering import (
+    InvoiceNumberAllocator, format_sifra, number_key)
+
+
+def allocate(directory):
+    allocator = InvoiceNumberAllocator("JANEZ NOVAK", 2026, directory=directory)
+    return allocator.allocate(5)
+
+
+def test_allocate_is_consecutive(workdir):
+    allocator = InvoiceNumberAllocator("JANEZ NOVAK", 2026)
+    assert allocator.allocate(3) == ['1', '2', '3']
+    assert allocator.next() == '4'
+    assert allocator.peek() == '5'
+    # A peek reserves nothing
+    assert allocator.next() == '5'
+
+
+def test_allocate_across_processes(workdir):
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(allocate, [str(workdir)] * 8))
+    numbers = [int(n) for result in results for n in result]
+    assert sorted(numbers) == list(range(1, 41))
+
+
+def test_seeded_from_the_ledger(workdir, make_record):
+    model = CSVModel("knjiga_racunov_2026.csv")
+    model.save_record(make_record('7'))
+    model.save_record(make_record('12', {'Datum izdaje': '01.02.2025'}))
+    allocator = InvoiceNumberAllocator("JANEZ NOVAK", 2026, model=model)
+    assert allocator.next() == '8'
+
+
+def test_observe_skips_hand_entered_numbers(workdir):
+    allocator = InvoiceNumberAllocator("JANEZ NOVAK", 2026)
+    allocator.observe('10')
+    allocator.observe('4')
+    assert allocator.next() == '11'
+
+
+def test_number_key_and_sifra():
+    assert number_key('005') == number_key(' 5') == '5'
+    assert number_key('A-5') == 'A-5'
+    assert format_sifra("JANEZ NOVAK", '5', '01.02.2026') == 'JN26-005'
+
+
+def test_csv_refuses_issued_numbers(workdir, make_record):
+    model = CSVModel("knjiga_racunov_2026.csv")
+    model.save_record(make_record('5'))
+
+    with pytest.raises(DuplicateInvoiceError):
+        model.save_record(make_record('005'))
+    with pytest.raises(DuplicateInvoiceError):
+        with model.transaction() as transaction:
+            transaction.add(make_record('6'))
+            transaction.add(make_record('6'))
+    assert [r['Št. računa'] for r in model.get_all_records()] == ['5']
+
+    # Rows appended by another process are seen as well
+    CSVModel("knjiga_racunov_2026.csv").save_record(make_record('8'))
+    assert model.duplicates([make_record('8'), make_record('')]) == [
+        make_record('8')]
+
+
+def test_sqlite_numbers_repeat_every_year(workdir, make_record):
+    model = SQLModel("knjiga_racunov.db")
+    model.save_record(make_record('5', {'Datum izdaje': '01.02.2025'}))
+    model.save_record(make_record('5'))
+
+    with pytest.raises(DuplicateInvoiceError):
+        model.save_record(make_record('005'))
+    assert len(model.get_all_records()) == 2
+    model.close()
+
+
+def test_batch_refuses_issued_numbers_before_rendering(workdir, make_record):
+    model = CSVModel("knjiga_racunov_2026.csv")
+    model.save_record(make_record('5'))
+    allocator = InvoiceNumberAllocator("JANEZ NOVAK", 2026, model=model)
+
+    with pytest.raises(DuplicateInvoiceError):
+        run_batch([make_record('5')], model=model, allocator=allocator)
+    with pytest.raises(DuplicateInvoiceError):
+        run_batch(
+            [make_record('9'), make_record('09')],
+            model=model, allocator=allocator)
+
+    assert len(model.get_all_records()) == 1
+    assert not list(workdir.glob('*.pdf'))
+    # Nothing was allocated for the refused batches
+    assert allocator.peek() == '6'
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from racunovodja.profiles import ProfileSession, get_profile
+
+
+def test_session_moves_on_to_the_new_year(workdir, today, make_record):
+    session = ProfileSession('janez', get_profile('janez'))
+    booked = []
+    session.model.subscribe(booked.append)
+
+    assert not session.renew()
+    assert (session.model.year, session.allocator.year) == (2026, 2026)
+    session.allocator.allocate(3)
+
+    today.date = datetime(2027, 1, 1)
+    assert session.renew()
+    assert session.model.file.name == "knjiga_racunov_2027.csv"
+    assert (session.model.year, session.allocator.year) == (2027, 2027)
+    assert session.allocator.next() == '1'
+
+    record = make_record('1', {'Datum izdaje': '01.01.2027'})
+    session.model.save_record(record)
+    assert booked == [record]
+    session.model.close()
@@ -0,0 +1,143 @@
+from datetime import datetime
+
+import pytest
+
+from racunovodja.models import CSVModel
+from racunovodja.reconcile import (
+    OPEN, OVERDUE, PAID, PARTIAL, PARTIAL_OVERDUE, Reconciliation,
+    normalize_reference, read_camt)
+
+CAMT = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02">
+<BkToCstmrStmt>
+{entries}
+</BkToCstmrStmt>
+</Document>
+"""
+
+NTRY = """<Ntry>
+  <Amt Ccy="EUR">{amount}</Amt>
+  <CdtDbtInd>{indicator}</CdtDbtInd>
+  <BookgDt><Dt>2026-02-10</Dt></BookgDt>
+  <NtryDtls><TxDtls>
+    <RltdPties><Dbtr><Nm>{payer}</Nm></Dbtr></RltdPties>
+    <RmtInf><Strd><CdtrRefInf><Ref>{reference}</Ref></CdtrRefInf></Strd></RmtInf>
+  </TxDtls></NtryDtls>
+</Ntry>"""
+
+
+def ntry(amount, reference='', payer="Podjetje d.o.o.", indicator='CRDT'):
+    return NTRY.format(
+        amount=amount, reference=reference, payer=payer, indicator=indicator)
+
+
+def statement(path, *rows):
+    lines = ["Datum;Znesek;Sklic;Plačnik"]
+    lines.extend(';'.join(row) for row in rows)
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return path
+
+
+@pytest.fixture
+def ledger(workdir, make_record):
+    model = CSVModel("knjiga_racunov_2026.csv")
+    with model.transaction() as transaction:
+        transaction.add(make_record('1'))
+        transaction.add(make_record('2', {'Znesek': '250,00'}))
+        transaction.add(make_record('3', {'Naziv': "Drugo podjetje d.o.o."}))
+    return workdir
+
+
+def test_normalize_reference():
+    assert normalize_reference('SI00 26-001') == '26-001'
+    assert normalize_reference('si0026-001') == '26-001'
+    assert normalize_reference('26-001') == '26-001'
+
+
+def test_match_by_reference_then_amount_and_payer(ledger):
+    path = statement(
+        ledger / "izpisek.csv",
+        ('10.02.2026', '100,00', 'SI00 26-003', "Nekdo"),
+        ('11.02.2026', '250,00', '', "PODJETJE D.O.O."),
+        ('12.02.2026', '99,00', '', "Podjetje d.o.o."),
+        )
+    reconciliation = Reconciliation(directory=ledger)
+
+    matched, unmatched = reconciliation.run([path])
+
+    assert matched == 2
+    assert [credit.cents for credit in unmatched] == [9900]
+    assert reconciliation.status('JN26-003') == (PAID, 10000, '10.02.2026')
+    assert reconciliation.status('JN26-002') == (PAID, 25000, '11.02.2026')
+    as_of = datetime(2026, 2, 1)
+    assert reconciliation.status('JN26-001', as_of) == (OPEN, 0, None)
+    assert reconciliation.status('JN26-001')[0] == OVERDUE
+
+
+def test_overlapping_statements_are_counted_once(ledger):
+    first = statement(
+        ledger / "januar.csv",
+        ('10.02.2026', '40,00', '26-001', "Podjetje d.o.o."),
+        )
+    overlapping = statement(
+        ledger / "februar.csv",
+        ('10.02.2026', '40,00', '26-001', "Podjetje d.o.o."),
+        ('15.02.2026', '40,00', '26-001', "Podjetje d.o.o."),
+        )
+
+    assert Reconciliation(directory=ledger).run([first]) == (1, [])
+    # Read again from the saved state
+    reconciliation = Reconciliation(directory=ledger)
+    assert reconciliation.run([first, overlapping]) == (1, [])
+    assert reconciliation.status('JN26-001', datetime(2026, 2, 1)) == (
+        PARTIAL, 8000, None)
+    # The paid part still shows once the invoice is overdue
+    assert reconciliation.status('JN26-001', datetime(2026, 3, 2)) == (
+        PARTIAL_OVERDUE, 8000, None)
+
+
+def test_identical_payments_in_a_statement_are_kept(ledger):
+    path = statement(
+        ledger / "izpisek.csv",
+        ('10.02.2026', '50,00', '26-001', "Podjetje d.o.o."),
+        ('10.02.2026', '50,00', '26-001', "Podjetje d.o.o."),
+        )
+    reconciliation = Reconciliation(directory=ledger)
+
+    assert reconciliation.run([path]) == (2, [])
+    assert reconciliation.status('JN26-001')[:2] == (PAID, 10000)
+
+
+def test_camt_credits(ledger):
+    path = ledger / "izpisek.xml"
+    path.write_text(CAMT.format(entries='\n'.join([
+        ntry('100.00', 'SI00 26-001'),
+        ntry('250.00', indicator='DBIT'),
+        ntry('250.00'),
+        ])), encoding='utf-8')
+
+    credits = list(read_camt(path))
+    assert [(c.date, c.cents, c.reference) for c in credits] == [
+        ('10.02.2026', 10000, '26-001'), ('10.02.2026', 25000, '')]
+
+    reconciliation = Reconciliation(directory=ledger)
+    assert reconciliation.run([path]) == (2, [])
+    assert reconciliation.status('JN26-002')[0] == PAID
+
+
+def test_camt_entry_outside_a_statement(workdir):
+    path = workdir / "izpisek.xml"
+    path.write_text(ntry('12.50', '26-004'), encoding='utf-8')
+
+    [credit] = read_camt(path)
+    assert (credit.cents, credit.reference) == (1250, '26-004')
+
+
+def test_duplicate_numbers_are_reported(ledger):
+    path = ledger / "knjiga_racunov_2026.csv"
+    with open(path, 'a', encoding='utf-8') as fh:
+        fh.write(path.read_text(encoding='utf-8').splitlines()[1] + '\n')
+
+    reconciliation = Reconciliation(directory=ledger)
+    assert [sifra for sifra, _ in reconciliation.duplicates] == ['JN26-001']
+    assert len(reconciliation.invoices) == 3
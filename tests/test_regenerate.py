@@ -0,0 +1,18 @@
+from racunovodja.profiles import get_profile, open_ledger
+from racunovodja.regenerate import Regeneration, main
+
+
+def test_regenerate_from_sqlite(assets, make_record, monkeypatch, capsys):
+    monkeypatch.setattr('racunovodja.settings.storage', 'sqlite')
+    for year in (2025, 2026):
+        model = open_ledger(get_profile(), year)
+        model.save_record(make_record('1', {'Datum izdaje': f"01.02.{year}"}))
+        model.close()
+
+    assert Regeneration(2026).run(workers=1) == (1, 0, [])
+    assert [path.name for path in assets.glob('*.pdf')] == [
+        "racun_st_JN26-001_.pdf"]
+    # Up to date since, and a year without invoices is not a success
+    assert Regeneration(2026).run(workers=1) == (0, 1, [])
+    assert main(['2024', '--workers', '1']) == 1
+    assert "2024" in capsys.readouterr().out
@@ -0,0 +1,69 @@
+import pytest
+
+from racunovodja.models import CSVModel
+from racunovodja.search import CHECKPOINT, SearchIndex
+
+
+def opisi(results):
+    return [record['Opis storitve'] for record, _ in results]
+
+
+@pytest.fixture
+def ledgers(workdir, make_record):
+    old = CSVModel("knjiga_racunov_2025.csv")
+    old.save_record(make_record('1', {
+        'Opis storitve': "Službena pot v Ljubljano",
+        'Datum izdaje': '10.12.2025'}))
+    model = CSVModel("knjiga_racunov_2026.csv")
+    with model.transaction() as transaction:
+        transaction.add(make_record('1', {'Opis storitve': "Svetovanje"}))
+        transaction.add(make_record('2', {
+            'Opis storitve': "Službena pot", 'Opomba': "januar"}))
+    return model
+
+
+def test_search_by_prefixes(ledgers):
+    index = SearchIndex()
+    assert index.update() == 3
+
+    assert opisi(index.search("sluzb")) == [
+        "Službena pot", "Službena pot v Ljubljano"]
+    assert opisi(index.search("SLUŽB jan")) == ["Službena pot"]
+    assert opisi(index.search("sluzb", limit=1)) == ["Službena pot"]
+    assert index.search("prevod") == index.search("  ") == []
+    [(record, path)] = index.search("svet")
+    assert path.name == "racun_st_JN26-001_.pdf"
+
+
+def test_appended_rows_are_logged(ledgers, make_record):
+    SearchIndex().update()
+    checkpoint = (ledgers.file.parent / CHECKPOINT).read_bytes()
+
+    index = SearchIndex()
+    ledgers.save_record(make_record('3', {'Opis storitve': "Prevod"}))
+    assert index.update() == 1
+    assert index.update() == 0
+    assert (ledgers.file.parent / CHECKPOINT).read_bytes() == checkpoint
+
+    # Read back from the checkpoint and its log
+    reopened = SearchIndex()
+    assert len(reopened) == 4
+    assert opisi(reopened.search("prev")) == ["Prevod"]
+
+
+def test_rewritten_ledger_is_indexed_again(ledgers, make_record):
+    index = SearchIndex()
+    index.update()
+
+    ledgers.update_record('1', make_record('1', {'Opis storitve': "Prevod"}))
+    index.update()
+
+    assert len(index) == 3
+    assert opisi(index.search("prev")) == ["Prevod"]
+    assert index.search("svet") == []
+
+
+def test_sqlite_ledger_is_refused(workdir, monkeypatch):
+    monkeypatch.setattr('racunovodja.settings.storage', 'sqlite')
+    with pytest.raises(ValueError):
+        SearchIndex().update()
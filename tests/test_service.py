@@ -0,0 +1,140 @@
+import asyncio
+import json
+from datetime import datetime
+from http import HTTPStatus
+
+import pytest
+
+from racunovodja.service import MAX_BODY, HTTPError, InvoiceService
+
+
+@pytest.fixture
+def service(workdir, today):
+    service = InvoiceService(workers=1)
+    yield service
+    service.session.model.close()
+
+
+def read(service, data):
+    async def read_request():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await service._read_request(reader)
+
+    return asyncio.run(read_request())
+
+
+def status_of(service, data):
+    with pytest.raises(HTTPError) as error:
+        read(service, data)
+    return error.value.status
+
+
+def test_request_with_body(service):
+    method, path, headers, body = read(
+        service,
+        b'POST /racuni HTTP/1.1\r\nHost: x\r\nContent-Length: 2\r\n\r\n{}')
+
+    assert (method, path, body) == ('POST', '/racuni', b'{}')
+    assert headers['host'] == 'x'
+
+
+def test_request_without_body(service):
+    assert read(service, b'GET /metrics HTTP/1.1\r\n\r\n') == (
+        'GET', '/metrics', {}, b'')
+    assert read(service, b'') is None
+
+
+@pytest.mark.parametrize('length', [b'abc', b'-5', b'1.5', b'0x10'])
+def test_invalid_content_length(service, length):
+    data = b'POST /racuni HTTP/1.1\r\nContent-Length: ' + length + b'\r\n\r\n'
+    assert status_of(service, data) == HTTPStatus.BAD_REQUEST
+
+
+def test_body_too_large(service):
+    for length in (MAX_BODY + 1, 10 ** 30):
+        data = f'POST /racuni HTTP/1.1\r\nContent-Length: {length}\r\n\r\n'
+        assert status_of(service, data.encode()) == (
+            HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+
+def test_malformed_requests(service):
+    assert status_of(service, b'GET\r\n\r\n') == HTTPStatus.BAD_REQUEST
+    assert status_of(service, b'GET / HTTP/1.1\r\n') == HTTPStatus.BAD_REQUEST
+    # A body cut short drops the connection, there is no one to answer
+    data = b'POST /racuni HTTP/1.1\r\nContent-Length: 10\r\n\r\n{}'
+    with pytest.raises(asyncio.IncompleteReadError):
+        read(service, data)
+
+
+def test_invalid_invoices(service, make_record):
+    def post(body):
+        return asyncio.run(service._dispatch('POST', '/racuni', body))
+
+    with pytest.raises(HTTPError) as error:
+        post(b'[1, 2]')
+    assert error.value.status == HTTPStatus.BAD_REQUEST
+
+    record = make_record(fields={'Davčna številka': 'SI123'})
+    status, payload, _ = post(json.dumps(record).encode())
+    assert status == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert 'Davčna številka' in payload['napake']
+    assert service.counters['neveljavni'] == 2
+
+
+def test_invoices_of_another_year(service, make_record):
+    record = make_record(fields={'Datum izdaje': '20.12.2025'})
+    status, payload, _ = asyncio.run(
+        service._dispatch('POST', '/racuni', json.dumps(record).encode()))
+
+    assert status == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert '2026' in payload['napake']['Datum izdaje']
+
+
+def test_ledger_follows_the_year(service, today, make_record):
+    record = make_record(fields={'Datum izdaje': '05.01.2027'})
+    assert service._commit([record])[0][0] is record
+    assert not service.session.model.get_all_records()
+
+    today.date = datetime(2027, 1, 2)
+    assert service._commit([record]) == []
+    assert record['Št. računa'] == '1'
+    assert service.session.model.file.name == "knjiga_racunov_2027.csv"
+
+
+async def post(port, record):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(record).encode()
+    writer.write(
+        b'POST /racuni HTTP/1.1\r\nConnection: close\r\n'
+        b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+    response = await reader.read()
+    writer.close()
+    head, body = response.split(b'\r\n\r\n', 1)
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_invoices_booked_in_sqlite(assets, today, make_record, monkeypatch):
+    monkeypatch.setattr('racunovodja.settings.storage', 'sqlite')
+
+    async def issue():
+        service = InvoiceService(workers=1)
+        _, port = await service.start(port=0)
+        try:
+            return [
+                await post(port, make_record()),
+                await post(port, make_record('1')),
+                ], service.session.model.get_all_records()
+        finally:
+            await service.stop()
+
+    (created, refused), records = asyncio.run(issue())
+
+    assert created == (HTTPStatus.CREATED, {
+        'sifra_racuna': 'JN26-001',
+        'racun': '/racuni/racun_st_JN26-001_.pdf',
+        })
+    assert refused[0] == HTTPStatus.CONFLICT
+    assert [record['Št. računa'] for record in records] == ['1']
+    assert (assets / "racun_st_JN26-001_.pdf").exists()
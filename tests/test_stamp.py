@@ -0,0 +1,61 @@
+import pytest
+
+from racunovodja import settings as s
+from racunovodja.items import ITEMS
+from racunovodja.layout import get_layout
+from racunovodja.pdf import PDFModel
+
+DATES = ('01.02.2026', '01.03.2026')
+
+
+@pytest.fixture
+def skeleton(assets):
+    PDFModel.forget(s.user)
+    yield PDFModel.skeleton()
+    PDFModel.forget(s.user)
+
+
+def contents(pdf):
+    return [bytes(page.contents) for page in pdf.pages.values()]
+
+
+def test_slots_are_where_the_full_text_has_them(make_record):
+    layout = get_layout(s.user)
+    record = make_record('1', {'Matična številka': '1234567000'})
+    values = layout.values(record, 'JN26-001', *DATES)
+    lines = layout.render(record, 'JN26-001', *DATES).splitlines()
+
+    for name, line, column in layout.positions:
+        text = values[name].rstrip()
+        if name != 'opis_dalje':
+            assert lines[line][column:column + len(text)] == text, name
+
+
+def test_stamp_leaves_the_skeleton_alone(skeleton, make_record):
+    before = contents(skeleton)
+
+    first = PDFModel.stamp('1', make_record('1'))
+    second = PDFModel.stamp('2', make_record('2', {'Znesek': '7,00'}))
+
+    assert contents(skeleton) == before
+    assert PDFModel.skeleton() is skeleton
+    assert first.get_filename() == "racun_st_JN26-001_.pdf"
+    assert contents(first) != contents(second)
+    for pdf in (first, second):
+        assert len(pdf.pages) == 1
+        assert bytes(pdf.output()).startswith(b'%PDF')
+
+
+@pytest.mark.parametrize('fields', [
+    {'Opis storitve': "Svetovanje " * 6},
+    {ITEMS: [{'Opis': "Prevod", 'Cena': '12,50', 'Količina': '2'}]},
+    ])
+def test_stamp_renders_in_full(assets, make_record, monkeypatch, fields):
+    # Records that change the line count never touch the skeleton
+    def skeleton(cls, profile=None):
+        raise AssertionError("stamped on the skeleton")
+
+    monkeypatch.setattr(PDFModel, 'skeleton', classmethod(skeleton))
+    pdf = PDFModel.stamp('1', make_record('1', fields))
+
+    assert bytes(pdf.output()).startswith(b'%PDF')
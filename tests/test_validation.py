@@ -0,0 +1,59 @@
+import pytest
+
+from racunovodja.items import ITEMS, Totals, iter_items, summarize
+from racunovodja.layout import get_layout
+from racunovodja.profiles import get_profile
+from racunovodja.validation import (
+    check_amount, check_tax_number, get_validator)
+
+
+@pytest.mark.parametrize('value', [
+    'SI12345678', '12345678', 'SI 1234 5678',
+    'DE123456789', 'ATU12345678', 'NL123456789B01',
+    ])
+def test_tax_number_accepted(value):
+    assert check_tax_number(value) is None
+
+
+@pytest.mark.parametrize('value', [
+    'SI123', 'SIXX', 'SI1234567', 'SI123456789', 'SIABCDEFGH',
+    'AB12', 'DEABCDEFGH', '1234567', 'si12345678', '',
+    ])
+def test_tax_number_rejected(value):
+    assert check_tax_number(value) is not None
+
+
+@pytest.mark.parametrize('value, valid', [
+    ('123,45', True), ('1.234,5', True), ('999999,99', True),
+    ('1.000.000', True), ('1000000,00', False), ('123.456,78', False),
+    ('12,345', False), ('-5,00', False),
+    ])
+def test_amount(value, valid):
+    assert (check_amount(value) is None) == valid
+
+
+def test_valid_amounts_fit_the_layout(make_record):
+    layout = get_layout(get_profile())
+    record = make_record('1', {'Znesek': '999999,99'})
+
+    assert get_validator().validate(record) == {}
+    assert '999999,99€' in layout.render(
+        record, 'JN26-001', '01.02.2026', '01.03.2026')
+
+
+def test_line_items_must_fit_the_layout(make_record):
+    layout = get_layout(get_profile())
+    item = {'Opis': "Most", 'Količina': '1', 'Cena': '999999,99'}
+    record = summarize(make_record('1', {ITEMS: [item]}))
+
+    assert get_validator().validate(record) == {}
+    result = Totals()
+    for lines in layout.item_rows(iter_items(record), result):
+        assert '999999,99€' in lines[0]
+    assert layout.tail(result)
+
+    item['Cena'] = '1000000'
+    assert ITEMS in get_validator().validate(summarize(record))
+    item.update({'Cena': '99999', 'Količina': '10000000000', 'Popust': '100'})
+    assert get_validator().validate(summarize(record)) == {
+        ITEMS: "Skupni znesek postavk je predolg za račun"}